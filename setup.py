@@ -66,6 +66,9 @@ setup(
         'build': [
             'pyinstaller>=5.0.0',
         ],
+        'zstd': [
+            'zstandard>=0.21.0',
+        ],
     },
     entry_points={
         'console_scripts': [
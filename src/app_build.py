@@ -3,23 +3,35 @@ PyInstaller Build Script for ACG-FolderClean
 
 Automates version management and executable building using PyInstaller.
 
+Builds are incremental: a content hash over the sources, version inputs and
+spec template is stamped into each variant's work directory, and a variant
+whose inputs are unchanged (and whose executable still exists) is skipped
+without bumping the build number. Changed variants reuse their cached
+PyInstaller work directory and are built in parallel processes.
+
 Usage:
-    build.py [--major | --minor | --patch]
+    build.py [--major | --minor | --patch] [--variant=<name>...] [--jobs=<count>] [--force]
     build.py (-h | --help)
 
 Options:
-    --major     Bump major version (resets minor and patch)
-    --minor     Bump minor version (resets patch)
-    --patch     Bump patch version
-    -h --help   Show this help message
+    --major             Bump major version (resets minor and patch)
+    --minor             Bump minor version (resets patch)
+    --patch             Bump patch version
+    --variant=<name>    Variant to build: release, debug (repeatable) [default: release]
+    --jobs=<count>      Variants to build at once, 0 for one per variant [default: 0]
+    --force             Rebuild from scratch even if inputs are unchanged
+    -h --help           Show this help message
 
 Copyright © 2025 Application Consulting Group, Inc.
 Licensed under the MIT License - see LICENSE file for details.
 """
 
+import hashlib
+import json
 import os
 import subprocess
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from docopt import docopt
 
 APP_NAME = 'ACG-FolderClean'
@@ -28,8 +40,16 @@ BUILD_FILE = 'app_build_number.txt'
 VERSION_FILE = 'app_version.txt'
 YEAR_FILE = 'app_year.txt'
 SPEC_FILE = 'ACG-FolderClean.spec'
+STAMP_FILE = 'build_inputs.json'
+SOURCE_FILES = [SCRIPT_NAME]
 VERSION_BASE = [1, 0, 0]
 
+# Target variants: executable name suffix and the EXE() settings that differ
+VARIANTS = {
+    'release': {'suffix': '', 'debug': False, 'upx': True},
+    'debug': {'suffix': '-debug', 'debug': True, 'upx': False},
+}
+
 ROOT_DIR = os.path.abspath(os.path.dirname(__file__))
 ICON_PATH = os.path.abspath(os.path.join(ROOT_DIR, '.', 'imgs', 'ACG.ico')).replace('\\', '/')
 DIST_PATH = os.path.abspath(os.path.join(ROOT_DIR, '..', 'dist')).replace('\\', '/')
@@ -68,8 +88,7 @@ def bump_version(args):
         patch += 1
     return major, minor, patch
 
-def write_version_file(major, minor, patch, build, year):
-    content = f"""# UTF-8
+VERSION_TEMPLATE = """# UTF-8
 #
 VSVersionInfo(
   ffi=FixedFileInfo(
@@ -102,23 +121,19 @@ VSVersionInfo(
   ]
 )
 """
+
+def write_version_file(major, minor, patch, build, year):
+    content = VERSION_TEMPLATE.format(major=major, minor=minor, patch=patch, build=build, year=year,
+                                      APP_NAME=APP_NAME, SCRIPT_NAME=SCRIPT_NAME)
     path = os.path.join(ROOT_DIR, VERSION_FILE)
     with open(path, 'w', encoding='utf-8') as f:
         f.write(content)
 
-def write_spec_file():
-    version_path = os.path.abspath(os.path.join(ROOT_DIR, VERSION_FILE)).replace('\\', '/')
-    year_path = os.path.abspath(os.path.join(ROOT_DIR, YEAR_FILE)).replace('\\', '/')
-
-    for path in [version_path, year_path, ICON_PATH]:
-        if not os.path.isfile(path):
-            raise FileNotFoundError(f"Required file missing: {path}")
-
-    spec_content = f"""# -*- mode: python ; coding: utf-8 -*-
+SPEC_TEMPLATE = """# -*- mode: python ; coding: utf-8 -*-
 block_cipher = None
 
 a = Analysis(
-    ['{SCRIPT_NAME}'],
+    ['{script}'],
     pathex=[],
     binaries=[],
     datas=[
@@ -142,48 +157,161 @@ exe = EXE(
     a.binaries,
     a.zipfiles,
     a.datas,
-    name='{APP_NAME}',
-    debug=False,
+    name='{name}',
+    debug={debug},
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx={upx},
     console=True,
-    icon=r'{ICON_PATH}',
+    icon=r'{icon_path}',
     version='{version_path}'
 )
 """
-    path = os.path.join(ROOT_DIR, SPEC_FILE)
-    with open(path, 'w', encoding='utf-8') as f:
+
+def spec_path(variant):
+    suffix = VARIANTS[variant]['suffix']
+    return os.path.join(ROOT_DIR, SPEC_FILE.replace('.spec', f'{suffix}.spec'))
+
+def work_path(variant):
+    return f"{WORK_PATH}/{variant}"
+
+def executable_path(variant):
+    name = APP_NAME + VARIANTS[variant]['suffix']
+    return os.path.join(DIST_PATH, name + ('.exe' if os.name == 'nt' else ''))
+
+def write_spec_file(variant='release'):
+    version_path = os.path.abspath(os.path.join(ROOT_DIR, VERSION_FILE)).replace('\\', '/')
+    year_path = os.path.abspath(os.path.join(ROOT_DIR, YEAR_FILE)).replace('\\', '/')
+
+    for path in [version_path, year_path, ICON_PATH]:
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Required file missing: {path}")
+
+    settings = VARIANTS[variant]
+    spec_content = SPEC_TEMPLATE.format(
+        script=SCRIPT_NAME,
+        version_path=version_path,
+        year_path=year_path,
+        name=APP_NAME + settings['suffix'],
+        debug=settings['debug'],
+        upx=settings['upx'],
+        icon_path=ICON_PATH,
+    )
+    with open(spec_path(variant), 'w', encoding='utf-8') as f:
         f.write(spec_content)
 
-def build_executable():
-    spec_path = os.path.join(ROOT_DIR, SPEC_FILE)
-    if not os.path.isfile(spec_path):
-        raise FileNotFoundError(f"Spec file not found: {spec_path}")
+def input_hash(variant, major, minor, patch, year):
+    """
+    Hash everything a variant's executable is built from except the build number.
+
+    Covers the source files, the icon, the version and copyright year, the
+    version file layout, the spec template and the variant's settings, so the
+    hash only changes when a rebuild would produce a different program.
+    """
+    digest = hashlib.sha256()
+    for name in SOURCE_FILES + [ICON_PATH]:
+        digest.update(name.encode('utf-8') + b'\0')
+        with open(os.path.join(ROOT_DIR, name), 'rb') as f:
+            digest.update(f.read())
+    inputs = {
+        'version': [major, minor, patch],
+        'year': year,
+        'version_template': VERSION_TEMPLATE,
+        'spec_template': SPEC_TEMPLATE,
+        'variant': VARIANTS[variant],
+    }
+    digest.update(json.dumps(inputs, sort_keys=True, default=repr).encode('utf-8'))
+    return digest.hexdigest()
+
+def read_stamp(variant):
+    path = os.path.join(work_path(variant), STAMP_FILE)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    return {}
+
+def write_stamp(variant, digest, version_string):
+    os.makedirs(work_path(variant), exist_ok=True)
+    path = os.path.join(work_path(variant), STAMP_FILE)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'inputs': digest, 'version': version_string}, f, indent=2)
+
+def is_up_to_date(variant, digest):
+    stamp = read_stamp(variant)
+    return stamp.get('inputs') == digest and os.path.isfile(executable_path(variant))
+
+def build_executable(variant='release', clean=False):
+    path = spec_path(variant)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Spec file not found: {path}")
 
-    subprocess.run([
+    command = [
         'pyinstaller',
-        spec_path,
+        path,
         '--distpath', DIST_PATH,
-        '--workpath', WORK_PATH,
-        '--clean',
+        '--workpath', work_path(variant),
         '--noconfirm'
-    ], check=True)
+    ]
+    if clean:
+        command.append('--clean')
+    subprocess.run(command, check=True)
+    return variant
+
+def build_variants(variants, jobs, clean):
+    """Run PyInstaller for each variant in its own process; returns {variant: error or None}."""
+    outcomes = {}
+    with ProcessPoolExecutor(max_workers=jobs or len(variants)) as pool:
+        futures = {variant: pool.submit(build_executable, variant, clean) for variant in variants}
+        for variant, future in futures.items():
+            try:
+                future.result()
+                outcomes[variant] = None
+            except (subprocess.CalledProcessError, FileNotFoundError) as e:
+                outcomes[variant] = e
+    return outcomes
 
 def main():
     """Main build process."""
     args = docopt(__doc__)
 
+    variants = list(dict.fromkeys(args['--variant']))
+    unknown = [variant for variant in variants if variant not in VARIANTS]
+    if unknown:
+        print(f"✗ Error: unknown variant: {', '.join(unknown)} (choose from {', '.join(VARIANTS)})")
+        return 1
+    jobs = int(args['--jobs'])
+    force = args['--force']
+
     print(f"Building {APP_NAME}...")
     print("-" * 50)
 
     year = read_year()
-    build = read_build()
     major, minor, patch = bump_version(args)
 
+    try:
+        digests = {variant: input_hash(variant, major, minor, patch, year) for variant in variants}
+    except FileNotFoundError as e:
+        print(f"✗ Error: {e}")
+        return 1
+    stale = [variant for variant in variants if force or not is_up_to_date(variant, digests[variant])]
+    for variant in variants:
+        if variant not in stale:
+            version = read_stamp(variant).get('version', '?')
+            print(f"✓ {variant}: inputs unchanged, keeping build {version}")
+    if not stale:
+        print("-" * 50)
+        print("✓ Nothing to build")
+        print(f"Executable location: {DIST_PATH}")
+        return 0
+
+    build = read_build()
     version_string = f"{major}.{minor}.{patch}.{build}"
     print(f"Version: {version_string}")
     print(f"Copyright Year: {year}")
+    print(f"Variants: {', '.join(stale)}")
 
     write_build(build)
     print("✓ Build number updated")
@@ -191,7 +319,12 @@ def main():
     write_version_file(major, minor, patch, build, year)
     print("✓ Version file created")
 
-    write_spec_file()
+    try:
+        for variant in stale:
+            write_spec_file(variant)
+    except FileNotFoundError as e:
+        print(f"✗ Error: {e}")
+        return 1
     print("✓ Spec file created")
 
     print("-" * 50)
@@ -199,17 +332,19 @@ def main():
     print("Building executable with PyInstaller...")
     print("-" * 50)
 
-    try:
-        build_executable()
-        print("-" * 50)
-        print(f"✓ Build completed successfully!")
-        print(f"Executable location: {DIST_PATH}")
-    except subprocess.CalledProcessError as e:
-        print(f"✗ Build failed: {e}")
-        return 1
-    except FileNotFoundError as e:
-        print(f"✗ Error: {e}")
+    outcomes = build_variants(stale, jobs, clean=force)
+    print("-" * 50)
+    failed = False
+    for variant, error in outcomes.items():
+        if error is None:
+            write_stamp(variant, digests[variant], version_string)
+            print(f"✓ {variant}: build completed successfully!")
+        else:
+            failed = True
+            print(f"✗ {variant}: build failed: {error}")
+    if failed:
         return 1
+    print(f"Executable location: {DIST_PATH}")
 
     return 0
 
@@ -5,35 +5,108 @@ A tool that removes files filtered by a regular expression and time since creati
 **: All files recursively deleted; directories and subdirectories.
 
 Usage:
+    ACG-FolderClean journal <journal> [--since=<date>] [--until=<date>] [--prefix=<path>]
+    ACG-FolderClean serve (--socket=<path> | --port=<port> --token-file=<path>) [--server-workers=<count>]
     ACG-FolderClean <expression> <age> [options]
     ACG-FolderClean (-h | --version)
 
 Positional Arguments:
     <expression>               Directory to search for files.
     <age>                      Age in number of days.
+    <journal>                  Deletion journal written with --journal.
 
 Options:
     -e                          Exclude files created on the last day of a month from deletion.
+    --max-runtime=<seconds>     Stop scanning and deleting once the run has used this many seconds.
+    --max-deletes=<count>       Stop deleting once this many files have been removed.
+    --order=<mode>              Deletion order: scan, oldest, largest or inode [default: scan].
+    --queue-size=<count>        Entries held in the priority queue used by --order [default: 10000].
+    --follow-symlinks           Descend into symlinked directories (skipped by default).
+    --archive=<dir>             Archive expired files into volumes in this directory before removing them.
+    --archive-format=<fmt>      Archive compression: gz or zst (needs zstandard) [default: gz].
+    --volume-size=<mb>          Start a new archive volume after this many MB of input [default: 1024].
+    --archive-workers=<count>   Archive shards written in parallel [default: 1].
+    --retries=<count>           Retries for transient errors such as locked files; 0 disables [default: 5].
+    --retry-delay=<seconds>     Delay before the first retry, doubled on each attempt [default: 0.5].
+    --source=<listing>          Read candidates from a metadata listing file instead of walking the share.
+    --source-format=<fmt>       Listing format: auto, nul or csv; gzip is detected [default: auto].
+    --collapse-dirs             Remove subdirectories whose files are all expired as a single unit.
+    --journal=<file>            Append every deletion to this binary deletion journal.
+    --coordinate=<mode>         Share the root with other hosts: lease (one runner) or shard (split work).
+    --host-id=<id>              Name of this host for --coordinate (defaults to the hostname).
+    --lease-ttl=<seconds>       Seconds a lease or membership stays valid without a heartbeat [default: 60].
+    --settle=<seconds>          Seconds --coordinate=shard waits for other hosts to register [default: 5].
+    --workers=<count>           Parallel scan and delete workers, or auto to tune them per root [default: 1].
+    --max-workers=<count>       Upper limit for --workers=auto [default: 64].
+    --fresh-cache=<file>        Remember directories with only fresh files and skip them while unchanged.
+    --cache-size=<count>        Directories kept in --fresh-cache, least recently used dropped [default: 100000].
+    --pipeline=<items>          Scan, filter and delete on separate threads with queues of this many entries.
+    --path-dates                Date files by dates in their path (2024-03-31, 2024/03/31) instead of mtime.
+    --date-pattern=<regex>      Pattern for --path-dates with (?P<year>), (?P<month>), (?P<day>) groups.
+    --progress=<seconds>        Print progress (counts, bytes, rate, ETA) to the console at this interval.
+    --status-file=<file>        Keep a JSON progress report in this file, updated every --progress seconds.
+    --estimate                  Estimate files and bytes that would be deleted by sampling; delete nothing.
+    --probes=<count>            Random root-to-leaf probes used by --estimate [default: 200].
+    --report=<file>             Write an age, size and top-directory capacity report (.json or .csv).
+    --report-only               Scan and write --report without deleting anything.
+    --report-top=<count>        Top-level directories ranked by size in --report [default: 20].
+    --since=<date>              journal: only deletions at or after this ISO date/time.
+    --until=<date>              journal: only deletions before this ISO date/time.
+    --prefix=<path>             journal: only deletions whose path starts with this prefix.
+    --socket=<path>             serve: accept jobs on this Unix socket.
+    --port=<port>               serve: accept jobs on this localhost HTTP port.
+    --server-workers=<count>    serve: jobs run at the same time [default: 4].
+    --token-file=<path>         serve: secret HTTP clients send as a Bearer token; created if missing.
     -h                          Display this screen.
     --version                   Show version information.
 
 Licensed under the MIT License - see LICENSE file for details.
 """
 
+import bisect
 import calendar
+import csv
+import errno
+import gzip
+import hashlib
+import heapq
+import hmac
+import io
+import json
 import logging
+import mmap
 import os
+import queue
+import random
 import re
+import secrets
+import socket
+import socketserver
+import stat
+import struct
 import sys
+import tarfile
+import threading
 import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, fields
 from datetime import datetime, timedelta
 from glob import glob
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from logging.handlers import TimedRotatingFileHandler
 from pathlib import Path
-from typing import Tuple
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
 
 from docopt import docopt
 
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency for --archive-format=zst
+    zstandard = None
+
 APP_NAME = 'ACG-FolderClean'
 VERSION = '1.0.0'
 APP_VERSION = '1.0.0'
@@ -42,6 +115,33 @@ APP_COPYRIGHT = f'Copyright © {APP_YEAR} Application Consulting Group, Inc.'
 APP_HELP = f'{APP_NAME}\nVersion: {APP_VERSION}\n{APP_COPYRIGHT}'
 LOG_FILE = APP_NAME + '.log'
 APP_PATH = ''
+ORDER_MODES = ('scan', 'oldest', 'largest', 'inode')
+DEFAULT_QUEUE_SIZE = 10000
+ARCHIVE_FORMATS = ('gz', 'zst')
+LISTING_FORMATS = ('auto', 'nul', 'csv')
+COORDINATION_MODES = ('lease', 'shard')
+DEFAULT_SHARD_SETTLE = 5.0
+DEFAULT_ADAPTIVE_WORKERS = 4
+DEFAULT_CACHE_SIZE = 100000
+DEFAULT_PIPELINE_DEPTH = 1000
+DEFAULT_PROGRESS_INTERVAL = 5.0
+DEFAULT_ESTIMATE_PROBES = 200
+# File age buckets as (label, upper bound in days)
+AGE_BUCKETS = (('<1d', 1), ('1-7d', 7), ('7-30d', 30), ('30-90d', 90), ('90-365d', 365), ('>1y', None))
+# File size buckets as (label, upper bound in bytes)
+SIZE_BUCKETS = (('<4KB', 4 << 10), ('4KB-64KB', 64 << 10), ('64KB-1MB', 1 << 20), ('1MB-16MB', 16 << 20),
+                ('16MB-256MB', 256 << 20), ('256MB-1GB', 1 << 30), ('>=1GB', None))
+DEFAULT_DATE_PATTERNS = (
+    # 2024-03-31, 2024_03_31 or 20240331 inside a name
+    r'(?<!\d)(?P<year>(?:19|20)\d\d)[-_.]?(?P<month>0[1-9]|1[0-2])[-_.]?(?P<day>0[1-9]|[12]\d|3[01])(?!\d)',
+    # 2024/03/31 or 2024/03 partition directories
+    r'(?:^|/)(?P<year>(?:19|20)\d\d)/(?P<month>0[1-9]|1[0-2])(?:/(?P<day>0[1-9]|[12]\d|3[01]))?(?=/|$)',
+)
+TUNING_FILE = APP_NAME + '-tuning.json'
+TRANSIENT_ERRNOS = frozenset(getattr(errno, name) for name in (
+    'EBUSY', 'EAGAIN', 'EINTR', 'ETXTBSY', 'ETIMEDOUT', 'ENOLCK', 'EDEADLK') if hasattr(errno, name))
+# ERROR_SHARING_VIOLATION and ERROR_LOCK_VIOLATION: the file is open or locked by another process
+TRANSIENT_WINERRORS = frozenset((32, 33))
 
 
 def resolve_paths() -> Tuple[str, str, str]:
@@ -175,9 +275,60 @@ def configure_logging() -> None:
     logging.getLogger().addHandler(logging.StreamHandler(sys.stdout))
 
 
-def is_last_day_of_month(file_path):
-    # Get the last modified time of the file
-    mtime = os.path.getmtime(file_path)
+class FileEntry(NamedTuple):
+    """A scanned file and the metadata the cleaner needs from it."""
+    path: str
+    mtime: float
+    size: int = 0
+    dev: int = 0
+    ino: int = 0
+    nlink: int = 1
+    is_link: bool = False
+
+    @classmethod
+    def from_stat(cls, path: str, _stat: os.stat_result, is_link: bool = False) -> 'FileEntry':
+        return cls(path, _stat.st_mtime, _stat.st_size, getattr(_stat, 'st_dev', 0),
+                   getattr(_stat, 'st_ino', 0), getattr(_stat, 'st_nlink', 1), is_link)
+
+
+class Subtree(NamedTuple):
+    """
+    A directory whose whole contents are expired, removed as one unit.
+
+    dir_info maps each directory relative to path ('' for path itself) to its
+    st_mtime_ns at scan time and the bytes held by its own files.
+    """
+    path: str
+    files: int
+    size: int
+    dir_info: Dict[str, Tuple[int, int]]
+
+
+@dataclass
+class CleanupResult:
+    """Outcome of a cleanup run; timings holds seconds spent per pipeline stage."""
+    scanned: int = 0
+    matched: int = 0
+    removed: int = 0
+    bytes_freed: int = 0
+    errors: int = 0
+    skipped_links: int = 0
+    pinned_inodes: int = 0
+    retried: int = 0
+    collapsed_dirs: int = 0
+    vanished: int = 0
+    cached_dirs: int = 0
+    dated_files: int = 0
+    pruned_dirs: int = 0
+    stale_listed: int = 0
+    coordination_skipped: bool = False
+    workers: Dict[str, int] = field(default_factory=dict)
+    errors_by_errno: Dict[str, int] = field(default_factory=dict)
+    error_examples: Dict[str, str] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+def is_month_end(mtime: float) -> bool:
     modified_date = datetime.fromtimestamp(mtime)
 
     # Get the last day of the month
@@ -187,6 +338,11 @@ def is_last_day_of_month(file_path):
     return modified_date.day == last_day
 
 
+def is_last_day_of_month(file_path):
+    # Get the last modified time of the file
+    return is_month_end(os.path.getmtime(file_path))
+
+
 def find_files_not_last_day_of_month(_expression: str) -> list:
     no_end_date = []
     _files = glob(_expression, recursive=True)
@@ -196,31 +352,3141 @@ def find_files_not_last_day_of_month(_expression: str) -> list:
     return no_end_date
 
 
-def remove_files(_files: list, _age: int = 1, logger=None):
-    if logger is None:
-        logger = logging.getLogger(APP_NAME)
-    deleted_files = 0
-    cutoff_date = datetime.now() - timedelta(days=_age)
-    for _file in _files:
-        if Path(_file).stat().st_mtime < cutoff_date.timestamp():
+def format_bytes(size: int) -> str:
+    value = float(size)
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if value < 1024 or unit == 'TB':
+            return f"{value:.0f} {unit}" if unit == 'B' else f"{value:.2f} {unit}"
+        value /= 1024
+
+
+def age_bucket(days: float) -> str:
+    """Return the AGE_BUCKETS label for a file age in days."""
+    for label, limit in AGE_BUCKETS:
+        if limit is None or days < limit:
+            return label
+
+
+def _translate_component(part: str) -> str:
+    """Translate one glob path component into a regular expression that never crosses a separator."""
+    regex = '' if part.startswith('.') else r'(?!\.)'
+    i = 0
+    while i < len(part):
+        char = part[i]
+        i += 1
+        if char == '*':
+            while i < len(part) and part[i] == '*':
+                i += 1
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[':
+            end = part.find(']', i + 1 if i < len(part) and part[i] in '!]' else i)
+            if end == -1:
+                regex += r'\['
+                continue
+            chars = part[i:end].replace('\\', r'\\')
+            if chars.startswith('!'):
+                chars = '^' + chars[1:]
+            elif chars.startswith('^'):
+                chars = '\\' + chars
+            regex += f'[{chars}]'
+            i = end + 1
+        else:
+            regex += re.escape(char)
+    return regex
+
+
+class ConcurrencyController:
+    """
+    Tune the number of concurrent workers from measured throughput and latency.
+
+    Workers report finished operations through record(). At the end of every
+    window the controller compares throughput with the previous window (AIMD):
+    a gain of more than 5% adds one worker, a loss of more than 5% or a mean
+    latency above twice the best seen cuts the limit by a quarter, and a flat
+    result probes one worker further in the last direction that helped. The
+    limit with the best throughput is kept in best_limit so it can be persisted.
+    With adaptive=False the limit stays fixed.
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 64, window: float = 1.0,
+                 adaptive: bool = True):
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = min(max(initial, minimum), self.maximum)
+        self.window = window
+        self.adaptive = adaptive
+        self.best_limit = self.limit
+        self._best_throughput = 0.0
+        self._best_latency = None
+        self._previous = None
+        self._direction = 1
+        self._ops = 0
+        self._latency = 0.0
+        self._samples = 0
+        self._window_start = time.monotonic()
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def record(self, ops: int = 1, latency: float = 0.0) -> None:
+        with self._condition:
+            self._ops += ops
+            self._latency += latency
+            self._samples += 1
+            elapsed = time.monotonic() - self._window_start
+            if elapsed >= self.window:
+                self.adjust(self._ops / elapsed, self._latency / self._samples)
+                self._ops = 0
+                self._latency = 0.0
+                self._samples = 0
+                self._window_start = time.monotonic()
+
+    def adjust(self, throughput: float, latency: float) -> None:
+        """Apply one window's throughput (operations per second) and mean latency."""
+        with self._condition:
+            self._adjust(throughput, latency)
+
+    def _adjust(self, throughput: float, latency: float) -> None:
+        if throughput > self._best_throughput:
+            self._best_throughput = throughput
+            self.best_limit = self.limit
+        if self._best_latency is None or latency < self._best_latency:
+            self._best_latency = latency
+        if not self.adaptive:
+            return
+        previous, self._previous = self._previous, throughput
+        if previous is None or throughput > previous * 1.05:
+            step = self._direction
+        elif throughput < previous * 0.95 or latency > 2 * self._best_latency:
+            self._direction = -1
+            step = -max(1, self.limit // 4)
+        else:
+            step = self._direction
+        limit = min(max(self.limit + step, self.minimum), self.maximum)
+        if limit == self.maximum:
+            self._direction = -1
+        elif limit == self.minimum:
+            self._direction = 1
+        if limit != self.limit:
+            self.limit = limit
+            self._condition.notify_all()
+
+    def wait_active(self, index: int) -> None:
+        """Block worker number index while it is above the current limit."""
+        with self._condition:
+            while index >= self.limit and not self._closed:
+                self._condition.wait()
+
+    def close(self) -> None:
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class AdaptivePool:
+    """
+    Thread pool whose active worker count follows a ConcurrencyController.
+
+    Threads are started as the limit grows; workers numbered at or above the
+    limit park until it rises again. max_queue bounds queued tasks so submit()
+    applies backpressure; 0 means unbounded.
+    """
+
+    def __init__(self, controller: ConcurrencyController, max_queue: Optional[int] = None):
+        self.controller = controller
+        self._tasks = queue.Queue(maxsize=controller.maximum * 4 if max_queue is None else max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, function, *args) -> None:
+        with self._lock:
+            while len(self._threads) < self.controller.limit:
+                thread = threading.Thread(target=self._work, args=(len(self._threads),), daemon=True)
+                self._threads.append(thread)
+                thread.start()
+        self._tasks.put((function, args))
+
+    def close(self) -> None:
+        """Finish queued tasks and stop every worker."""
+        self.controller.close()
+        for _ in self._threads:
+            self._tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self, index: int) -> None:
+        while True:
+            self.controller.wait_active(index)
+            task = self._tasks.get()
+            if task is None:
+                return
+            function, args = task
+            function(*args)
+
+
+def load_tuning(path: Optional[str], root: str) -> dict:
+    """Return the concurrency settings remembered for a root, or an empty dict."""
+    if not path:
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as handle:
+            return json.load(handle).get(os.path.abspath(root), {})
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def save_tuning(path: Optional[str], root: str, settings: dict) -> None:
+    """Remember the best concurrency settings for a root."""
+    if not path:
+        return
+    try:
+        with open(path, 'r', encoding='utf-8') as handle:
+            tuning = json.load(handle)
+    except (OSError, ValueError):
+        tuning = {}
+    tuning[os.path.abspath(root)] = dict(settings, updated=datetime.now().isoformat(timespec='seconds'))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as handle:
+        json.dump(tuning, handle, indent=2)
+    os.replace(temporary, path)
+
+
+class FreshCache:
+    """
+    Persistent LRU summary of directories that held nothing old enough to delete.
+
+    For each directory it remembers the directory's mtime, the oldest matching
+    file mtime seen and the names of its subdirectories. A directory whose
+    mtime is unchanged has gained, lost or renamed no entries since, so while
+    its oldest file is still newer than the cutoff it can be skipped without
+    listing or stat'ing anything; only its subdirectories are visited. Files
+    modified in place get newer, never older, so they cannot make a skip wrong.
+
+    Entries are keyed by directory relative to the scan root, and the whole
+    cache is discarded when it was written for a different expression or
+    dating mode (dating is PathDates.key, or None for mtimes): the oldest
+    date remembered for a directory depends on how its files were dated. At
+    most capacity directories are kept, evicting the least recently used. With
+    no path the cache lives in memory only, e.g. in a resident JobServer.
+    """
+
+    def __init__(self, path: Optional[str], expression: str, cutoff: float, capacity: int = DEFAULT_CACHE_SIZE,
+                 dating: Optional[list] = None):
+        self.path = path
+        self.key = os.path.abspath(expression)
+        self.dating = dating
+        self.cutoff = cutoff
+        self.capacity = capacity
+        self.hits = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if not path:
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as handle:
+                data = json.load(handle)
+            if data.get('expression') == self.key and data.get('dating') == self.dating:
+                for relative, mtime_ns, oldest, subdirs in data.get('directories', []):
+                    self._entries[relative] = (mtime_ns, oldest, tuple(subdirs))
+        except (OSError, ValueError, AttributeError, TypeError):
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, relative: str, mtime_ns: int) -> Optional[tuple]:
+        """Return the subdirectory names of a directory that can be skipped, or None to list it."""
+        with self._lock:
+            cached = self._entries.get(relative)
+            if cached is None or cached[0] != mtime_ns or (cached[1] is not None and cached[1] < self.cutoff):
+                return None
+            self._entries.move_to_end(relative)
+            self.hits += 1
+            return cached[2]
+
+    def store(self, relative: str, mtime_ns: int, oldest: Optional[float], subdirs: Iterable[str]) -> None:
+        """Remember a fully listed directory; one holding expired files is forgotten instead."""
+        with self._lock:
+            if oldest is not None and oldest < self.cutoff:
+                self._entries.pop(relative, None)
+                return
+            self._entries[relative] = (mtime_ns, oldest, tuple(subdirs))
+            self._entries.move_to_end(relative)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def save(self) -> None:
+        """Write the cache atomically; least recently used directories come first."""
+        if not self.path:
+            return
+        with self._lock:
+            directories = [[relative, mtime_ns, oldest, list(subdirs)]
+                           for relative, (mtime_ns, oldest, subdirs) in self._entries.items()]
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as handle:
+            json.dump({'expression': self.key, 'dating': self.dating, 'directories': directories}, handle,
+                      separators=(',', ':'))
+        os.replace(temporary, self.path)
+
+
+class PathDates:
+    """
+    Date files by patterns in their path instead of by their mtime.
+
+    Each pattern is searched in the '/'-separated path relative to the scan
+    root and must define a year group, optionally month and day groups. When
+    several matches are found the one ending furthest right (the most specific
+    component) wins. A date stands for the last second of the period it names,
+    so '2024/03' expires only once all of March 2024 has, and month-end checks
+    (-e) on a day date look at that day. With require_day, as -e needs, files
+    are only dated by matches that include a day. fresh() tells whether a dated
+    directory cannot hold expired files, so it need not be listed at all.
+    """
+
+    def __init__(self, patterns: Iterable[str] = DEFAULT_DATE_PATTERNS, cutoff: Optional[float] = None,
+                 require_day: bool = False):
+        try:
+            self.patterns = [re.compile(pattern) for pattern in patterns]
+        except re.error as error:
+            raise ValueError(f"Invalid date pattern: {error}") from None
+        for pattern in self.patterns:
+            if 'year' not in pattern.groupindex:
+                raise ValueError(f"Date pattern '{pattern.pattern}' has no (?P<year>...) group")
+        self.cutoff = cutoff
+        self.require_day = require_day
+
+    @property
+    def key(self) -> list:
+        """Settings that decide how files are dated, e.g. to key caches built from the dates."""
+        return [pattern.pattern for pattern in self.patterns] + [self.require_day]
+
+    def date(self, relative_path: str, require_day: Optional[bool] = None) -> Optional[float]:
+        """Return the timestamp a path's embedded date stands for, or None when it has none."""
+        if require_day is None:
+            require_day = self.require_day
+        best = None
+        for pattern in self.patterns:
+            for match in pattern.finditer(relative_path):
+                if require_day and not match.groupdict().get('day'):
+                    continue
+                key = (match.end(), match.end() - match.start())
+                if best is None or key > best[0]:
+                    timestamp = self._timestamp(match)
+                    if timestamp is not None:
+                        best = (key, timestamp)
+        return None if best is None else best[1]
+
+    def fresh(self, relative_dir: str) -> bool:
+        """Return True if a directory's date shows that nothing in it has expired yet."""
+        if self.cutoff is None:
+            return False
+        timestamp = self.date(relative_dir, require_day=False)
+        return timestamp is not None and timestamp >= self.cutoff
+
+    @staticmethod
+    def _timestamp(match) -> Optional[float]:
+        groups = match.groupdict()
+        try:
+            year = int(groups['year'])
+            month = int(groups['month']) if groups.get('month') else None
+            day = int(groups['day']) if groups.get('day') else None
+            if month is None:
+                end = datetime(year + 1, 1, 1)
+            elif day is None:
+                end = datetime(year + month // 12, month % 12 + 1, 1)
+            else:
+                end = datetime(year, month, day) + timedelta(days=1)
+        except (ValueError, OverflowError):
+            return None
+        return end.timestamp() - 1
+
+
+class ScanSource:
+    """
+    Base class for the stream of files a cleanup starts from.
+
+    Subclasses implement __iter__ to yield FileEntry objects and may update
+    dirs_scanned, skipped_links, dated_files and pruned_dirs while they are consumed.
+    """
+
+    dirs_scanned = 0
+    skipped_links = 0
+    dated_files = 0
+    pruned_dirs = 0
+
+    def __iter__(self) -> Iterator[FileEntry]:
+        raise NotImplementedError
+
+
+class ExpressionScanner(ScanSource):
+    """
+    Stream the files matching a glob expression with os.scandir.
+
+    Behaves like glob(expression, recursive=True) restricted to files, but yields
+    FileEntry objects as it walks so each file is stat'ed at most once. Hard links
+    are recognised by (st_dev, st_ino) before stat'ing, and symlinked directories
+    are skipped unless follow_symlinks is set, in which case directory cycles are
+    broken by remembering every visited directory inode.
+
+    When collapse is given (a predicate saying whether a file may go), recursive
+    expressions are walked bottom-up and any subdirectory whose files all match
+    the expression and satisfy the predicate is yielded as a single Subtree.
+    include_top, a predicate on names, limits the walk to some of the root's
+    top-level entries. With a ConcurrencyController, directories are listed in
+    parallel (the collapsing walk stays sequential). With a FreshCache, unchanged
+    directories holding only fresh files are not listed again. With PathDates,
+    files dated by their path are not stat'ed (their size is unknown) and fresh
+    dated directories are not listed. stop, a callable returning True once the
+    run's time budget is spent, ends the walk early.
+    """
+
+    def __init__(self, expression: str, follow_symlinks: bool = False, collapse=None, include_top=None,
+                 controller: Optional[ConcurrencyController] = None, cache: Optional[FreshCache] = None,
+                 path_dates: Optional[PathDates] = None, stop=None):
+        self.expression = expression
+        self.follow_symlinks = follow_symlinks
+        self.collapse = collapse
+        self.include_top = include_top
+        self.controller = controller
+        # Symlinked directories have no single place in the tree to cache them under
+        self.cache = None if follow_symlinks else cache
+        self.path_dates = path_dates
+        self.stop = stop
+        self._lock = threading.Lock()
+        self.dirs_scanned = 0
+        self.skipped_links = 0
+        self.dated_files = 0
+        self.pruned_dirs = 0
+        self.root, self.parts = self._split(expression)
+        self.recursive = '**' in self.parts
+        flags = re.IGNORECASE if os.path.normcase('A') == 'a' else 0
+        self._pattern = re.compile(self._compile(self.parts), flags)
+        self._components = [re.compile(_translate_component(part), flags) for part in self.parts]
+        self._inodes = {}
+
+    @staticmethod
+    def _split(expression: str) -> Tuple[str, list]:
+        if os.altsep:
+            expression = expression.replace(os.altsep, os.sep)
+        parts = expression.split(os.sep)
+        magic = next((i for i, part in enumerate(parts) if re.search(r'[*?[]', part)), len(parts))
+        root = os.sep.join(parts[:magic])
+        if magic and not root:
+            root = os.sep
+        elif root.endswith(':'):
+            root += os.sep
+        return root, [part for part in parts[magic:] if part]
+
+    @staticmethod
+    def _compile(parts: list) -> str:
+        regex = ''
+        for i, part in enumerate(parts):
+            last = i == len(parts) - 1
+            if part == '**':
+                regex += r'(?:(?!\.)[^/]+/)*' + (r'(?!\.)[^/]+' if last else '')
+            else:
+                regex += _translate_component(part) + ('' if last else '/')
+        return regex
+
+    def matches(self, relative_path: str) -> bool:
+        """Return True if a '/'-separated path relative to the root matches the expression."""
+        return self._pattern.fullmatch(relative_path) is not None
+
+    def match_path(self, path: str) -> bool:
+        """Return True if a full path (as glob would return it) matches the expression."""
+        if os.altsep:
+            path = path.replace(os.altsep, os.sep)
+        if not self.parts:
+            return os.path.normcase(path) == os.path.normcase(self.expression)
+        if self.root:
+            prefix = self.root if self.root.endswith(os.sep) else self.root + os.sep
+            if not os.path.normcase(path).startswith(os.path.normcase(prefix)):
+                return False
+            path = path[len(prefix):]
+        relative_path = path.replace(os.sep, '/')
+        if self.include_top is not None and not self.include_top(relative_path.split('/', 1)[0]):
+            return False
+        return self.matches(relative_path)
+
+    def _stopped(self) -> bool:
+        return self.stop is not None and self.stop()
+
+    def _descend(self, depth: int, name: str) -> bool:
+        if self.recursive and '**' in self.parts[:depth + 1]:
+            return not name.startswith('.')
+        if depth >= len(self.parts) - 1:
+            return False
+        return self._components[depth].fullmatch(name) is not None
+
+    def _collapsing_walk(self, directory: str, relative: str, depth: int, dev: int, mtime_ns: int):
+        """
+        Post-order walk that folds fully expired directories into Subtree records.
+
+        Entries of a directory are held back only while the directory may still
+        collapse; as soon as one entry rules that out, everything buffered is
+        yielded and the rest of the directory streams through directly.
+
+        Returns:
+            Directory info for the parent: a dict of relative directory -> (st_mtime_ns,
+            bytes of its own files) plus file count and bytes, or None when the
+            directory cannot be removed as a whole
+        """
+        try:
+            with os.scandir(directory or os.curdir) as it:
+                dir_entries = list(it)
+        except OSError:
+            return None
+        self.dirs_scanned += 1
+        collapsible = depth > 0
+        held = []
+        files = 0
+        size = 0
+        own_size = 0
+        dir_info = {}
+        for dir_entry in dir_entries:
+            if self._stopped():
+                collapsible = False
+                break
+            name = dir_entry.name
+            if depth == 0 and self.include_top is not None and not self.include_top(name):
+                continue
+            path = os.path.join(directory, name)
+            relative_path = relative + name
             try:
-                os.remove(_file)
-                deleted_files += 1
-                logger.info(f"Removed: {_file}")
+                is_dir = dir_entry.is_dir()
             except OSError:
-                logger.error(f"Error removing: {_file}")
-    if deleted_files > 0:
-        logger.info(f"Deleted {deleted_files} files.")
+                collapsible = False
+                continue
+            item = None
+            if is_dir:
+                if not self._descend(depth, name) or dir_entry.is_symlink():
+                    self.skipped_links += dir_entry.is_symlink()
+                    collapsible = False
+                    continue
+                try:
+                    dir_stat = dir_entry.stat()
+                except OSError:
+                    collapsible = False
+                    continue
+                child = yield from self._collapsing_walk(path, relative_path + '/', depth + 1,
+                                                         dir_stat.st_dev, dir_stat.st_mtime_ns)
+                if child is None or dir_stat.st_dev != dev:
+                    collapsible = False
+                    continue
+                child_info, child_files, child_size = child
+                files += child_files
+                size += child_size
+                dir_info.update((f"{name}/{key}" if key else name, value) for key, value in child_info.items())
+                if child_files:
+                    item = Subtree(path, child_files, child_size, child_info)
+            elif self.matches(relative_path):
+                item = self._entry(path, dev, dir_entry)
+                if item is None or not self.collapse(item):
+                    collapsible = False
+                else:
+                    files += 1
+                    freed = item.size if item.nlink <= 1 else 0
+                    size += freed
+                    own_size += freed
+            else:
+                collapsible = False
+            if item is None:
+                continue
+            if collapsible:
+                held.append(item)
+            else:
+                yield from held
+                held.clear()
+                yield item
+        if collapsible:
+            dir_info[''] = (mtime_ns, own_size)
+            return dir_info, files, size
+        yield from held
+        return None
+
+    def _entry(self, path: str, dev: int, dir_entry) -> Optional[FileEntry]:
+        key = (dev, dir_entry.inode())
+        cached = self._inodes.get(key)
+        if cached is not None:
+            return cached._replace(path=path)
+        try:
+            is_link = dir_entry.is_symlink()
+            entry = FileEntry.from_stat(path, dir_entry.stat(follow_symlinks=False), is_link)
+        except OSError:
+            return None
+        if entry.nlink > 1 and not is_link:
+            self._inodes[key] = entry
+        return entry
+
+    def __iter__(self) -> Iterator[FileEntry]:
+        if not self.parts:
+            if os.path.isfile(self.expression):
+                is_link = os.path.islink(self.expression)
+                yield FileEntry.from_stat(self.expression, os.lstat(self.expression), is_link)
+            return
+        scan_root = self.root or os.curdir
+        try:
+            root_stat = os.stat(scan_root)
+        except OSError:
+            return
+        if self.collapse is not None and self.recursive and not self.follow_symlinks:
+            yield from self._collapsing_walk(self.root, '', 0, root_stat.st_dev, root_stat.st_mtime_ns)
+            return
+        visited = {(root_stat.st_dev, root_stat.st_ino)}
+        root = (self.root, '', 0, root_stat.st_dev, root_stat.st_mtime_ns)
+        if self.controller is not None:
+            yield from self._parallel_walk(root, visited)
+            return
+        stack = [root]
+        while stack and not self._stopped():
+            entries, subdirs = self._list_directory(*stack.pop(), visited)
+            yield from entries
+            stack.extend(reversed(subdirs))
+
+    def _list_directory(self, directory: str, relative: str, depth: int, dev: int, mtime_ns: int,
+                        visited: set) -> Tuple[list, list]:
+        """List one directory; returns its matching FileEntry objects and the subdirectories to walk."""
+        entries = []
+        subdirs = []
+        # The root's listing depends on include_top, so it is only cached without one
+        cache = self.cache if depth or self.include_top is None else None
+        if cache is not None:
+            names = cache.lookup(relative, mtime_ns)
+            if names is not None:
+                return entries, self._cached_subdirs(directory, relative, depth, names)
+        complete = True
+        dated = 0
+        # Dated directories skipped for now; the cache must still list them so they are visited once expired
+        pruned = []
+        try:
+            with os.scandir(directory or os.curdir) as it:
+                dir_entries = list(it)
+        except OSError:
+            return entries, subdirs
+        with self._lock:
+            self.dirs_scanned += 1
+        for dir_entry in dir_entries:
+            if self._stopped():
+                # A partial listing must not be cached as the directory's contents
+                complete = False
+                break
+            name = dir_entry.name
+            if depth == 0 and self.include_top is not None and not self.include_top(name):
+                continue
+            path = os.path.join(directory, name)
+            relative_path = relative + name
+            try:
+                is_dir = dir_entry.is_dir()
+            except OSError:
+                complete = False
+                continue
+            if is_dir:
+                if not self._descend(depth, name):
+                    continue
+                if not self.follow_symlinks and dir_entry.is_symlink():
+                    with self._lock:
+                        self.skipped_links += 1
+                    continue
+                if self.path_dates is not None and self.path_dates.fresh(relative_path):
+                    with self._lock:
+                        self.pruned_dirs += 1
+                    pruned.append(name)
+                    continue
+                # One stat per directory keeps st_dev right across mount points
+                try:
+                    dir_stat = dir_entry.stat()
+                except OSError:
+                    complete = False
+                    continue
+                if self.follow_symlinks:
+                    with self._lock:
+                        if (dir_stat.st_dev, dir_stat.st_ino) in visited:
+                            continue
+                        visited.add((dir_stat.st_dev, dir_stat.st_ino))
+                subdirs.append((path, relative_path + '/', depth + 1, dir_stat.st_dev, dir_stat.st_mtime_ns))
+            elif self.matches(relative_path):
+                entry = self._dated_entry(path, relative_path, dir_entry) if self.path_dates is not None else None
+                if entry is not None:
+                    dated += 1
+                else:
+                    entry = self._entry(path, dev, dir_entry)
+                if entry is not None:
+                    entries.append(entry)
+                else:
+                    complete = False
+        if dated:
+            with self._lock:
+                self.dated_files += dated
+        if cache is not None and complete:
+            oldest = min((entry.mtime for entry in entries), default=None)
+            names = [subdir[1][len(relative):-1] for subdir in subdirs] + pruned
+            cache.store(relative, mtime_ns, oldest, names)
+        return entries, subdirs
+
+    def _dated_entry(self, path: str, relative_path: str, dir_entry) -> Optional[FileEntry]:
+        timestamp = self.path_dates.date(relative_path)
+        if timestamp is None:
+            return None
+        try:
+            is_link = dir_entry.is_symlink()
+        except OSError:
+            return None
+        return FileEntry(path, timestamp, is_link=is_link)
+
+    def _cached_subdirs(self, directory: str, relative: str, depth: int, names: Iterable[str]) -> list:
+        subdirs = []
+        for name in names:
+            if self.path_dates is not None and self.path_dates.fresh(relative + name):
+                with self._lock:
+                    self.pruned_dirs += 1
+                continue
+            path = os.path.join(directory, name)
+            try:
+                dir_stat = os.stat(path)
+            except OSError:
+                continue
+            subdirs.append((path, relative + name + '/', depth + 1, dir_stat.st_dev, dir_stat.st_mtime_ns))
+        return subdirs
+
+    def _parallel_walk(self, root: tuple, visited: set) -> Iterator[FileEntry]:
+        """
+        Walk with directories listed concurrently on an AdaptivePool.
+
+        Each directory's entries are delivered together through a bounded queue,
+        so a slow consumer throttles the listing threads.
+        """
+        pool = AdaptivePool(self.controller, max_queue=0)
+        results = queue.Queue(maxsize=64)
+        stop = threading.Event()
+        pending = [1]
+        pending_lock = threading.Lock()
+        done = object()
+
+        def deliver(item) -> None:
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def list_directory(directory: str, relative: str, depth: int, dev: int, mtime_ns: int) -> None:
+            try:
+                if stop.is_set() or self._stopped():
+                    return
+                started = time.perf_counter()
+                entries, subdirs = self._list_directory(directory, relative, depth, dev, mtime_ns, visited)
+                self.controller.record(len(entries) + 1, time.perf_counter() - started)
+                with pending_lock:
+                    pending[0] += len(subdirs)
+                for subdir in subdirs:
+                    pool.submit(list_directory, *subdir)
+                if entries:
+                    deliver(entries)
+            finally:
+                with pending_lock:
+                    pending[0] -= 1
+                    finished = pending[0] == 0
+                if finished:
+                    deliver(done)
+
+        pool.submit(list_directory, *root)
+        try:
+            while True:
+                item = results.get()
+                if item is done:
+                    break
+                yield from item
+        finally:
+            stop.set()
+            pool.close()
+
+
+class ListingSource(ScanSource):
+    """
+    Stream candidates from a metadata listing exported by the storage system.
+
+    'nul' listings hold path, size and mtime fields each terminated by NUL, as
+    written by find -printf '%p\\0%s\\0%T@\\0'; 'csv' listings hold path,size,mtime
+    rows with an optional header. Either may be gzip-compressed. The listing is
+    read sequentially in CHUNK_SIZE blocks and only paths matching the expression
+    are yielded, so no directory on the share is listed or stat'ed. The listing
+    may be stale, so Cleaner.plan() stats each expired candidate again with
+    confirm_expired() before it is removed. stop ends the read early, as for
+    ExpressionScanner.
+    """
+
+    CHUNK_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, listing: str, expression: str, listing_format: str = 'auto', include_top=None, stop=None):
+        if listing_format not in LISTING_FORMATS:
+            raise ValueError(f"Unknown listing format: {listing_format}")
+        self.listing = listing
+        self.listing_format = listing_format
+        self.invalid_records = 0
+        self.stop = stop
+        self._scanner = ExpressionScanner(expression, include_top=include_top)
+
+    def _open(self):
+        handle = open(self.listing, 'rb', buffering=self.CHUNK_SIZE)
+        if handle.peek(2)[:2] == b'\x1f\x8b':
+            return gzip.GzipFile(fileobj=handle, mode='rb')
+        return handle
+
+    def _detect_format(self) -> str:
+        if self.listing_format != 'auto':
+            return self.listing_format
+        name = self.listing[:-3] if self.listing.endswith('.gz') else self.listing
+        return 'csv' if name.lower().endswith('.csv') else 'nul'
+
+    def _nul_records(self, handle) -> Iterator[Tuple[bytes, bytes, bytes]]:
+        pending = b''
+        fields = []
+        while True:
+            chunk = handle.read(self.CHUNK_SIZE)
+            if not chunk:
+                break
+            parts = (pending + chunk).split(b'\0')
+            pending = parts.pop()
+            fields.extend(parts)
+            usable = len(fields) - len(fields) % 3
+            for i in range(0, usable, 3):
+                yield fields[i], fields[i + 1], fields[i + 2]
+            del fields[:usable]
+        if fields or pending:
+            self.invalid_records += 1
+
+    def _csv_records(self, handle) -> Iterator[list]:
+        text = io.TextIOWrapper(handle, encoding='utf-8', errors='surrogateescape', newline='')
+        yield from csv.reader(text)
+
+    def __iter__(self) -> Iterator[FileEntry]:
+        listing_format = self._detect_format()
+        with self._open() as handle:
+            if listing_format == 'csv':
+                records = self._csv_records(handle)
+                decode = str
+            else:
+                records = self._nul_records(handle)
+                decode = os.fsdecode
+            for record in records:
+                if self.stop is not None and self.stop():
+                    break
+                try:
+                    path, size, mtime = record
+                    entry = FileEntry(decode(path), float(mtime), int(size))
+                except ValueError:
+                    # Header rows and truncated or malformed records
+                    self.invalid_records += 1
+                    continue
+                if self._scanner.match_path(entry.path):
+                    yield entry
+
+
+class InodeAccounting:
+    """
+    Work out how many bytes each removal actually frees.
+
+    A hard-linked inode is only released once its last link is removed, so its
+    size is credited when the number of removed links reaches st_nlink. Removing
+    a symlink never frees the target's data.
+    """
+
+    def __init__(self):
+        self._removed_links = {}
+
+    def freed(self, entry: FileEntry) -> int:
+        if entry.is_link:
+            return 0
+        if entry.nlink <= 1:
+            return entry.size
+        key = (entry.dev, entry.ino)
+        removed = self._removed_links.get(key, 0) + 1
+        if removed >= entry.nlink:
+            self._removed_links.pop(key, None)
+            return entry.size
+        self._removed_links[key] = removed
+        return 0
+
+    @property
+    def pinned_inodes(self) -> int:
+        """Hard-linked inodes that lost links but are still referenced elsewhere."""
+        return len(self._removed_links)
+
+
+@dataclass
+class TreeRemoval:
+    """Outcome of remove_tree()."""
+    removed: int = 0
+    bytes_freed: int = 0
+    kept: int = 0
+    stopped: bool = False
+    errors: list = field(default_factory=list)
+
+
+FD_TREE_REMOVAL = ({os.open, os.unlink, os.rmdir} <= os.supports_dir_fd and os.scandir in os.supports_fd)
+
+
+def remove_tree(subtree: Subtree, cutoff: float, keep=None, limit: Optional[int] = None,
+                deadline: Optional[float] = None) -> TreeRemoval:
+    """
+    Remove a collapsed subtree bottom-up, relative to open directory descriptors where supported.
+
+    A directory whose st_mtime_ns still matches the scan has had no entries added
+    or removed, so its files are unlinked without another stat. Changed
+    directories fall back to checking each file against the cutoff (and keep,
+    a predicate on mtime) so nothing written since the scan is removed. With a
+    limit or deadline the removal may stop part way; files are then stat'ed for
+    their size, since the scan's per-directory totals no longer apply.
+
+    Args:
+        subtree: Subtree yielded by ExpressionScanner
+        cutoff: POSIX timestamp; only files modified before it are removed
+        keep: Optional predicate on mtime for files that must be kept
+        limit: Optional maximum number of files to remove (--max-deletes)
+        deadline: Optional time.monotonic() value after which nothing more is removed (--max-runtime)
+
+    Returns:
+        TreeRemoval with files removed, bytes freed, files kept, whether a budget stopped it
+        and (path, error) pairs
+    """
+    outcome = TreeRemoval()
+    budget = (limit, deadline) if limit is not None or deadline is not None else None
+    parent, name = os.path.split(subtree.path)
+    parent_fd = None
+    if FD_TREE_REMOVAL:
+        try:
+            parent_fd = os.open(parent or os.curdir, os.O_RDONLY)
+        except OSError as error:
+            outcome.errors.append((subtree.path, error))
+            return outcome
+    try:
+        _remove_tree_at(parent_fd, parent, name, '', subtree.dir_info, cutoff, keep, outcome, budget)
+    finally:
+        if parent_fd is not None:
+            os.close(parent_fd)
+    return outcome
+
+
+def _remove_tree_at(parent_fd: Optional[int], parent: str, name: str, relative: str, dir_info: dict,
+                    cutoff: float, keep, outcome: TreeRemoval, budget: Optional[tuple] = None) -> None:
+    path = os.path.join(parent, name)
+    fd = None
+    try:
+        if parent_fd is not None:
+            flags = os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0) | getattr(os, 'O_NOFOLLOW', 0)
+            fd = os.open(name, flags, dir_fd=parent_fd)
+            dir_stat = os.fstat(fd)
+        else:
+            dir_stat = os.lstat(path)
+        with os.scandir(path if fd is None else fd) as it:
+            dir_entries = list(it)
+    except OSError as error:
+        if fd is not None:
+            os.close(fd)
+        outcome.errors.append((path, error))
+        return
+    try:
+        info = dir_info.get(relative)
+        unchanged = info is not None and info[0] == dir_stat.st_mtime_ns
+        failed = False
+        for dir_entry in dir_entries:
+            if budget is not None:
+                limit, deadline = budget
+                if ((limit is not None and outcome.removed >= limit)
+                        or (deadline is not None and time.monotonic() >= deadline)):
+                    outcome.stopped = True
+            if outcome.stopped:
+                break
+            entry_path = os.path.join(path, dir_entry.name)
+            try:
+                if dir_entry.is_dir(follow_symlinks=False):
+                    child = f"{relative}/{dir_entry.name}" if relative else dir_entry.name
+                    _remove_tree_at(fd, path, dir_entry.name, child, dir_info, cutoff, keep, outcome, budget)
+                    continue
+                size = 0
+                if not unchanged or budget is not None:
+                    _stat = dir_entry.stat(follow_symlinks=False)
+                    if not unchanged and (_stat.st_mtime >= cutoff or (keep is not None and keep(_stat.st_mtime))):
+                        outcome.kept += 1
+                        continue
+                    size = 0 if dir_entry.is_symlink() or _stat.st_nlink > 1 else _stat.st_size
+                os.unlink(dir_entry.name if fd is not None else entry_path, dir_fd=fd)
+                outcome.removed += 1
+                outcome.bytes_freed += size
+            except OSError as error:
+                failed = True
+                outcome.errors.append((entry_path, error))
+        if unchanged and not failed and budget is None:
+            outcome.bytes_freed += info[1]
+    finally:
+        if fd is not None:
+            os.close(fd)
+    try:
+        os.rmdir(name if parent_fd is not None else path, dir_fd=parent_fd)
+    except OSError as error:
+        if error.errno not in (errno.ENOTEMPTY, errno.EEXIST) or not (outcome.kept or outcome.stopped):
+            outcome.errors.append((path, error))
+
+
+def expired_files(_files: Iterable, cutoff: float) -> Iterator[FileEntry]:
+    """
+    Stream the files whose modification time is older than the cutoff.
+
+    Args:
+        _files: Iterable of file paths, FileEntry or Subtree objects; paths are stat'ed here
+        cutoff: POSIX timestamp; files modified before it are expired
+
+    Yields:
+        A FileEntry for each expired file, and every Subtree unchanged
+    """
+    for _file in _files:
+        if isinstance(_file, Subtree):
+            # Collapsed subtrees were already checked file by file during the scan
+            yield _file
+            continue
+        entry = _file if isinstance(_file, FileEntry) else FileEntry.from_stat(_file, Path(_file).stat())
+        if entry.mtime < cutoff:
+            yield entry
+
+
+def confirm_expired(candidates: Iterable[FileEntry], cutoff: float, on_stale=None) -> Iterator[FileEntry]:
+    """
+    Stat candidates taken from a listing again and drop those that changed since it was written.
+
+    Args:
+        candidates: Iterable of expired FileEntry objects with listing metadata
+        cutoff: POSIX timestamp; files modified before it are expired
+        on_stale: Optional callable given each dropped FileEntry
+
+    Yields:
+        A FileEntry with current metadata for each file that is still expired and unchanged in size
+    """
+    for entry in candidates:
+        try:
+            _stat = os.lstat(entry.path)
+        except OSError:
+            _stat = None
+        if _stat is None or _stat.st_mtime >= cutoff or _stat.st_size != entry.size:
+            if on_stale is not None:
+                on_stale(entry)
+            continue
+        yield FileEntry.from_stat(entry.path, _stat, stat.S_ISLNK(_stat.st_mode))
+
+
+def prioritize(candidates: Iterable[FileEntry], order: str = 'oldest',
+               queue_size: int = DEFAULT_QUEUE_SIZE, stop=None) -> Iterator[FileEntry]:
+    """
+    Reorder a stream of candidates through a bounded priority queue.
+
+    While the queue is full, every new candidate pushes out the highest priority
+    entry seen so far, so deleting can start before the scan finishes and memory
+    stays bounded. When fewer than queue_size candidates exist the order is exact.
+
+    Args:
+        candidates: Iterable of FileEntry objects
+        order: 'oldest' for oldest mtime first, 'largest' for biggest files first,
+            'inode' for locality_order()
+        queue_size: Maximum number of candidates held at once
+        stop: Optional callable; once it returns True no more candidates are read
+
+    Yields:
+        The same FileEntry objects, highest priority first
+    """
+    if order == 'inode':
+        yield from locality_order(candidates, queue_size, stop)
+        return
+    if order == 'oldest':
+        key = lambda entry: entry.mtime
+    elif order == 'largest':
+        key = lambda entry: -entry.size
     else:
-        logger.info("No files were deleted.")
+        raise ValueError(f"Unknown order mode: {order}")
+    heap = []
+    for sequence, entry in enumerate(candidates):
+        if stop is not None and stop():
+            break
+        item = (key(entry), sequence, entry)
+        if len(heap) < queue_size:
+            heapq.heappush(heap, item)
+        else:
+            yield heapq.heappushpop(heap, item)[2]
+    while heap:
+        yield heapq.heappop(heap)[2]
 
 
-if __name__ == '__main__':
+def locality_order(candidates: Iterable[FileEntry], window: int = DEFAULT_QUEUE_SIZE,
+                   stop=None) -> Iterator[FileEntry]:
+    """
+    Reorder candidates so unlinks touch metadata in disk order.
+
+    Candidates are buffered per parent directory until window of them are held,
+    then released one directory at a time, directories in order of their lowest
+    inode number and files within each directory by inode number. On ext4 and
+    XFS inode numbers follow the inode table, so the inode and directory block
+    writes of a batch are close to sequential. Entries without an inode number
+    (e.g. from a listing file) keep their relative order.
+
+    Args:
+        candidates: Iterable of FileEntry objects
+        window: Maximum number of candidates held at once
+        stop: Optional callable; once it returns True no more candidates are read
+
+    Yields:
+        The same FileEntry objects, grouped by directory in inode order
+    """
+    groups = {}
+    held = 0
+    for sequence, entry in enumerate(candidates):
+        if stop is not None and stop():
+            break
+        groups.setdefault(os.path.dirname(entry.path), []).append((entry.dev, entry.ino, sequence, entry))
+        held += 1
+        if held >= window:
+            yield from _release_groups(groups)
+            groups = {}
+            held = 0
+    yield from _release_groups(groups)
+
+
+def _release_groups(groups: dict) -> Iterator[FileEntry]:
+    for items in sorted(groups.values(), key=min):
+        items.sort()
+        for item in items:
+            yield item[3]
+
+
+class ArchiveVolumeError(OSError):
+    """Raised when a volume's stream is broken part way through a member."""
+
+
+class ArchiveVolume:
+    """
+    A single streaming .tar.gz or .tar.zst archive volume.
+
+    Each member is read once from an open file handle straight into the
+    compressor. seal() closes the stream and fsyncs the volume and its directory;
+    only then are the members safe to delete.
+    """
+
+    def __init__(self, path: str, archive_format: str = 'gz'):
+        self.path = path
+        self.members = []
+        self.bytes_in = 0
+        self._raw = open(path, 'xb')
+        self._compressor = None
+        if archive_format == 'zst':
+            self._compressor = zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+            self._tar = tarfile.open(fileobj=self._compressor, mode='w|')
+        else:
+            self._tar = tarfile.open(fileobj=self._raw, mode='w|gz')
+
+    @staticmethod
+    def arcname(path: str) -> str:
+        return os.path.splitdrive(os.path.abspath(path))[1].lstrip('\\/').replace('\\', '/')
+
+    def add(self, entry: FileEntry) -> None:
+        """Append one file. OSError before any data is written leaves the volume usable."""
+        if entry.is_link:
+            info = self._tar.gettarinfo(entry.path, self.arcname(entry.path))
+            self._tar.addfile(info)
+        else:
+            with open(entry.path, 'rb') as handle:
+                info = self._tar.gettarinfo(arcname=self.arcname(entry.path), fileobj=handle)
+                self._write_member(info, handle)
+        self.members.append(entry)
+        # The size actually streamed; scan-time sizes are 0 for path-dated entries and stale for listings
+        self.bytes_in += info.size
+
+    def _write_member(self, info: tarfile.TarInfo, handle) -> None:
+        try:
+            self._tar.addfile(info, handle)
+        except OSError as error:
+            # A partial member corrupts the stream, so the volume cannot be sealed
+            raise ArchiveVolumeError(self.path) from error
+
+    def seal(self) -> None:
+        self._tar.close()
+        if self._compressor is not None:
+            self._compressor.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        fsync_directory(os.path.dirname(self.path))
+
+    def abandon(self) -> None:
+        self._raw.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def fsync_directory(directory: str) -> None:
+    if os.name != 'posix':
+        return
+    fd = os.open(directory or os.curdir, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Archiver:
+    """
+    Stream expired files into rotating archive volumes before they are deleted.
+
+    With workers > 1 each worker thread owns its own shard of volumes and is fed
+    through a bounded queue. on_sealed(members) is called after a volume has been
+    fsynced, and on_failed(members, error) when files could not be archived; both
+    may run on a worker thread.
+    """
+
+    def __init__(self, directory: str, archive_format: str = 'gz', volume_size: int = 1024 ** 3,
+                 workers: int = 1, on_sealed=None, on_failed=None, logger=None):
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unknown archive format: {archive_format}")
+        if archive_format == 'zst' and zstandard is None:
+            raise ValueError("Archive format 'zst' requires the zstandard package")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.archive_format = archive_format
+        self.volume_size = volume_size
+        self.on_sealed = on_sealed or (lambda members: None)
+        self.on_failed = on_failed or (lambda members, error: None)
+        self.logger = logger or logging.getLogger(APP_NAME)
+        # The run id keeps volume names apart when several runs share the directory in the same second
+        self._stamp = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self._sequence = [0] * workers
+        self._volumes = [None] * workers
+        self._queues = []
+        self._threads = []
+        self._next = 0
+        if workers > 1:
+            for shard in range(workers):
+                shard_queue = queue.Queue(maxsize=64)
+                thread = threading.Thread(target=self._worker, args=(shard, shard_queue), daemon=True)
+                self._queues.append(shard_queue)
+                self._threads.append(thread)
+                thread.start()
+
+    def submit(self, entry: FileEntry) -> None:
+        if not self._queues:
+            self._add(0, entry)
+            return
+        self._queues[self._next].put(entry)
+        self._next = (self._next + 1) % len(self._queues)
+
+    def close(self) -> None:
+        """Seal every open volume; blocks until all shards have finished."""
+        if not self._queues:
+            self._seal(0)
+            return
+        for shard_queue in self._queues:
+            shard_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _worker(self, shard: int, shard_queue: queue.Queue) -> None:
+        while True:
+            entry = shard_queue.get()
+            if entry is None:
+                self._seal(shard)
+                return
+            self._add(shard, entry)
+
+    def _open(self, shard: int) -> ArchiveVolume:
+        self._sequence[shard] += 1
+        name = f"{APP_NAME}-{self._stamp}-{shard:02d}-{self._sequence[shard]:05d}.tar.{self.archive_format}"
+        volume = ArchiveVolume(os.path.join(self.directory, name), self.archive_format)
+        self._volumes[shard] = volume
+        return volume
+
+    def _add(self, shard: int, entry: FileEntry) -> None:
+        try:
+            volume = self._volumes[shard] or self._open(shard)
+        except OSError as error:
+            self.logger.error(f"Could not create archive volume in {self.directory}: {error}")
+            self.on_failed([entry], error)
+            return
+        try:
+            volume.add(entry)
+        except ArchiveVolumeError as error:
+            self.logger.error(f"Archive volume failed, keeping its files: {volume.path}")
+            volume.abandon()
+            self._volumes[shard] = None
+            self.on_failed(volume.members + [entry], error.__cause__ or error)
+            return
+        except OSError as error:
+            self.logger.debug(f"Error archiving: {entry.path}: {error}")
+            self.on_failed([entry], error)
+            return
+        if volume.bytes_in >= self.volume_size:
+            self._seal(shard)
+
+    def _seal(self, shard: int) -> None:
+        volume = self._volumes[shard]
+        if volume is None:
+            return
+        self._volumes[shard] = None
+        try:
+            volume.seal()
+        except OSError as error:
+            self.logger.error(f"Error sealing archive volume, keeping its files: {volume.path}")
+            self.on_failed(volume.members, error)
+            return
+        self.logger.info(f"Archived {len(volume.members)} files ({format_bytes(volume.bytes_in)}) to {volume.path}")
+        self.on_sealed(volume.members)
+
+
+def is_transient(error: OSError) -> bool:
+    """Return True for errors that usually clear on their own, such as a file locked for a moment."""
+    if getattr(error, 'winerror', None) in TRANSIENT_WINERRORS:
+        return True
+    return error.errno in TRANSIENT_ERRNOS
+
+
+def error_name(error: OSError) -> str:
+    winerror = getattr(error, 'winerror', None)
+    if winerror is not None:
+        return f"WinError {winerror}"
+    if error.errno is None:
+        return type(error).__name__
+    return errno.errorcode.get(error.errno, str(error.errno))
+
+
+class RetryQueue:
+    """
+    Retry transient failures on a background thread with exponential backoff.
+
+    Entries wait in a heap ordered by their next attempt time, so the main delete
+    stream never sleeps. Attempt n (counting from 1) waits delay * 2 ** (n - 1)
+    seconds, capped at max_delay. on_success(entry) or on_failure(entry, error)
+    is called from the retry thread once the entry is settled.
+    """
+
+    def __init__(self, action, on_success, on_failure, retries: int = 5, delay: float = 0.5,
+                 max_delay: float = 30.0):
+        self.action = action
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.retries = retries
+        self.delay = delay
+        self.max_delay = max_delay
+        self._heap = []
+        self._sequence = 0
+        self._closing = False
+        self._deadline = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, entry, error: OSError, attempt: int = 1) -> None:
+        if attempt > self.retries:
+            self.on_failure(entry, error)
+            return
+        due = time.monotonic() + min(self.delay * 2 ** (attempt - 1), self.max_delay)
+        with self._condition:
+            self._sequence += 1
+            heapq.heappush(self._heap, (due, self._sequence, attempt, entry, error))
+            self._condition.notify()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Wait for pending retries; entries still waiting after timeout fail with their last error."""
+        with self._condition:
+            self._closing = True
+            if timeout is not None:
+                self._deadline = time.monotonic() + timeout
+            self._condition.notify()
+        self._thread.join()
+
+    def _next(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                expired = self._deadline is not None and now >= self._deadline
+                if self._heap and (expired or self._heap[0][0] <= now):
+                    return heapq.heappop(self._heap), expired
+                if self._closing and not self._heap:
+                    return None, expired
+                wake = [due for due in (self._heap[0][0] if self._heap else None, self._deadline) if due is not None]
+                self._condition.wait(min(wake) - now if wake else None)
+
+    def _run(self) -> None:
+        while True:
+            item, expired = self._next()
+            if item is None:
+                return
+            _, _, attempt, entry, error = item
+            if expired:
+                self.on_failure(entry, error)
+                continue
+            try:
+                self.action(entry)
+            except OSError as retry_error:
+                if is_transient(retry_error):
+                    self.submit(entry, retry_error, attempt + 1)
+                else:
+                    self.on_failure(entry, retry_error)
+            else:
+                self.on_success(entry)
+
+
+class JournalRecord(NamedTuple):
+    """One deletion read back from a DeletionJournal."""
+    removed_at: float
+    path: str
+    size: int
+    mtime: float
+    files: int
+    kind: str
+
+
+class DeletionJournal:
+    """
+    Append-only binary journal of deletions, written through memory maps.
+
+    <journal> holds a header and fixed-size records; <journal>.str holds the
+    UTF-8 paths the records point into. The header's committed record count is
+    only advanced after both maps have been msync'ed, so records appended after
+    the last sync are ignored (and overwritten) after a crash. Syncs happen every
+    sync_interval seconds and on close(). Appending is thread-safe, but only one
+    process may write a journal at a time.
+    """
+
+    HEADER = struct.Struct('<8sQQ')
+    RECORD = struct.Struct('<ddqQIIB3x')
+    MAGIC = b'ACGJRNL1'
+    KINDS = ('removed', 'archived', 'directory')
+    INITIAL_SIZE = 1024 * 1024
+
+    def __init__(self, path: str, sync_interval: float = 1.0):
+        self.path = path
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._records = self._map(path, self.HEADER.size)
+        self._strings = self._map(path + '.str', 0)
+        magic, count, strings_used = self.HEADER.unpack_from(self._records[0])
+        if magic != self.MAGIC:
+            if magic.strip(b'\0'):
+                raise ValueError(f"Not a deletion journal: {path}")
+            count = strings_used = 0
+            self.HEADER.pack_into(self._records[0], 0, self.MAGIC, 0, 0)
+        self._count = self._committed = count
+        self._strings_used = self._strings_committed = strings_used
+        self._last_sync = time.monotonic()
+
+    def _map(self, path: str, minimum: int) -> list:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        size = max(os.fstat(fd).st_size, self.INITIAL_SIZE, minimum)
+        os.ftruncate(fd, size)
+        return [mmap.mmap(fd, size), fd, size]
+
+    @staticmethod
+    def _ensure(region: list, needed: int) -> None:
+        if needed <= region[2]:
+            return
+        size = region[2]
+        while size < needed:
+            size *= 2
+        region[0].close()
+        os.ftruncate(region[1], size)
+        region[0] = mmap.mmap(region[1], size)
+        region[2] = size
+
+    def append(self, path: str, size: int = 0, mtime: float = 0.0, kind: str = 'removed', files: int = 1) -> None:
+        encoded = path.encode('utf-8', 'surrogateescape')
+        with self._lock:
+            offset = self._strings_used
+            self._ensure(self._strings, offset + len(encoded))
+            self._strings[0][offset:offset + len(encoded)] = encoded
+            self._strings_used += len(encoded)
+            position = self.HEADER.size + self._count * self.RECORD.size
+            self._ensure(self._records, position + self.RECORD.size)
+            self.RECORD.pack_into(self._records[0], position, time.time(), mtime, size, offset, len(encoded),
+                                  files, self.KINDS.index(kind))
+            self._count += 1
+            if time.monotonic() - self._last_sync >= self.sync_interval:
+                self._sync()
+
+    def sync(self) -> None:
+        with self._lock:
+            self._sync()
+
+    def _sync(self) -> None:
+        if self._count != self._committed:
+            self._strings[0].flush()
+            self._records[0].flush()
+            self.HEADER.pack_into(self._records[0], 0, self.MAGIC, self._count, self._strings_used)
+            self._records[0].flush(0, mmap.PAGESIZE)
+            self._committed = self._count
+            self._strings_committed = self._strings_used
+        self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        with self._lock:
+            self._sync()
+            used = (self.HEADER.size + self._count * self.RECORD.size, self._strings_used)
+            for region, size in zip((self._records, self._strings), used):
+                region[0].close()
+                os.ftruncate(region[1], size)
+                os.close(region[1])
+
+    @classmethod
+    def read(cls, path: str, since: Optional[float] = None, until: Optional[float] = None,
+             prefix: Optional[str] = None) -> Iterator[JournalRecord]:
+        """
+        Yield committed records, optionally limited to a removal time range and path prefix.
+
+        Args:
+            path: Journal file
+            since: Only records removed at or after this POSIX timestamp
+            until: Only records removed before this POSIX timestamp
+            prefix: Only records whose path starts with this prefix
+        """
+        encoded_prefix = None if prefix is None else prefix.encode('utf-8', 'surrogateescape')
+        with open(path, 'rb') as records_file, open(path + '.str', 'rb') as strings_file:
+            header = records_file.read(cls.HEADER.size)
+            magic, count, _ = cls.HEADER.unpack(header)
+            if magic != cls.MAGIC:
+                raise ValueError(f"Not a deletion journal: {path}")
+            if not count:
+                return
+            with mmap.mmap(records_file.fileno(), 0, access=mmap.ACCESS_READ) as records, \
+                    mmap.mmap(strings_file.fileno(), 0, access=mmap.ACCESS_READ) as strings:
+                body = memoryview(records)[cls.HEADER.size:cls.HEADER.size + count * cls.RECORD.size]
+                try:
+                    for removed_at, mtime, size, offset, length, files, kind in cls.RECORD.iter_unpack(body):
+                        if since is not None and removed_at < since or until is not None and removed_at >= until:
+                            continue
+                        raw = strings[offset:offset + length]
+                        if encoded_prefix is not None and not raw.startswith(encoded_prefix):
+                            continue
+                        yield JournalRecord(removed_at, raw.decode('utf-8', 'surrogateescape'), size, mtime,
+                                            files, cls.KINDS[kind])
+                finally:
+                    body.release()
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[float]:
+    """Parse an ISO date or date-time (local time) into a POSIX timestamp."""
+    if value is None:
+        return None
+    return datetime.fromisoformat(value).timestamp()
+
+
+def query_journal(cmd_args: dict) -> int:
+    """Print journal records matching --since/--until/--prefix as tab-separated lines."""
+    records = DeletionJournal.read(cmd_args['<journal>'], since=parse_timestamp(cmd_args['--since']),
+                                   until=parse_timestamp(cmd_args['--until']), prefix=cmd_args['--prefix'])
+    count = 0
+    for record in records:
+        removed_at = datetime.fromtimestamp(record.removed_at).isoformat(timespec='seconds')
+        print(f"{removed_at}\t{record.kind}\t{record.files}\t{record.size}\t{record.path}")
+        count += 1
+    return count
+
+
+class Coordinator:
+    """
+    Base class for sharing one root between several hosts.
+
+    acquire() decides whether this host should run, owns(name) whether it is
+    responsible for a top-level entry of the root, and release() gives the claim
+    up. While acquired, a daemon thread calls renew() every ttl / 3 seconds;
+    lost turns True if the claim is taken away, and the run must then stop.
+    Expiry times are wall-clock timestamps, so hosts need roughly synchronised
+    clocks (well within the TTL).
+    """
+
+    def __init__(self, root: str, host_id: Optional[str] = None, ttl: float = 60.0, logger=None):
+        self.root = root
+        self.host_id = host_id or socket.gethostname()
+        self.ttl = ttl
+        self.logger = logger or logging.getLogger(APP_NAME)
+        self.token = f"{self.host_id}:{os.getpid()}:{uuid.uuid4().hex}"
+        self._stop = threading.Event()
+        self._lost = threading.Event()
+        self._heartbeat = None
+
+    @property
+    def lost(self) -> bool:
+        return self._lost.is_set()
+
+    def acquire(self) -> bool:
+        raise NotImplementedError
+
+    def owns(self, name: str) -> bool:
+        return True
+
+    def renew(self) -> None:
+        raise NotImplementedError
+
+    def release(self) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def _start_heartbeat(self) -> None:
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._beat, daemon=True)
+        self._heartbeat.start()
+
+    def _beat(self) -> None:
+        while not self._stop.wait(self.ttl / 3):
+            try:
+                self.renew()
+            except OSError as error:
+                self.logger.warning(f"Coordination heartbeat failed: {error}")
+
+    def _claim(self) -> dict:
+        return {'host': self.host_id, 'token': self.token, 'expires': time.time() + self.ttl}
+
+    @staticmethod
+    def _read_claim(path: str) -> Optional[dict]:
+        try:
+            with open(path, 'r', encoding='utf-8') as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_claim(path: str, claim: dict) -> None:
+        """Atomically replace a claim file."""
+        temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as handle:
+            json.dump(claim, handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temporary, path)
+
+
+class LeaseCoordinator(Coordinator):
+    """
+    Elect a single runner per root through a lease file on the shared filesystem.
+
+    The lease is created with O_CREAT | O_EXCL, which is atomic on local disks,
+    NFSv3+ and SMB. An expired lease is taken over by renaming it aside (only one
+    host can win the rename) and creating a fresh one.
+    """
+
+    LEASE_NAME = f'.{APP_NAME}.lease'
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.root, self.LEASE_NAME)
+
+    def acquire(self) -> bool:
+        for _ in range(2):
+            if self._create():
+                self._start_heartbeat()
+                return True
+            current = self._read_claim(self.path)
+            if self._expires(current) > time.time():
+                self.logger.info(f"Lease on {self.root} is held by {current.get('host')}; skipping this run.")
+                return False
+            self._break(current)
+        return False
+
+    def _expires(self, claim: Optional[dict]) -> float:
+        if claim is not None:
+            return claim.get('expires', 0)
+        # Unreadable: possibly still being written by its creator, so judge by its age
+        try:
+            return os.stat(self.path).st_mtime + self.ttl
+        except OSError:
+            return 0
+
+    def _create(self) -> bool:
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as handle:
+            json.dump(self._claim(), handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        return True
+
+    def _break(self, expired: Optional[dict]) -> None:
+        aside = f"{self.path}.{uuid.uuid4().hex}.stale"
+        try:
+            os.rename(self.path, aside)
+        except OSError:
+            return
+        moved = self._read_claim(aside)
+        if moved is not None and expired is not None and moved.get('token') != expired.get('token'):
+            # Another host renewed or replaced the lease after we read it; put theirs back
+            try:
+                os.rename(aside, self.path)
+            except OSError:
+                pass
+            return
+        self.logger.info(f"Took over expired lease on {self.root} from {(expired or {}).get('host')}.")
+        try:
+            os.remove(aside)
+        except OSError:
+            pass
+
+    def renew(self) -> None:
+        current = self._read_claim(self.path)
+        if current is None or current.get('token') != self.token:
+            self.logger.warning(f"Lease on {self.root} was lost; stopping this run.")
+            self._lost.set()
+            self._stop.set()
+            return
+        self._write_claim(self.path, self._claim())
+
+    def release(self) -> None:
+        super().release()
+        current = self._read_claim(self.path)
+        if current is not None and current.get('token') == self.token:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class ShardCoordinator(Coordinator):
+    """
+    Split the top-level entries of a root between every live host.
+
+    Each host keeps a membership file with an expiry in <root>/.ACG-FolderClean.members.
+    Entries are assigned by rendezvous (highest random weight) hashing over the
+    live members, so every entry has exactly one owner for a given membership and
+    a host joining or leaving only moves the entries it gains or gives up.
+
+    After registering, a host waits settle seconds for its peers to register,
+    then fixes the membership for the run and publishes it in its own claim.
+    A host that arrives after a running group fixed a membership without it
+    adopts nothing and skips the run, so no entry is ever cleaned twice; hosts
+    should start within settle seconds of each other to share the work.
+    """
+
+    MEMBERS_NAME = f'.{APP_NAME}.members'
+
+    def __init__(self, root: str, host_id: Optional[str] = None, ttl: float = 60.0, logger=None,
+                 settle: float = DEFAULT_SHARD_SETTLE):
+        super().__init__(root, host_id, ttl, logger)
+        self.settle = settle
+        self.members = []
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.root, self.MEMBERS_NAME, self.host_id)
+
+    def acquire(self) -> bool:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._write_claim(self.path, self._claim())
+        self._start_heartbeat()
+        if self.settle:
+            time.sleep(self.settle)
+        claims = self.live_claims()
+        # Membership already fixed by hosts that are running takes precedence over who is alive now
+        settled = sorted((claim.get('host', ''), claim['members']) for claim in claims if claim.get('members'))
+        if settled and self.host_id not in settled[0][1]:
+            self.logger.info(f"{self.root} is being cleaned by {', '.join(settled[0][1])}, which started "
+                             f"without this host; skipping this run.")
+            self.release()
+            return False
+        members = settled[0][1] if settled else sorted({self.host_id} | {claim.get('host') for claim in claims})
+        self.members = list(members)
+        self._write_claim(self.path, self._claim())
+        self.logger.info(f"Sharing {self.root} with {len(self.members)} hosts: {', '.join(self.members)}")
+        return True
+
+    def live_claims(self) -> list:
+        directory = os.path.dirname(self.path)
+        now = time.time()
+        claims = []
+        for name in os.listdir(directory):
+            if name.endswith('.tmp'):
+                continue
+            claim = self._read_claim(os.path.join(directory, name))
+            if claim is not None and claim.get('expires', 0) > now:
+                claim.setdefault('host', name)
+                claims.append(claim)
+        return claims
+
+    def live_members(self) -> list:
+        return sorted({self.host_id} | {claim['host'] for claim in self.live_claims()})
+
+    def _claim(self) -> dict:
+        claim = super()._claim()
+        if self.members:
+            claim['members'] = self.members
+        return claim
+
+    @staticmethod
+    def weight(member: str, name: str) -> bytes:
+        return hashlib.blake2b(f"{member}\0{name}".encode('utf-8', 'surrogateescape'), digest_size=8).digest()
+
+    def owns(self, name: str) -> bool:
+        return max(self.members, key=lambda member: self.weight(member, name)) == self.host_id
+
+    def renew(self) -> None:
+        self._write_claim(self.path, self._claim())
+
+    def release(self) -> None:
+        super().release()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+@dataclass
+class Estimate:
+    """
+    Extrapolated outcome of a cleanup, from estimate_cleanup().
+
+    files, matched, expired and bytes_expired are (estimate, low, high) tuples,
+    the bounds being a 95% confidence interval over the probes. age_buckets
+    maps AGE_BUCKETS labels to the estimated number of matching files.
+    """
+    probes: int = 0
+    dirs_listed: int = 0
+    files_sampled: int = 0
+    elapsed: float = 0.0
+    files: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+    matched: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+    expired: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+    bytes_expired: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+    age_buckets: Dict[str, float] = field(default_factory=dict)
+
+
+def _interval(samples: list) -> Tuple[float, float, float]:
+    """Mean of the per-probe estimates with a normal 95% confidence interval."""
+    count = len(samples)
+    if not count:
+        return 0.0, 0.0, 0.0
+    mean = sum(samples) / count
+    if count < 2:
+        return mean, mean, mean
+    variance = sum((sample - mean) ** 2 for sample in samples) / (count - 1)
+    margin = 1.96 * (variance / count) ** 0.5
+    return mean, max(mean - margin, 0.0), mean + margin
+
+
+def estimate_cleanup(expression: str, cutoff: float, keep=None, probes: int = DEFAULT_ESTIMATE_PROBES,
+                     sample: int = 20, max_runtime: Optional[float] = None, seed=None) -> Estimate:
+    """
+    Estimate what a cleanup would delete from random probes instead of a full scan.
+
+    Each probe walks from the root to a leaf, choosing one subdirectory at
+    random at every level, and adds every directory it passes weighted by the
+    product of the branching factors above it (Knuth's tree-size estimator), so
+    the average over probes is an unbiased estimate of the tree totals. In each
+    directory at most sample matching files are stat'ed and scaled up. Listings
+    and samples are reused across probes, so the upper levels cost one listing.
+
+    Args:
+        expression: Glob expression, as for ExpressionScanner
+        cutoff: Files with an mtime before this timestamp are expired
+        keep: Optional predicate on an expired file's mtime that keeps it anyway (-e)
+        probes: Number of root-to-leaf probes
+        sample: Files stat'ed per directory
+        max_runtime: Stop probing after this many seconds
+        seed: Seed for the random choices, for repeatable estimates
+
+    Returns:
+        Estimate with confidence intervals and an age distribution
+    """
+    scanner = ExpressionScanner(expression)
+    rng = random.Random(seed)
+    started = time.monotonic()
+    summaries = {}
+    result = Estimate()
+    totals = {'files': [], 'matched': [], 'expired': [], 'bytes_expired': []}
+    buckets = dict.fromkeys((label for label, _ in AGE_BUCKETS), 0.0)
+    now = time.time()
+
+    def summarize(directory: str, relative: str, depth: int) -> dict:
+        try:
+            with os.scandir(directory or os.curdir) as it:
+                dir_entries = list(it)
+        except OSError:
+            dir_entries = []
+        result.dirs_listed += 1
+        files = []
+        subdirs = []
+        count = 0
+        for dir_entry in dir_entries:
+            try:
+                is_dir = dir_entry.is_dir()
+                if is_dir and dir_entry.is_symlink():
+                    continue
+            except OSError:
+                continue
+            relative_path = relative + dir_entry.name
+            if is_dir:
+                if scanner._descend(depth, dir_entry.name):
+                    subdirs.append((dir_entry.path, relative_path + '/'))
+                continue
+            count += 1
+            if scanner.matches(relative_path):
+                files.append(dir_entry)
+        picked = rng.sample(files, min(sample, len(files)))
+        scale = len(files) / len(picked) if picked else 0.0
+        summary = {'files': count, 'matched': len(files), 'expired': 0.0, 'bytes_expired': 0.0,
+                   'ages': dict.fromkeys(buckets, 0.0), 'subdirs': subdirs}
+        for dir_entry in picked:
+            try:
+                _stat = dir_entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            result.files_sampled += 1
+            summary['ages'][age_bucket((now - _stat.st_mtime) / 86400)] += scale
+            if _stat.st_mtime < cutoff and not (keep is not None and keep(_stat.st_mtime)):
+                summary['expired'] += scale
+                summary['bytes_expired'] += scale * _stat.st_size
+        return summary
+
+    root = scanner.root
+    for _ in range(probes):
+        if max_runtime is not None and time.monotonic() - started >= max_runtime:
+            break
+        directory, relative, depth, weight = root, '', 0, 1.0
+        probe = dict.fromkeys(totals, 0.0)
+        while True:
+            summary = summaries.get(directory)
+            if summary is None:
+                summary = summaries[directory] = summarize(directory, relative, depth)
+            for key in totals:
+                probe[key] += weight * summary[key]
+            for label, count in summary['ages'].items():
+                buckets[label] += weight * count
+            if not summary['subdirs']:
+                break
+            weight *= len(summary['subdirs'])
+            directory, relative = rng.choice(summary['subdirs'])
+            depth += 1
+        for key, value in probe.items():
+            totals[key].append(value)
+        result.probes += 1
+
+    for key, samples in totals.items():
+        setattr(result, key, _interval(samples))
+    result.age_buckets = {label: count / max(result.probes, 1) for label, count in buckets.items()}
+    result.elapsed = time.monotonic() - started
+    return result
+
+
+def format_estimate(estimate: Estimate) -> list:
+    """Render an Estimate as report lines."""
+    def count(interval):
+        value, low, high = interval
+        return f"~{value:,.0f} (95% CI {low:,.0f} - {high:,.0f})"
+
+    value, low, high = estimate.bytes_expired
+    lines = [
+        f"Estimate from {estimate.probes} probes, {estimate.dirs_listed} directories listed and "
+        f"{estimate.files_sampled} files stat'ed in {estimate.elapsed:.1f} seconds:",
+        f"  Files in tree:     {count(estimate.files)}",
+        f"  Matching files:    {count(estimate.matched)}",
+        f"  Files to delete:   {count(estimate.expired)}",
+        f"  Space to reclaim:  ~{format_bytes(value)} (95% CI {format_bytes(low)} - {format_bytes(high)})",
+        "  Age of matching files: " + ', '.join(f"{label} ~{value:,.0f}"
+                                                 for label, value in estimate.age_buckets.items()),
+    ]
+    return lines
+
+
+class CapacityReport:
+    """
+    Aggregate a stream of entries into a capacity and retention report.
+
+    Every entry lands in fixed histograms: age by day (0-30 days), week (0-12
+    weeks) and month (0-23 months), each with an overflow bucket, and size
+    buckets (SIZE_BUCKETS). Subtrees at depth components below root are
+    ranked by bytes with a weighted Space-Saving summary of at most 10 * top
+    counters, so memory is constant however many directories there are; a
+    subtree evicted and seen again may be over-counted by up to the smallest
+    tally, which only affects the tail of the ranking. Entries older than
+    cutoff (and not kept) are also tallied as expired. observe() passes
+    entries through unchanged, so a report can ride along a real cleanup.
+    """
+
+    DAYS = 31
+    WEEKS = 13
+    MONTHS = 24
+
+    def __init__(self, root: str = '', cutoff: Optional[float] = None, keep=None, top: int = 20, depth: int = 1,
+                 now: Optional[float] = None):
+        self.root = root
+        self.cutoff = cutoff
+        self.keep = keep
+        self.top = top
+        self.depth = depth
+        self.now = time.time() if now is None else now
+        self.files = 0
+        self.bytes = 0
+        self.expired_files = 0
+        self.expired_bytes = 0
+        self.by_day = [[0, 0] for _ in range(self.DAYS + 1)]
+        self.by_week = [[0, 0] for _ in range(self.WEEKS + 1)]
+        self.by_month = [[0, 0] for _ in range(self.MONTHS + 1)]
+        self.by_size = [[0, 0] for _ in SIZE_BUCKETS]
+        self._subtrees = {}
+        self._capacity = max(top * 10, 100)
+        self._prefix = root if not root or root.endswith(os.sep) else root + os.sep
+        self._size_limits = [limit for _, limit in SIZE_BUCKETS if limit is not None]
+
+    def observe(self, entries: Iterable) -> Iterator:
+        """Yield entries unchanged while adding each one to the report."""
+        for entry in entries:
+            self.add(entry)
+            yield entry
+
+    def add(self, entry) -> None:
+        if isinstance(entry, Subtree):
+            # Only fully expired directories are collapsed; their files' ages and sizes are not known one by one
+            files, size = entry.files, entry.size
+            if self.cutoff is not None:
+                self.expired_files += files
+                self.expired_bytes += size
+        else:
+            files, size = 1, entry.size
+            days = max(self.now - entry.mtime, 0) / 86400
+            for histogram, unit in ((self.by_day, 1), (self.by_week, 7), (self.by_month, 30.44)):
+                bucket = histogram[min(int(days / unit), len(histogram) - 1)]
+                bucket[0] += 1
+                bucket[1] += size
+            bucket = self.by_size[bisect.bisect_right(self._size_limits, size)]
+            bucket[0] += 1
+            bucket[1] += size
+            if self.cutoff is not None and entry.mtime < self.cutoff and not (self.keep and self.keep(entry.mtime)):
+                self.expired_files += 1
+                self.expired_bytes += size
+        self.files += files
+        self.bytes += size
+        self._count_subtree(self._subtree(entry.path), files, size)
+
+    def _subtree(self, path: str) -> str:
+        if self._prefix and path.startswith(self._prefix):
+            path = path[len(self._prefix):]
+        parts = path.split(os.sep, self.depth)
+        return os.sep.join(parts[:self.depth]) if len(parts) > self.depth else '.'
+
+    def _count_subtree(self, name: str, files: int, size: int) -> None:
+        counter = self._subtrees.get(name)
+        if counter is None:
+            if len(self._subtrees) >= self._capacity:
+                smallest = min(self._subtrees, key=lambda key: self._subtrees[key][1])
+                evicted = self._subtrees.pop(smallest)
+                counter = [evicted[0], evicted[1]]
+            else:
+                counter = [0, 0]
+            self._subtrees[name] = counter
+        counter[0] += files
+        counter[1] += size
+
+    def to_dict(self) -> dict:
+        def buckets(histogram, unit):
+            labels = [f'{i}{unit}' for i in range(len(histogram) - 1)] + [f'>={len(histogram) - 1}{unit}']
+            return [{'bucket': label, 'files': files, 'bytes': size} for label, (files, size) in zip(labels, histogram)]
+
+        ranked = sorted(self._subtrees.items(), key=lambda item: -item[1][1])[:self.top]
+        return {
+            'root': self.root,
+            'generated': datetime.fromtimestamp(self.now).isoformat(timespec='seconds'),
+            'files': self.files,
+            'bytes': self.bytes,
+            'expired_files': self.expired_files,
+            'expired_bytes': self.expired_bytes,
+            'age_days': buckets(self.by_day, 'd'),
+            'age_weeks': buckets(self.by_week, 'w'),
+            'age_months': buckets(self.by_month, 'm'),
+            'sizes': [{'bucket': label, 'files': files, 'bytes': size}
+                      for (label, _), (files, size) in zip(SIZE_BUCKETS, self.by_size)],
+            'top_subtrees': [{'bucket': name, 'files': files, 'bytes': size} for name, (files, size) in ranked],
+        }
+
+    def write(self, path: str) -> None:
+        """Write the report as CSV when path ends in .csv, otherwise as JSON."""
+        report = self.to_dict()
+        temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temporary, 'w', encoding='utf-8', newline='') as handle:
+            if path.lower().endswith('.csv'):
+                writer = csv.writer(handle)
+                writer.writerow(['section', 'bucket', 'files', 'bytes'])
+                writer.writerow(['total', 'all', report['files'], report['bytes']])
+                writer.writerow(['total', 'expired', report['expired_files'], report['expired_bytes']])
+                for section in ('age_days', 'age_weeks', 'age_months', 'sizes', 'top_subtrees'):
+                    for row in report[section]:
+                        writer.writerow([section, row['bucket'], row['files'], row['bytes']])
+            else:
+                json.dump(report, handle, indent=2)
+        os.replace(temporary, path)
+
+
+class ProgressReporter:
+    """
+    Report a running cleanup's progress at a fixed interval from a background thread.
+
+    Nothing is added to the per-file path: the reporter samples the counters the
+    run keeps anyway (the CleanupResult and the scan source's dirs_scanned), so
+    plain integer reads are all it costs. Each report shows directories and
+    files scanned, files matched and deleted, bytes freed, the delete rate over
+    the last interval and, once the scan has finished or total is known (e.g.
+    --max-deletes), an ETA. Reports go to stream, one line each (rewritten in
+    place on a terminal), and/or atomically to a JSON status_file.
+    """
+
+    def __init__(self, result: CleanupResult, interval: float = 5.0, stream=None,
+                 status_file: Optional[str] = None, total: Optional[int] = None):
+        self.result = result
+        self.interval = interval
+        self.stream = stream
+        self.status_file = status_file
+        self.total = total
+        self.source = None
+        self.scan_done = False
+        self._started = time.monotonic()
+        self._last = (self._started, 0)
+        self._rate = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> 'ProgressReporter':
+        self._thread = threading.Thread(target=self._run, name=f'{APP_NAME}-progress', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the reporter after writing a final report."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.report(final=True)
+
+    def snapshot(self) -> dict:
+        """Return the current counters, delete rate (files per second) and ETA in seconds."""
+        result = self.result
+        now = time.monotonic()
+        removed = result.removed
+        last_time, last_removed = self._last
+        if now - last_time >= self.interval / 2:
+            self._rate = (removed - last_removed) / (now - last_time)
+            self._last = (now, removed)
+        remaining = None
+        if self.total is not None:
+            remaining = max(min(self.total, result.matched) - removed, 0) if self.scan_done else self.total - removed
+        elif self.scan_done:
+            remaining = max(result.matched - removed - result.errors, 0)
+        eta = None
+        if remaining is not None and self._rate > 0:
+            eta = remaining / self._rate
+        return {
+            'dirs_scanned': self.source.dirs_scanned if self.source is not None else 0,
+            'scanned': result.scanned,
+            'matched': result.matched,
+            'removed': removed,
+            'bytes_freed': result.bytes_freed,
+            'errors': result.errors,
+            'rate': round(self._rate, 1),
+            'eta_seconds': None if eta is None else round(eta),
+            'elapsed_seconds': round(now - self._started),
+            'scan_done': self.scan_done,
+        }
+
+    def report(self, final: bool = False) -> None:
+        status = self.snapshot()
+        status['state'] = 'finished' if final else 'running'
+        if self.stream is not None:
+            eta = status['eta_seconds']
+            line = (f"{status['dirs_scanned']:,} dirs, {status['scanned']:,} files scanned, "
+                    f"{status['matched']:,} matched, {status['removed']:,} deleted "
+                    f"({format_bytes(status['bytes_freed'])}), {status['rate']:,.0f} files/s, "
+                    f"ETA {'-' if eta is None else timedelta(seconds=eta)}")
+            interactive = getattr(self.stream, 'isatty', lambda: False)()
+            self.stream.write(f"\r{line}\033[K" + ('\n' if final else '') if interactive else line + '\n')
+            self.stream.flush()
+        if self.status_file:
+            status['updated'] = datetime.now().isoformat(timespec='seconds')
+            temporary = f"{self.status_file}.tmp"
+            try:
+                with open(temporary, 'w', encoding='utf-8') as handle:
+                    json.dump(status, handle, indent=2)
+                os.replace(temporary, self.status_file)
+            except OSError:
+                pass
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.report()
+
+
+class PipelineStage:
+    """
+    Run one pipeline stage on its own thread, handing items on through a bounded queue.
+
+    The producer thread blocks while the queue is full, so a slow consumer holds
+    back the stages feeding it. busy is the time the thread spent working,
+    excluding time blocked on the queue or on its upstream stage; waited is the
+    time the consumer spent blocked on this stage. close() stops the producer
+    early, e.g. when a budget ends the run.
+    """
+
+    _DONE = object()
+
+    def __init__(self, iterable: Iterable, depth: int = DEFAULT_PIPELINE_DEPTH,
+                 upstream: Optional['PipelineStage'] = None, name: str = 'stage'):
+        self.upstream = upstream
+        self.busy = 0.0
+        self.waited = 0.0
+        self._iterable = iterable
+        self._items = queue.Queue(maxsize=max(depth, 1))
+        self._stop = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._produce, name=f'{APP_NAME}-{name}', daemon=True)
+        self._thread.start()
+
+    def __iter__(self) -> Iterator:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = self._items.get(timeout=0.05)
+            except queue.Empty:
+                item = None
+            self.waited += time.perf_counter() - start
+            if item is None:
+                if self._stop.is_set():
+                    return
+                continue
+            if item is self._DONE:
+                if self._error is not None:
+                    raise self._error
+                return
+            yield item
+
+    def stop(self) -> None:
+        """Ask the producer to stop; consumers see the end of the stream."""
+        self._stop.set()
+
+    def close(self) -> None:
+        """Stop the producer and wait for its thread to finish."""
+        self._stop.set()
+        while self._thread.is_alive():
+            # Drain so a producer blocked on a full queue notices the stop
+            try:
+                self._items.get(timeout=0.05)
+            except queue.Empty:
+                pass
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._items.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self) -> None:
+        iterator = iter(self._iterable)
+        started = time.perf_counter()
+        blocked = 0.0
+        try:
+            while True:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                start = time.perf_counter()
+                handed_on = self._put(item)
+                blocked += time.perf_counter() - start
+                if not handed_on:
+                    break
+        except Exception as error:
+            self._error = error
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+            upstream_wait = self.upstream.waited if self.upstream is not None else 0.0
+            self.busy = time.perf_counter() - started - blocked - upstream_wait
+            self._put(self._DONE)
+
+
+@dataclass
+class CleanerConfig:
+    """Settings for one cleanup job; mirrors the command line options."""
+    expression: str = ''
+    age: float = 1
+    exclude_last_day: bool = False
+    base_dir: Optional[str] = None
+    follow_symlinks: bool = False
+    order: str = 'scan'
+    queue_size: int = DEFAULT_QUEUE_SIZE
+    max_deletes: Optional[int] = None
+    max_runtime: Optional[float] = None
+    archive_dir: Optional[str] = None
+    archive_format: str = 'gz'
+    volume_size: int = 1024 ** 3
+    archive_workers: int = 1
+    retries: int = 5
+    retry_delay: float = 0.5
+    source: Optional[str] = None
+    source_format: str = 'auto'
+    collapse_dirs: bool = False
+    journal: Optional[str] = None
+    coordinate: Optional[str] = None
+    host_id: Optional[str] = None
+    lease_ttl: float = 60.0
+    shard_settle: float = DEFAULT_SHARD_SETTLE
+    workers: int = 1
+    adaptive: bool = False
+    max_workers: int = 64
+    tuning_file: Optional[str] = None
+    fresh_cache: Optional[str] = None
+    cache_size: int = DEFAULT_CACHE_SIZE
+    pipeline_depth: int = 0
+    path_dates: bool = False
+    date_patterns: Tuple[str, ...] = DEFAULT_DATE_PATTERNS
+    progress_interval: Optional[float] = None
+    status_file: Optional[str] = None
+    estimate_probes: int = DEFAULT_ESTIMATE_PROBES
+    report: Optional[str] = None
+    report_only: bool = False
+    report_top: int = 20
+
+    def __post_init__(self):
+        if self.order not in ORDER_MODES:
+            raise ValueError(f"Invalid order '{self.order}'; expected one of: {', '.join(ORDER_MODES)}")
+        if self.archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Invalid archive format '{self.archive_format}'; "
+                             f"expected one of: {', '.join(ARCHIVE_FORMATS)}")
+        if self.source_format not in LISTING_FORMATS:
+            raise ValueError(f"Invalid listing format '{self.source_format}'; "
+                             f"expected one of: {', '.join(LISTING_FORMATS)}")
+        if self.coordinate not in (None,) + COORDINATION_MODES:
+            raise ValueError(f"Invalid coordination mode '{self.coordinate}'; "
+                             f"expected one of: {', '.join(COORDINATION_MODES)}")
+        if self.path_dates:
+            PathDates(self.date_patterns)
+            if self.collapse_dirs or self.source:
+                # Neither the collapsing walk nor a listing dates files by path; they would fall back to mtime
+                raise ValueError("--path-dates cannot be combined with --collapse-dirs or --source")
+        if self.report_only and not self.report:
+            raise ValueError("--report-only needs --report=<file>")
+        if self.report and (self.collapse_dirs or self.path_dates):
+            # Both skip stat'ing files or whole directories, which would leave them out of the report
+            raise ValueError("--report cannot be combined with --collapse-dirs or --path-dates")
+        if self.collapse_dirs and (self.order != 'scan' or self.archive_dir or self.source or self.follow_symlinks):
+            raise ValueError("Directory collapsing cannot be combined with --order, --archive, --source "
+                             "or --follow-symlinks")
+
+    @classmethod
+    def from_args(cls, cmd_args: dict) -> 'CleanerConfig':
+        """Build a config from docopt arguments."""
+        def optional(key, convert):
+            return None if cmd_args.get(key) is None else convert(cmd_args[key])
+
+        return cls(
+            expression=cmd_args['<expression>'],
+            age=int(cmd_args['<age>']),
+            exclude_last_day=cmd_args['-e'],
+            follow_symlinks=cmd_args['--follow-symlinks'],
+            order=cmd_args['--order'],
+            queue_size=int(cmd_args['--queue-size']),
+            max_deletes=optional('--max-deletes', int),
+            max_runtime=optional('--max-runtime', float),
+            archive_dir=cmd_args['--archive'],
+            archive_format=cmd_args['--archive-format'],
+            volume_size=int(float(cmd_args['--volume-size']) * 1024 * 1024),
+            archive_workers=int(cmd_args['--archive-workers']),
+            retries=int(cmd_args['--retries']),
+            retry_delay=float(cmd_args['--retry-delay']),
+            source=cmd_args['--source'],
+            source_format=cmd_args['--source-format'],
+            collapse_dirs=cmd_args['--collapse-dirs'],
+            journal=cmd_args['--journal'],
+            coordinate=cmd_args['--coordinate'],
+            host_id=cmd_args['--host-id'],
+            lease_ttl=float(cmd_args['--lease-ttl']),
+            shard_settle=float(cmd_args['--settle']),
+            workers=1 if cmd_args['--workers'] == 'auto' else int(cmd_args['--workers']),
+            adaptive=cmd_args['--workers'] == 'auto',
+            max_workers=int(cmd_args['--max-workers']),
+            fresh_cache=cmd_args['--fresh-cache'],
+            cache_size=int(cmd_args['--cache-size']),
+            pipeline_depth=optional('--pipeline', int) or 0,
+            path_dates=cmd_args['--path-dates'] or cmd_args['--date-pattern'] is not None,
+            date_patterns=(cmd_args['--date-pattern'],) if cmd_args['--date-pattern'] else DEFAULT_DATE_PATTERNS,
+            progress_interval=optional('--progress', float),
+            status_file=cmd_args['--status-file'],
+            estimate_probes=int(cmd_args['--probes']),
+            report=cmd_args['--report'],
+            report_only=cmd_args['--report-only'],
+            report_top=int(cmd_args['--report-top']),
+        )
+
+
+class Cleaner:
+    """
+    Reusable cleanup job for in-process callers.
+
+    A Cleaner keeps no global state and never changes the working directory;
+    relative expressions are resolved against config.base_dir. Each stage is a
+    generator, so scan(), plan() and execute() stream entries instead of
+    building lists, and separate Cleaner objects can run concurrently.
+
+    Example:
+        result = Cleaner(CleanerConfig('/var/log/app/**', age=30)).execute()
+    """
+
+    def __init__(self, config: CleanerConfig, logger: Optional[logging.Logger] = None,
+                 fresh_cache: Optional[FreshCache] = None):
+        self.config = config
+        self.logger = logger or logging.getLogger(APP_NAME)
+        # A FreshCache kept by the caller across runs, used instead of config.fresh_cache
+        self.fresh_cache = fresh_cache
+
+    @property
+    def expression(self) -> str:
+        expression = self.config.expression
+        if self.config.base_dir and not os.path.isabs(expression):
+            expression = os.path.join(self.config.base_dir, expression)
+        return expression
+
+    def cutoff(self) -> float:
+        return (datetime.now() - timedelta(days=self.config.age)).timestamp()
+
+    def keep(self, mtime: float) -> bool:
+        """Return True for an expired file that must be kept anyway (-e)."""
+        return self.config.exclude_last_day and is_month_end(mtime)
+
+    def open_source(self, owns=None, controller: Optional[ConcurrencyController] = None, stop=None) -> ScanSource:
+        """
+        Create the scan source for this job; override to plug in another backend.
+
+        Args:
+            owns: Optional predicate on the root's top-level entry names, used by --coordinate=shard
+            controller: Optional ConcurrencyController for a parallel directory walk
+            stop: Optional callable that returns True once the scan should end (--max-runtime)
+        """
+        if self.config.source:
+            return ListingSource(self.config.source, self.expression, self.config.source_format, include_top=owns,
+                                 stop=stop)
+        collapse = None
+        cache = None
+        path_dates = self.open_path_dates()
+        dating = path_dates.key if path_dates is not None else None
+        if self.config.collapse_dirs:
+            cutoff = self.cutoff()
+            collapse = lambda entry: not entry.is_link and entry.mtime < cutoff and not self.keep(entry.mtime)
+        elif self.config.report:
+            # The report must see every file, including those in directories the cache would skip
+            pass
+        elif self.fresh_cache is not None:
+            if self.fresh_cache.dating != dating:
+                raise ValueError("The fresh directory cache was built with a different --path-dates setting")
+            cache = self.fresh_cache
+            cache.cutoff = self.cutoff()
+        elif self.config.fresh_cache:
+            cache = FreshCache(self.config.fresh_cache, self.expression, self.cutoff(), self.config.cache_size,
+                               dating=dating)
+        return ExpressionScanner(self.expression, follow_symlinks=self.config.follow_symlinks, collapse=collapse,
+                                 include_top=owns, controller=controller, cache=cache, path_dates=path_dates,
+                                 stop=stop)
+
+    def open_path_dates(self) -> Optional[PathDates]:
+        """Create the PathDates selected by config.path_dates, or None to date files by mtime."""
+        if not self.config.path_dates:
+            return None
+        return PathDates(self.config.date_patterns, self.cutoff(), require_day=self.config.exclude_last_day)
+
+    def open_controller(self, stage: str) -> Optional[ConcurrencyController]:
+        """
+        Create the worker controller for the 'scan' or 'delete' stage, or None to run it serially.
+
+        With config.adaptive the starting point is the setting remembered for this root in
+        config.tuning_file, so later runs begin close to the best concurrency found so far.
+        """
+        config = self.config
+        if not config.adaptive and config.workers <= 1:
+            return None
+        initial = config.workers
+        if config.adaptive:
+            initial = load_tuning(config.tuning_file, self._root()).get(stage, DEFAULT_ADAPTIVE_WORKERS)
+        return ConcurrencyController(initial, maximum=config.max_workers, adaptive=config.adaptive)
+
+    def estimate(self, seed=None) -> Estimate:
+        """Estimate what execute() would delete by sampling the tree; config.max_runtime caps the time spent."""
+        if self.config.source:
+            raise ValueError("--estimate samples the directory tree and cannot be used with --source")
+        keep = self.keep if self.config.exclude_last_day else None
+        return estimate_cleanup(self.expression, self.cutoff(), keep=keep, probes=self.config.estimate_probes,
+                                max_runtime=self.config.max_runtime, seed=seed)
+
+    def open_report(self, required: bool = False) -> Optional[CapacityReport]:
+        """Create the capacity report requested by config.report (or always, with required)."""
+        if not self.config.report and not required:
+            return None
+        keep = self.keep if self.config.exclude_last_day else None
+        return CapacityReport(self._root(), cutoff=self.cutoff(), keep=keep, top=self.config.report_top)
+
+    def report(self) -> CapacityReport:
+        """Scan without deleting; the report is also written to config.report when set."""
+        report = self.open_report(required=True)
+        for _ in report.observe(self.scan()):
+            pass
+        if self.config.report:
+            report.write(self.config.report)
+            self.logger.info(f"Capacity report for {report.files} files ({format_bytes(report.bytes)}) "
+                             f"written to {self.config.report}.")
+        return report
+
+    def open_progress(self, result: CleanupResult) -> Optional[ProgressReporter]:
+        """Start the progress reporter requested by config.progress_interval or config.status_file."""
+        config = self.config
+        if config.progress_interval is None and not config.status_file:
+            return None
+        return ProgressReporter(result, interval=config.progress_interval or DEFAULT_PROGRESS_INTERVAL,
+                                stream=sys.stderr if config.progress_interval is not None else None,
+                                status_file=config.status_file, total=config.max_deletes).start()
+
+    def _root(self) -> str:
+        return ExpressionScanner(self.expression).root or os.curdir
+
+    def open_coordinator(self) -> Optional[Coordinator]:
+        """Create the multi-host coordinator selected by config.coordinate, if any."""
+        if not self.config.coordinate:
+            return None
+        root = self._root()
+        if self.config.coordinate == 'lease':
+            return LeaseCoordinator(root, host_id=self.config.host_id, ttl=self.config.lease_ttl, logger=self.logger)
+        return ShardCoordinator(root, host_id=self.config.host_id, ttl=self.config.lease_ttl, logger=self.logger,
+                                settle=self.config.shard_settle)
+
+    def scan(self, result: Optional[CleanupResult] = None, owns=None,
+             controller: Optional[ConcurrencyController] = None,
+             progress: Optional[ProgressReporter] = None, stop=None) -> Iterator[FileEntry]:
+        """Yield every file matching the expression; collapsed directories arrive as Subtree records."""
+        source = self.open_source(owns, controller, stop)
+        cache = getattr(source, 'cache', None)
+        hits = cache.hits if cache is not None else 0
+        if progress is not None:
+            progress.source = source
+        try:
+            for entry in source:
+                if result is not None:
+                    result.scanned += entry.files if isinstance(entry, Subtree) else 1
+                yield entry
+            if result is not None:
+                result.skipped_links += source.skipped_links
+                result.dated_files += source.dated_files
+                result.pruned_dirs += source.pruned_dirs
+            if progress is not None:
+                progress.scan_done = True
+        finally:
+            if cache is not None:
+                if result is not None:
+                    result.cached_dirs += cache.hits - hits
+                try:
+                    cache.save()
+                except OSError as error:
+                    self.logger.warning(f"Could not save fresh directory cache {cache.path}: {error}")
+
+    def plan(self, entries: Optional[Iterable] = None, result: Optional[CleanupResult] = None,
+             stop=None) -> Iterator[FileEntry]:
+        """
+        Yield the entries that should be removed, in deletion order.
+
+        Args:
+            entries: File paths or FileEntry objects; defaults to scan()
+            result: Optional CleanupResult whose counters are updated
+            stop: Optional callable that returns True once planning should end (--max-runtime)
+        """
+        if entries is None:
+            entries = self.scan(result, stop=stop)
+        candidates = expired_files(entries, self.cutoff())
+        if self.config.exclude_last_day:
+            candidates = (entry for entry in candidates if isinstance(entry, Subtree) or not self.keep(entry.mtime))
+        if self.config.order != 'scan':
+            candidates = prioritize(candidates, order=self.config.order, queue_size=self.config.queue_size,
+                                    stop=stop)
+        if self.config.source:
+            # Listing metadata may be out of date; check each candidate on disk just before it goes
+            candidates = confirm_expired(candidates, self.cutoff(), on_stale=self._stale_counter(result))
+        for entry in candidates:
+            if result is not None:
+                result.matched += entry.files if isinstance(entry, Subtree) else 1
+            yield entry
+
+    def _stale_counter(self, result: Optional[CleanupResult]):
+        def on_stale(entry: FileEntry) -> None:
+            if result is not None:
+                result.stale_listed += 1
+            self.logger.debug(f"Skipped {entry.path}: changed or gone since the listing was written")
+        return on_stale
+
+    def execute(self, entries: Optional[Iterable] = None, archiver: Optional[Archiver] = None) -> CleanupResult:
+        """
+        Remove (or archive, then remove) everything plan() yields.
+
+        Args:
+            entries: File paths or FileEntry objects; defaults to scan()
+            archiver: Archiver to use; one is created when config.archive_dir is set
+
+        Returns:
+            CleanupResult with counts, bytes freed, errors and per-stage timings
+        """
+        started = time.perf_counter()
+        result = CleanupResult()
+        # The runtime budget covers the whole run, so a slow scan that finds little cannot overrun it
+        deadline = None if self.config.max_runtime is None else time.monotonic() + self.config.max_runtime
+        coordinator = self.open_coordinator()
+        if coordinator is not None and not coordinator.acquire():
+            result.coordination_skipped = True
+            return result
+        stop = None
+        if deadline is not None or coordinator is not None:
+            # Ends the scan and plan stages once the time budget is spent or the coordination claim is lost
+            stop = lambda: ((deadline is not None and time.monotonic() >= deadline)
+                            or (coordinator is not None and coordinator.lost))
+        controllers = {}
+        stages = []
+        depth = self.config.pipeline_depth
+        progress = self.open_progress(result)
+        report = self.open_report()
+        try:
+            if entries is None:
+                owns = coordinator.owns if isinstance(coordinator, ShardCoordinator) else None
+                controllers['scan'] = self.open_controller('scan')
+                entries = self.scan(result, owns, controllers['scan'], progress, stop)
+                if report is not None:
+                    entries = report.observe(entries)
+                if depth:
+                    stages.append(PipelineStage(entries, depth, name='scan'))
+                    entries = stages[-1]
+                else:
+                    entries = self._timed(entries, result, 'scan')
+            if archiver is None and self.config.archive_dir:
+                archiver = Archiver(self.config.archive_dir, archive_format=self.config.archive_format,
+                                    volume_size=self.config.volume_size, workers=self.config.archive_workers,
+                                    logger=self.logger)
+            if depth:
+                upstream = entries if isinstance(entries, PipelineStage) else None
+                stages.append(PipelineStage(self.plan(entries, result, stop), depth, upstream=upstream, name='plan'))
+                candidates = stages[-1]
+            else:
+                candidates = self._timed(self.plan(entries, result, stop), result, 'plan')
+            if archiver is None:
+                controllers['delete'] = self.open_controller('delete')
+            self._remove(candidates, result, archiver, controllers.get('delete'), deadline, coordinator)
+        finally:
+            # Stop every stage first so none is left waiting on the one feeding it
+            for stage in stages:
+                stage.stop()
+            for stage in reversed(stages):
+                stage.close()
+            if progress is not None:
+                progress.stop()
+            if coordinator is not None:
+                coordinator.release()
+        if report is not None:
+            report.write(self.config.report)
+            self.logger.info(f"Capacity report written to {self.config.report}.")
+        if self.config.adaptive:
+            tuned = {stage: controller.best_limit for stage, controller in controllers.items() if controller}
+            result.workers = tuned
+            if tuned:
+                save_tuning(self.config.tuning_file, self._root(), tuned)
+
+        timings = result.timings
+        total = time.perf_counter() - started
+        if stages:
+            # Pipelined stages overlap; each timer is its own thread's working time
+            if len(stages) == 2:
+                timings['scan'] = stages[0].busy
+            timings['plan'] = stages[-1].busy
+            timings['delete'] = total - stages[-1].waited
+        else:
+            # Stage timers are inclusive of the stages feeding them; make them exclusive
+            timings['delete'] = total - timings.get('plan', 0.0)
+            timings['plan'] = timings.get('plan', 0.0) - timings.get('scan', 0.0)
+        timings['total'] = total
+        self._summarize(result)
+        return result
+
+    @staticmethod
+    def _timed(iterable: Iterable, result: CleanupResult, stage: str) -> Iterator:
+        iterator = iter(iterable)
+        result.timings.setdefault(stage, 0.0)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                result.timings[stage] += time.perf_counter() - start
+                return
+            result.timings[stage] += time.perf_counter() - start
+            yield item
+
+    def _remove(self, candidates: Iterable[FileEntry], result: CleanupResult, archiver: Optional[Archiver],
+                controller: Optional[ConcurrencyController] = None, deadline: Optional[float] = None,
+                coordinator: Optional[Coordinator] = None) -> None:
+        config = self.config
+        logger = self.logger
+        accounting = InodeAccounting()
+        lock = threading.Lock()
+        error_examples = {}
+        journal = DeletionJournal(config.journal) if config.journal else None
+        # With a journal as the audit trail or live progress, per-file log lines are only needed for debugging
+        quiet = journal is not None or config.progress_interval is not None
+        log_removed = logger.debug if quiet else logger.info
+        removed_kind = 'archived' if archiver is not None else 'removed'
+
+        def record_removed(entry: FileEntry, retried: bool = False) -> None:
+            with lock:
+                result.removed += 1
+                result.retried += retried
+                result.bytes_freed += accounting.freed(entry)
+            if journal is not None:
+                journal.append(entry.path, entry.size, entry.mtime, removed_kind)
+            log_removed(f"Removed: {entry.path}")
+
+        def record_error(entry: FileEntry, error: OSError) -> None:
+            if error.errno == errno.ECANCELED:
+                # A retry given up because the run was told to stop; the file was left alone on purpose
+                logger.debug(f"Not retried: {entry.path}: {error.strerror}")
+                return
+            if config.coordinate and isinstance(error, FileNotFoundError):
+                # Another host already removed it
+                with lock:
+                    result.vanished += 1
+                return
+            name = error_name(error)
+            with lock:
+                result.errors += 1
+                result.errors_by_errno[name] = result.errors_by_errno.get(name, 0) + 1
+                error_examples.setdefault(name, entry.path)
+            logger.debug(f"Error removing: {entry.path}: {error}")
+
+        retry_queue = None
+        # Deletes waiting in the retry queue; they count against --max-deletes until settled
+        retrying = [0]
+
+        def retry_remove(entry: FileEntry) -> None:
+            if coordinator is not None and coordinator.lost:
+                raise OSError(errno.ECANCELED, "Coordination claim lost", entry.path)
+            if config.max_deletes is not None and result.removed >= config.max_deletes:
+                raise OSError(errno.ECANCELED, "Delete budget reached", entry.path)
+            os.remove(entry.path)
+
+        def retry_settled(entry: FileEntry, error: Optional[OSError] = None) -> None:
+            with lock:
+                retrying[0] -= 1
+            if error is None:
+                record_removed(entry, retried=True)
+            else:
+                record_error(entry, error)
+
+        def retry_later(entry: FileEntry, error: OSError) -> None:
+            # The retry thread is only started once something actually needs it
+            nonlocal retry_queue
+            with lock:
+                retrying[0] += 1
+                if retry_queue is None:
+                    retry_queue = RetryQueue(retry_remove, on_success=retry_settled, on_failure=retry_settled,
+                                             retries=config.retries, delay=config.retry_delay)
+            retry_queue.submit(entry, error)
+
+        def remove_entry(entry: FileEntry) -> None:
+            if coordinator is not None and coordinator.lost:
+                # Queued work (pool, sealed archive volumes) must not outlive the claim
+                return
+            try:
+                os.remove(entry.path)
+            except OSError as error:
+                if config.retries > 0 and is_transient(error):
+                    retry_later(entry, error)
+                else:
+                    record_error(entry, error)
+                return
+            record_removed(entry)
+
+        def remove_subtree(subtree: Subtree, limit: Optional[int] = None) -> None:
+            if coordinator is not None and coordinator.lost:
+                return
+            outcome = remove_tree(subtree, self.cutoff(), keep=self.keep, limit=limit, deadline=deadline)
+            with lock:
+                result.removed += outcome.removed
+                result.bytes_freed += outcome.bytes_freed
+                result.collapsed_dirs += not outcome.stopped
+            if journal is not None and outcome.removed:
+                journal.append(subtree.path, outcome.bytes_freed, kind='directory', files=outcome.removed)
+            for path, error in outcome.errors:
+                record_error(FileEntry(path, 0), error)
+            removed = 'Partly removed directory (budget reached)' if outcome.stopped else 'Removed directory'
+            logger.info(f"{removed}: {subtree.path} ({outcome.removed} files, {format_bytes(outcome.bytes_freed)})")
+
+        def archive_failed(members: list, error: OSError) -> None:
+            for member in members:
+                record_error(member, error)
+
+        if archiver is not None:
+            archiver.on_sealed = lambda members: [remove_entry(member) for member in members]
+            archiver.on_failed = archive_failed
+        pool = None
+        if controller is not None:
+            pool = AdaptivePool(controller)
+
+            def timed(remove, entry) -> None:
+                started = time.perf_counter()
+                remove(entry)
+                controller.record(entry.files if isinstance(entry, Subtree) else 1, time.perf_counter() - started)
+
+        taken = 0
+        try:
+            for entry in candidates:
+                if config.max_deletes is not None and taken >= config.max_deletes:
+                    logger.info(f"Delete budget of {config.max_deletes} files reached; stopping.")
+                    break
+                if deadline is not None and time.monotonic() >= deadline:
+                    logger.info(f"Runtime budget of {config.max_runtime} seconds reached; stopping.")
+                    break
+                if coordinator is not None and coordinator.lost:
+                    break
+                # A collapsed directory may only use what is left of the delete budget
+                remaining = None if config.max_deletes is None else config.max_deletes - taken
+                if pool is not None:
+                    # Budgets count submitted work; the workers finish what is already queued
+                    if isinstance(entry, Subtree):
+                        pool.submit(timed, lambda subtree, limit=remaining: remove_subtree(subtree, limit), entry)
+                        taken += entry.files if remaining is None else min(entry.files, remaining)
+                    else:
+                        pool.submit(timed, remove_entry, entry)
+                        taken += 1
+                elif isinstance(entry, Subtree):
+                    remove_subtree(entry, remaining)
+                    taken = result.removed + retrying[0]
+                elif archiver is not None:
+                    archiver.submit(entry)
+                    taken += 1
+                else:
+                    remove_entry(entry)
+                    taken = result.removed + retrying[0]
+            else:
+                if deadline is not None and time.monotonic() >= deadline:
+                    logger.info(f"Runtime budget of {config.max_runtime} seconds reached while scanning; stopping.")
+        finally:
+            if pool is not None:
+                pool.close()
+            if archiver is not None:
+                archiver.close()
+            if retry_queue is not None:
+                remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+                retry_queue.close(timeout=remaining)
+            if journal is not None:
+                journal.close()
+        result.pinned_inodes = accounting.pinned_inodes
+        result.error_examples = error_examples
+
+    def _summarize(self, result: CleanupResult) -> None:
+        if result.removed > 0:
+            self.logger.info(f"Deleted {result.removed} files; freed {format_bytes(result.bytes_freed)}.")
+            if result.pinned_inodes:
+                self.logger.info(f"{result.pinned_inodes} hard-linked files are still referenced by other links.")
+        else:
+            self.logger.info("No files were deleted.")
+        if result.collapsed_dirs:
+            self.logger.info(f"{result.collapsed_dirs} fully expired directories were removed as a whole.")
+        if result.skipped_links:
+            self.logger.info(f"Skipped {result.skipped_links} symlinked directories.")
+        if result.dated_files or result.pruned_dirs:
+            self.logger.info(f"Dated {result.dated_files} files by their path; skipped {result.pruned_dirs} "
+                             f"directories dated after the cutoff.")
+        if result.stale_listed:
+            self.logger.info(f"Skipped {result.stale_listed} listed files that changed after the listing was written.")
+        if result.cached_dirs:
+            self.logger.info(f"Skipped listing {result.cached_dirs} unchanged directories with only fresh files.")
+        if result.retried:
+            self.logger.info(f"{result.retried} files were removed after a retry.")
+        if result.vanished:
+            self.logger.info(f"{result.vanished} files had already been removed by another host.")
+        if result.errors:
+            groups = sorted(result.errors_by_errno.items(), key=lambda item: -item[1])
+            summary = ', '.join(f"{name} x {count} (e.g. {result.error_examples[name]})" for name, count in groups)
+            self.logger.error(f"Failed to remove {result.errors} files: {summary}")
+
+
+class JobServer:
+    """
+    Run cleanup jobs inside a long-lived process.
+
+    A job is a dict of CleanerConfig fields ('expression' and 'age' at least).
+    Jobs run on a shared thread pool with the server's warm logger, and jobs on
+    the same root run one at a time while different roots proceed in parallel.
+    Each expression keeps an in-memory FreshCache between jobs (disable per job
+    with "cache": false), so repeated cleanups of the same tree skip unchanged
+    fresh directories. Use serve_unix() or serve_http() to accept jobs.
+
+    The Unix socket is owner-only. The HTTP endpoint needs token, sent by
+    clients as 'Authorization: Bearer <token>', and refuses browser requests:
+    anything with an Origin header or a body that is not application/json.
+    """
+
+    # Fields a job may not set: they belong to the server or to the command line only, or name
+    # files other than the ones being cleaned, which a job must not be able to read or write
+    RESERVED_FIELDS = frozenset({'tuning_file', 'status_file', 'progress_interval', 'report_only',
+                                 'journal', 'archive_dir', 'report', 'source', 'fresh_cache'})
+
+    def __init__(self, logger: Optional[logging.Logger] = None, workers: int = 4, cache_roots: int = 64,
+                 cache_size: int = DEFAULT_CACHE_SIZE, token: Optional[str] = None):
+        self.logger = logger or logging.getLogger(APP_NAME)
+        self.token = token
+        self.cache_roots = cache_roots
+        self.cache_size = cache_size
+        self.jobs_run = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'{APP_NAME}-job')
+        self._lock = threading.Lock()
+        self._root_locks = {}
+        self._caches = OrderedDict()
+        self.transport = None
+
+    def submit(self, job: dict) -> dict:
+        """Run one job and return a JSON-serialisable response."""
+        started = time.perf_counter()
+        try:
+            cleaner = self._cleaner(job)
+            root = os.path.abspath(cleaner._root())
+            with self._root_lock(root):
+                result = self._pool.submit(cleaner.execute).result()
+            response = {'ok': True, 'result': asdict(result)}
+        except (ValueError, TypeError, KeyError, OSError) as error:
+            response = {'ok': False, 'error': f"{type(error).__name__}: {error}"}
+        with self._lock:
+            self.jobs_run += 1
+        response['elapsed'] = time.perf_counter() - started
+        return response
+
+    def status(self) -> dict:
+        with self._lock:
+            return {'jobs_run': self.jobs_run, 'cached_roots': len(self._caches), 'busy_roots':
+                    sorted(root for root, lock in self._root_locks.items() if lock.locked())}
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=True)
+
+    def _cleaner(self, job: dict) -> Cleaner:
+        if not isinstance(job, dict):
+            raise ValueError("A job must be a JSON object")
+        allowed = {item.name for item in fields(CleanerConfig)} - self.RESERVED_FIELDS
+        settings = {key: value for key, value in job.items() if key != 'cache'}
+        unknown = set(settings) - allowed
+        if unknown:
+            raise ValueError(f"Unknown job fields: {', '.join(sorted(unknown))}")
+        if 'expression' not in settings or 'age' not in settings:
+            raise ValueError("A job needs 'expression' and 'age'")
+        if 'date_patterns' in settings:
+            settings['date_patterns'] = tuple(settings['date_patterns'])
+        config = CleanerConfig(**settings)
+        cleaner = Cleaner(config, logger=self.logger)
+        if job.get('cache', True):
+            path_dates = cleaner.open_path_dates()
+            cleaner.fresh_cache = self._cache(cleaner.expression, path_dates.key if path_dates is not None else None)
+        return cleaner
+
+    def _cache(self, expression: str, dating: Optional[list] = None) -> FreshCache:
+        # Jobs dating files differently remember different oldest dates, so they get separate caches
+        key = (os.path.abspath(expression), json.dumps(dating))
+        with self._lock:
+            cache = self._caches.get(key)
+            if cache is None:
+                cache = self._caches[key] = FreshCache(None, expression, 0.0, self.cache_size, dating=dating)
+                while len(self._caches) > self.cache_roots:
+                    self._caches.popitem(last=False)
+            self._caches.move_to_end(key)
+            return cache
+
+    def _root_lock(self, root: str) -> threading.Lock:
+        with self._lock:
+            return self._root_locks.setdefault(root, threading.Lock())
+
+    def serve_unix(self, path: str) -> None:
+        """Accept jobs on a Unix socket: one JSON object per line in, one JSON response per line out."""
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    try:
+                        response = server.submit(json.loads(line))
+                    except ValueError as error:
+                        response = {'ok': False, 'error': f"Invalid JSON: {error}"}
+                    self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+                    self.wfile.flush()
+
+        if os.path.exists(path):
+            os.remove(path)
+        with socketserver.ThreadingUnixStreamServer(path, Handler) as unix_server:
+            os.chmod(path, 0o600)
+            self._serve(unix_server, f"unix socket {path}")
+
+    def serve_http(self, port: int, host: str = '127.0.0.1') -> None:
+        """Accept jobs as JSON POSTs on a localhost HTTP endpoint; GET returns the server status."""
+        if not self.token:
+            raise ValueError("The HTTP job server needs a token")
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self._refused():
+                    return
+                content_type = self.headers.get('Content-Type', '').split(';', 1)[0].strip().lower()
+                if content_type != 'application/json':
+                    # Browsers can send text/plain cross-site without a preflight; application/json they cannot
+                    self._reply(415, {'ok': False, 'error': "Content-Type must be application/json"})
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    response = server.submit(json.loads(self.rfile.read(length)))
+                except ValueError as error:
+                    response = {'ok': False, 'error': f"Invalid JSON: {error}"}
+                self._reply(200 if response['ok'] else 400, response)
+
+            def do_GET(self):
+                if not self._refused():
+                    self._reply(200, server.status())
+
+            def _refused(self) -> bool:
+                if self.headers.get('Origin') is not None:
+                    self._reply(403, {'ok': False, 'error': "Cross-origin requests are not accepted"})
+                    return True
+                expected = f"Bearer {server.token}".encode('utf-8')
+                if not hmac.compare_digest(self.headers.get('Authorization', '').encode('utf-8'), expected):
+                    self._reply(401, {'ok': False, 'error': "Missing or wrong token"})
+                    return True
+                return False
+
+            def _reply(self, code, body):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                server.logger.debug(f"HTTP {self.address_string()} {format % args}")
+
+        with ThreadingHTTPServer((host, port), Handler) as http_server:
+            self._serve(http_server, f"http://{host}:{http_server.server_address[1]}/")
+
+    def _serve(self, transport, address: str) -> None:
+        self.transport = transport
+        self.logger.info(f"{APP_NAME} job server listening on {address}")
+        try:
+            transport.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+            self.logger.info(f"{APP_NAME} job server stopped after {self.jobs_run} jobs")
+
+    def shutdown(self) -> None:
+        """Stop a serve_unix() or serve_http() loop running on another thread."""
+        if self.transport is not None:
+            self.transport.shutdown()
+
+
+def load_token(path: str) -> str:
+    """Read the job server token from path, creating the file owner-only with a random token if missing."""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, 'r', encoding='utf-8') as handle:
+            token = handle.read().strip()
+        if not token:
+            raise ValueError(f"Token file {path} is empty")
+        return token
+    token = secrets.token_urlsafe(32)
+    with os.fdopen(fd, 'w', encoding='utf-8') as handle:
+        handle.write(token + '\n')
+    return token
+
+
+def submit_job(job: dict, socket_path: Optional[str] = None, port: Optional[int] = None,
+               host: str = '127.0.0.1', timeout: Optional[float] = None, token: Optional[str] = None) -> dict:
+    """Send a job to a running JobServer over its Unix socket or HTTP port (with its token) and return the response."""
+    data = json.dumps(job).encode('utf-8')
+    if socket_path:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(socket_path)
+            client.sendall(data + b'\n')
+            with client.makefile('rb') as reader:
+                return json.loads(reader.readline())
+    connection = HTTPConnection(host, port, timeout=timeout)
+    try:
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+        connection.request('POST', '/', body=data, headers=headers)
+        return json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+
+
+def remove_files(_files: Iterable, _age: int = 1, logger=None, max_deletes: Optional[int] = None,
+                 max_runtime: Optional[float] = None, order: str = 'scan',
+                 queue_size: int = DEFAULT_QUEUE_SIZE, archiver: Optional[Archiver] = None) -> CleanupResult:
+    """
+    Remove files older than the given age, optionally within a budget.
+
+    Args:
+        _files: Iterable of file paths or FileEntry objects; consumed lazily so a budget also stops the scan
+        _age: Age in days
+        logger: Logger instance, defaults to the application logger
+        max_deletes: Stop after this many files have been removed
+        max_runtime: Stop once this many seconds have elapsed since the call
+        order: 'scan' keeps the input order, 'oldest' or 'largest' use prioritize()
+        queue_size: Priority queue bound used when order is not 'scan'
+        archiver: Archive files first; each is removed once its volume is fsynced
+
+    Returns:
+        CleanupResult with the paths removed, bytes actually freed and errors
+    """
+    config = CleanerConfig(age=_age, max_deletes=max_deletes, max_runtime=max_runtime,
+                           order=order, queue_size=queue_size)
+    return Cleaner(config, logger=logger).execute(_files, archiver=archiver)
+
+
+def main() -> None:
     start_time = time.perf_counter()
+    cmd_args = docopt(__doc__, version=APP_HELP)
+    if cmd_args['journal']:
+        try:
+            query_journal(cmd_args)
+        except (ValueError, OSError) as error:
+            sys.exit(f"{APP_NAME}: {error}")
+        return
 
     # Setup paths and logging first
     app_path, source_path, log_file = resolve_paths()
     logger = setup_logging(log_file)
+    if cmd_args['serve']:
+        try:
+            if cmd_args['--socket']:
+                JobServer(logger=logger, workers=int(cmd_args['--server-workers'])).serve_unix(cmd_args['--socket'])
+            else:
+                server = JobServer(logger=logger, workers=int(cmd_args['--server-workers']),
+                                   token=load_token(cmd_args['--token-file']))
+                server.serve_http(int(cmd_args['--port']))
+        except (ValueError, OSError) as error:
+            logger.error(str(error))
+            sys.exit(1)
+        return
 
     # Get version info
     version = get_file_version(app_path)
@@ -228,17 +3494,24 @@ if __name__ == '__main__':
 
     # Log startup information
     logger.info(f"{APP_NAME} Version: {version} | © {year} Application Consulting Group, Inc.")
-
-    files = []
-    cmd_args = docopt(__doc__, version=APP_HELP)
     logger.info(f"{APP_NAME} started.  Parameters: {cmd_args}")
-    expression = cmd_args['<expression>']
-    age = int(cmd_args['<age>'])
-    exclude_last_day = cmd_args['-e']
-    if exclude_last_day:
-        files = find_files_not_last_day_of_month(_expression= expression)
-    else:
-        for file in glob(expression, recursive=True):
-            files.append(file)
-    remove_files(_files=files, _age=age, logger=logger)
-    logger.info(f"Execution complete in: {time.perf_counter() - start_time:0.4f} seconds")
\ No newline at end of file
+    try:
+        config = CleanerConfig.from_args(cmd_args)
+        config.tuning_file = os.path.join(os.path.dirname(log_file), TUNING_FILE)
+        if cmd_args['--estimate']:
+            for line in format_estimate(Cleaner(config, logger=logger).estimate()):
+                logger.info(line)
+        elif config.report_only:
+            Cleaner(config, logger=logger).report()
+        else:
+            result = Cleaner(config, logger=logger).execute()
+            if result.workers:
+                logger.info(f"Tuned workers: {result.workers}")
+    except (ValueError, OSError) as error:
+        logger.error(str(error))
+        sys.exit(1)
+    logger.info(f"Execution complete in: {time.perf_counter() - start_time:0.4f} seconds")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Benchmark ACG-FolderClean against simulated remote storage
+
+Builds a tree of expired and fresh files, then runs the same cleanup under
+several settings (serial, inode order, fixed workers, self-tuning workers,
+pipelined) with per-operation latency and optional injected errors, and
+prints a table of wall time, stage timings and outcomes.
+
+Example:
+    python benchmark.py --dirs 50 --files 40 --latency 0.002 --busy 0.05
+
+Copyright © 2025 Application Consulting Group, Inc.
+Licensed under the MIT License - see LICENSE file for details.
+"""
+
+import argparse
+import errno
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import file_cleaner
+from remote_fs import SimulatedRemoteFS
+
+SCENARIOS = {
+    'serial': {},
+    'inode-order': {'order': 'inode'},
+    'workers-8': {'workers': 8},
+    'workers-auto': {'adaptive': True, 'max_workers': 32},
+    'pipeline': {'pipeline_depth': 1000},
+    'pipeline+workers-8': {'pipeline_depth': 1000, 'workers': 8},
+}
+
+
+def build_tree(root, dirs, files, expired_ratio):
+    """Create dirs directories of files files each; expired_ratio of them are 30 days old."""
+    old_time = (datetime.now() - timedelta(days=30)).timestamp()
+    expired_every = max(int(round(1 / expired_ratio)), 1) if expired_ratio else 0
+    for d in range(dirs):
+        directory = os.path.join(root, f'dir_{d:04d}')
+        os.makedirs(directory)
+        for i in range(files):
+            path = os.path.join(directory, f'file_{i:05d}.log')
+            Path(path).touch()
+            if expired_every and i % expired_every == 0:
+                os.utime(path, (old_time, old_time))
+
+
+def run(name, settings, args):
+    root = tempfile.mkdtemp(prefix='acg-bench-')
+    try:
+        data = os.path.join(root, 'data')
+        build_tree(data, args.dirs, args.files, args.expired)
+        config = file_cleaner.CleanerConfig(os.path.join(data, '**'), age=7, retries=args.retries,
+                                            retry_delay=0.01, tuning_file=os.path.join(root, 'tuning.json'),
+                                            **settings)
+        logger = logging.getLogger('benchmark')
+        logger.addHandler(logging.NullHandler())
+        logger.propagate = False
+        errors = {'remove': {errno.EBUSY: args.busy, errno.EACCES: args.denied}}
+        latency = {'scandir': args.latency, 'stat': args.latency, 'remove': args.latency}
+        simulated = args.latency or args.busy or args.denied
+        fs = SimulatedRemoteFS(data, latency=latency, errors=errors, seed=args.seed) if simulated else None
+        if fs is not None:
+            fs.__enter__()
+        try:
+            start = time.perf_counter()
+            result = file_cleaner.Cleaner(config, logger=logger).execute()
+            elapsed = time.perf_counter() - start
+        finally:
+            if fs is not None:
+                fs.__exit__(None, None, None)
+        timings = result.timings
+        calls = sum(fs.calls.values()) if fs is not None else '-'
+        print(f"{name:<20} {elapsed:8.3f} {timings.get('scan', 0):8.3f} {timings.get('plan', 0):8.3f} "
+              f"{timings.get('delete', 0):8.3f} {result.removed:8d} {result.retried:8d} {result.errors:7d} "
+              f"{calls:>8}  {result.workers or ''}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ACG-FolderClean on simulated remote storage')
+    parser.add_argument('--dirs', type=int, default=20, help='Directories in the test tree')
+    parser.add_argument('--files', type=int, default=50, help='Files per directory')
+    parser.add_argument('--expired', type=float, default=0.5, help='Fraction of files that are expired')
+    parser.add_argument('--latency', type=float, default=0.001,
+                        help='Seconds added to every scandir, stat and remove; 0 without errors uses the disk directly')
+    parser.add_argument('--busy', type=float, default=0.0, help='Probability that a remove fails with EBUSY')
+    parser.add_argument('--denied', type=float, default=0.0, help='Probability that a remove fails with EACCES')
+    parser.add_argument('--retries', type=int, default=3, help='Retries for transient errors')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for injected errors')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=f"Scenarios to run, default all: {', '.join(SCENARIOS)}")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+
+    print(f"{'scenario':<20} {'wall':>8} {'scan':>8} {'plan':>8} {'delete':>8} {'removed':>8} "
+          f"{'retried':>8} {'errors':>7} {'fs calls':>8}")
+    for name in args.scenarios or SCENARIOS:
+        run(name, SCENARIOS[name], args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Simulated remote storage for ACG-FolderClean tests and benchmarks
+
+Wraps os.scandir, os.stat, os.lstat, os.remove and os.unlink so that calls on
+paths below a root pay a configurable per-operation delay and can fail with
+errors such as EBUSY or EACCES, the way a NAS or SMB share behaves. Everything
+runs against a normal local directory, so no FUSE or network is needed.
+
+Copyright © 2025 Application Consulting Group, Inc.
+Licensed under the MIT License - see LICENSE file for details.
+"""
+
+import errno
+import os
+import random
+import threading
+import time
+from collections import Counter
+from unittest.mock import patch
+
+
+class SimulatedDirEntry:
+    """os.DirEntry stand-in whose stat() pays the simulated stat latency."""
+
+    def __init__(self, entry, fs):
+        self._entry = entry
+        self._fs = fs
+        self.name = entry.name
+        self.path = entry.path
+
+    def stat(self, follow_symlinks=True):
+        self._fs.operation('stat', self.path)
+        return self._entry.stat(follow_symlinks=follow_symlinks)
+
+    def inode(self):
+        return self._entry.inode()
+
+    def is_dir(self, follow_symlinks=True):
+        return self._entry.is_dir(follow_symlinks=follow_symlinks)
+
+    def is_file(self, follow_symlinks=True):
+        return self._entry.is_file(follow_symlinks=follow_symlinks)
+
+    def is_symlink(self):
+        return self._entry.is_symlink()
+
+    def __fspath__(self):
+        return self.path
+
+
+class SimulatedScandir:
+    """Context manager and iterator returned by the patched os.scandir."""
+
+    def __init__(self, iterator, fs):
+        self._iterator = iterator
+        self._fs = fs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return SimulatedDirEntry(next(self._iterator), self._fs)
+
+    def close(self):
+        self._iterator.close()
+
+
+class SimulatedRemoteFS:
+    """
+    Inject latency and errors into filesystem calls below a root.
+
+    Args:
+        root: Only paths below this directory are affected; fd-based calls always are
+        latency: Seconds added per call, keyed by 'scandir', 'stat' or 'remove'
+        errors: Per-operation {errno: probability} of failing a call
+        busy_attempts: Fail the first n remove attempts of every file with EBUSY, like a file held open
+        seed: Seed for the error draws, so runs are repeatable
+
+    Example:
+        with SimulatedRemoteFS(root, latency={'stat': 0.002}, errors={'remove': {errno.EACCES: 0.1}}) as fs:
+            Cleaner(config).execute()
+        print(fs.calls, fs.failures)
+    """
+
+    def __init__(self, root, latency=None, errors=None, busy_attempts=0, seed=0):
+        self.root = os.path.abspath(root)
+        self.latency = dict(latency or {})
+        self.errors = {operation: dict(rates) for operation, rates in (errors or {}).items()}
+        self.busy_attempts = busy_attempts
+        self.calls = Counter()
+        self.failures = Counter()
+        self._attempts = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._patches = []
+        self._originals = {name: getattr(os, name) for name in ('scandir', 'stat', 'lstat', 'remove', 'unlink')}
+
+    def affects(self, path) -> bool:
+        if isinstance(path, int):
+            return True
+        path = os.path.abspath(os.fspath(path))
+        return path == self.root or path.startswith(self.root + os.sep)
+
+    def operation(self, name, path) -> None:
+        """Account for one call: sleep for its latency, then maybe raise an injected error."""
+        if not self.affects(path):
+            return
+        with self._lock:
+            self.calls[name] += 1
+            failure = None
+            if name == 'remove' and self.busy_attempts:
+                self._attempts[path] += 1
+                if self._attempts[path] <= self.busy_attempts:
+                    failure = errno.EBUSY
+            for code, probability in self.errors.get(name, {}).items():
+                if failure is None and self._random.random() < probability:
+                    failure = code
+            if failure is not None:
+                self.failures[errno.errorcode[failure]] += 1
+        delay = self.latency.get(name, 0.0)
+        if delay:
+            time.sleep(delay)
+        if failure is not None:
+            raise OSError(failure, os.strerror(failure), os.fspath(path) if not isinstance(path, int) else None)
+
+    def _scandir(self, path='.'):
+        self.operation('scandir', path)
+        return SimulatedScandir(self._originals['scandir'](path), self)
+
+    def _stat_call(self, original):
+        def stat(path, *args, **kwargs):
+            self.operation('stat', path if kwargs.get('dir_fd') is None else kwargs['dir_fd'])
+            return original(path, *args, **kwargs)
+        return stat
+
+    def _remove_call(self, original):
+        def remove(path, *args, **kwargs):
+            self.operation('remove', path if kwargs.get('dir_fd') is None else kwargs['dir_fd'])
+            return original(path, *args, **kwargs)
+        return remove
+
+    def __enter__(self):
+        replacements = {
+            'scandir': self._scandir,
+            'stat': self._stat_call(self._originals['stat']),
+            'lstat': self._stat_call(self._originals['lstat']),
+            'remove': self._remove_call(self._originals['remove']),
+            'unlink': self._remove_call(self._originals['unlink']),
+        }
+        for name, replacement in replacements.items():
+            self._patches.append(patch.object(os, name, replacement))
+        for active in self._patches:
+            active.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        for active in reversed(self._patches):
+            active.stop()
+        self._patches.clear()
@@ -6,13 +6,18 @@ Licensed under the MIT License - see LICENSE file for details.
 """
 
 import calendar
+import errno
+import json
 import logging
 import os
 import tempfile
 import shutil
+import socket
+import threading
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
-from unittest.mock import patch, MagicMock, mock_open
+from unittest.mock import ANY, patch, MagicMock, mock_open
 
 import pytest
 
@@ -23,6 +28,7 @@ parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, parent_dir)
 sys.path.insert(0, os.path.join(parent_dir, 'src'))
 import file_cleaner
+from remote_fs import SimulatedRemoteFS
 
 
 class TestResolvePaths:
@@ -333,6 +339,1599 @@ class TestRemoveFiles:
             assert not os.path.exists(test_file)
 
 
+class TestPrioritize:
+    """Tests for prioritize function"""
+
+    @staticmethod
+    def _candidates(mtimes, sizes=None):
+        sizes = sizes or [0] * len(mtimes)
+        return [file_cleaner.FileEntry(f'file_{i}', m, s) for i, (m, s) in enumerate(zip(mtimes, sizes))]
+
+    def test_oldest_first_when_queue_holds_everything(self):
+        """Test exact oldest-first ordering when all candidates fit in the queue"""
+        candidates = self._candidates([30, 10, 20])
+        result = [entry.path for entry in file_cleaner.prioritize(candidates, order='oldest', queue_size=10)]
+        assert result == ['file_1', 'file_2', 'file_0']
+
+    def test_largest_first(self):
+        """Test largest-first ordering"""
+        candidates = self._candidates([1, 2, 3], sizes=[5, 50, 10])
+        result = [entry.path for entry in file_cleaner.prioritize(candidates, order='largest')]
+        assert result == ['file_1', 'file_2', 'file_0']
+
+    def test_bounded_queue_yields_every_candidate(self):
+        """Test that a small queue still yields all candidates"""
+        candidates = self._candidates([50, 40, 30, 20, 10])
+        result = [entry.path for entry in file_cleaner.prioritize(candidates, order='oldest', queue_size=2)]
+        assert sorted(result) == sorted(entry.path for entry in candidates)
+
+    def test_unknown_order(self):
+        """Test that an unknown order mode is rejected"""
+        with pytest.raises(ValueError):
+            list(file_cleaner.prioritize([], order='newest'))
+
+    def test_inode_order_groups_directories(self):
+        """Test that inode order releases whole directories, each sorted by inode"""
+        entries = [
+            file_cleaner.FileEntry('/b/x', 1.0, ino=30),
+            file_cleaner.FileEntry('/a/x', 1.0, ino=12),
+            file_cleaner.FileEntry('/b/y', 1.0, ino=21),
+            file_cleaner.FileEntry('/a/y', 1.0, ino=11),
+            file_cleaner.FileEntry('/c/x', 1.0, ino=5),
+        ]
+        result = [e.path for e in file_cleaner.prioritize(iter(entries), order='inode', queue_size=10)]
+        assert result == ['/c/x', '/a/y', '/a/x', '/b/y', '/b/x']
+
+        result = [e.path for e in file_cleaner.prioritize(iter(entries), order='inode', queue_size=2)]
+        assert result == ['/a/x', '/b/x', '/a/y', '/b/y', '/c/x']
+
+    def test_stop_ends_queue_fill(self):
+        """Test that a stop callable ends reading candidates while the queue is still filling"""
+        read = []
+
+        def endless():
+            while True:
+                read.append(len(read))
+                yield file_cleaner.FileEntry(f'file_{len(read)}', -len(read))
+
+        stop = lambda: len(read) >= 3
+        result = list(file_cleaner.prioritize(endless(), order='oldest', queue_size=10, stop=stop))
+        assert len(read) == 3
+        assert [entry.mtime for entry in result] == sorted(entry.mtime for entry in result)
+
+
+class TestRemoveFilesBudgets:
+    """Tests for remove_files delete and runtime budgets"""
+
+    def test_max_deletes_removes_oldest_first(self, sample_files):
+        """Test that a delete budget is spent on the oldest files"""
+        mock_logger = MagicMock()
+        result = file_cleaner.remove_files(sample_files, _age=2, logger=mock_logger,
+                                           max_deletes=2, order='oldest')
+        assert result.removed == 2
+        # sample_files are 1, 5, 10, 15 and 30 days old
+        assert not os.path.exists(sample_files[4])
+        assert not os.path.exists(sample_files[3])
+        assert all(os.path.exists(f) for f in sample_files[:3])
+
+    def test_max_runtime_exhausted(self, sample_files):
+        """Test that an exhausted runtime budget stops deletion"""
+        mock_logger = MagicMock()
+        result = file_cleaner.remove_files(sample_files, _age=2, logger=mock_logger, max_runtime=0)
+        assert result.removed == 0
+        assert all(os.path.exists(f) for f in sample_files)
+        calls = [str(call) for call in mock_logger.info.call_args_list]
+        assert any('Runtime budget' in call for call in calls)
+
+    def test_max_runtime_bounds_scan_without_candidates(self, temp_dir):
+        """Test that the runtime budget also stops a slow scan that finds nothing to delete"""
+        for d in range(4):
+            os.makedirs(os.path.join(temp_dir, f'dir_{d}'))
+            for i in range(50):
+                Path(os.path.join(temp_dir, f'dir_{d}', f'{i}.log')).touch()
+        config = file_cleaner.CleanerConfig('**', age=5, base_dir=temp_dir, max_runtime=0.1, order='oldest')
+        mock_logger = MagicMock()
+        with SimulatedRemoteFS(temp_dir, latency={'stat': 0.005}):
+            result = file_cleaner.Cleaner(config, logger=mock_logger).execute()
+        assert result.removed == 0
+        assert result.scanned < 200
+        assert result.timings['total'] < 0.5
+        calls = [str(call) for call in mock_logger.info.call_args_list]
+        assert any('Runtime budget' in call for call in calls)
+
+
+class TestExpressionScanner:
+    """Tests for ExpressionScanner class"""
+
+    @staticmethod
+    def _paths(expression, **kwargs):
+        return sorted(entry.path for entry in file_cleaner.ExpressionScanner(expression, **kwargs))
+
+    def test_matches_glob_for_files(self, temp_dir):
+        """Test that the scanner yields the same files as glob"""
+        for rel in ['a.txt', 'b.log', 'sub/c.txt', 'sub/deep/d.txt', '.hidden/e.txt', '.f.txt']:
+            path = os.path.join(temp_dir, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            Path(path).touch()
+
+        from glob import glob
+        for pattern in ['*', '*.txt', '**', os.path.join('**', '*.txt'), os.path.join('sub', '*')]:
+            expression = os.path.join(temp_dir, pattern)
+            expected = sorted(f for f in glob(expression, recursive=True) if os.path.isfile(f))
+            assert self._paths(expression) == expected, pattern
+
+    def test_skips_symlinked_directories(self, temp_dir):
+        """Test that symlinked directories are skipped unless requested"""
+        os.makedirs(os.path.join(temp_dir, 'real'))
+        Path(temp_dir, 'real', 'file.txt').touch()
+        os.symlink(os.path.join(temp_dir, 'real'), os.path.join(temp_dir, 'link'))
+        os.symlink(temp_dir, os.path.join(temp_dir, 'real', 'loop'))
+
+        expression = os.path.join(temp_dir, '**')
+        scanner = file_cleaner.ExpressionScanner(expression)
+        assert [entry.path for entry in scanner] == [os.path.join(temp_dir, 'real', 'file.txt')]
+        assert scanner.skipped_links == 2
+
+        # Following links still visits every directory only once
+        assert len(self._paths(expression, follow_symlinks=True)) == 1
+
+    def test_hard_links_share_one_stat(self, temp_dir):
+        """Test that hard links reuse the metadata of the first link seen"""
+        first = os.path.join(temp_dir, 'first.txt')
+        Path(first).write_text('data')
+        os.link(first, os.path.join(temp_dir, 'second.txt'))
+
+        entries = list(file_cleaner.ExpressionScanner(os.path.join(temp_dir, '*')))
+        assert len(entries) == 2
+        assert entries[0].ino == entries[1].ino
+        assert entries[0].nlink == 2
+
+
+class TestInodeAccounting:
+    """Tests for bytes freed accounting"""
+
+    def test_hard_link_freed_once(self):
+        """Test that a hard-linked inode is credited after its last link"""
+        accounting = file_cleaner.InodeAccounting()
+        entry = file_cleaner.FileEntry('a', 0, size=100, dev=1, ino=7, nlink=2)
+        assert accounting.freed(entry) == 0
+        assert accounting.pinned_inodes == 1
+        assert accounting.freed(entry._replace(path='b')) == 100
+        assert accounting.pinned_inodes == 0
+
+    def test_symlink_frees_nothing(self):
+        """Test that removing a symlink frees no data"""
+        entry = file_cleaner.FileEntry('a', 0, size=100, is_link=True)
+        assert file_cleaner.InodeAccounting().freed(entry) == 0
+
+    def test_remove_files_reports_bytes(self, temp_dir):
+        """Test that remove_files reports paths removed and bytes freed"""
+        first = os.path.join(temp_dir, 'first.txt')
+        other = os.path.join(temp_dir, 'other.txt')
+        Path(first).write_text('x' * 10)
+        Path(other).write_text('y' * 5)
+        os.link(first, os.path.join(temp_dir, 'kept.dat'))
+        old_time = (datetime.now() - timedelta(days=10)).timestamp()
+        for path in [first, other]:
+            os.utime(path, (old_time, old_time))
+
+        scanner = file_cleaner.ExpressionScanner(os.path.join(temp_dir, '*.txt'))
+        result = file_cleaner.remove_files(scanner, _age=5, logger=MagicMock())
+        assert result.removed == 2
+        # first.txt is still linked from kept.dat, so only other.txt frees space
+        assert result.bytes_freed == 5
+
+
+class TestArchiver:
+    """Tests for archive-before-delete mode"""
+
+    @staticmethod
+    def _old_files(directory, count, size=100):
+        files = []
+        old_time = (datetime.now() - timedelta(days=10)).timestamp()
+        for i in range(count):
+            path = os.path.join(directory, f'file_{i}.log')
+            Path(path).write_bytes(bytes([i]) * size)
+            os.utime(path, (old_time, old_time))
+            files.append(path)
+        return files
+
+    def test_archive_then_remove(self, temp_dir):
+        """Test that files are archived into rotating volumes and then removed"""
+        import tarfile
+        source = os.path.join(temp_dir, 'source')
+        archive_dir = os.path.join(temp_dir, 'archive')
+        os.makedirs(source)
+        files = self._old_files(source, 5)
+
+        archiver = file_cleaner.Archiver(archive_dir, volume_size=250)
+        result = file_cleaner.remove_files(files, _age=5, logger=MagicMock(), archiver=archiver)
+
+        assert result.removed == 5
+        assert not any(os.path.exists(f) for f in files)
+        volumes = sorted(os.listdir(archive_dir))
+        assert len(volumes) == 2
+        members = {}
+        for volume in volumes:
+            with tarfile.open(os.path.join(archive_dir, volume), 'r:gz') as tar:
+                for member in tar.getmembers():
+                    members[os.path.basename(member.name)] = tar.extractfile(member).read()
+        assert members['file_3.log'] == bytes([3]) * 100
+
+    def test_rotation_counts_streamed_bytes(self, temp_dir):
+        """Test that volumes rotate on bytes written even when entries carry no size (path dates, listings)"""
+        source = os.path.join(temp_dir, 'source')
+        archive_dir = os.path.join(temp_dir, 'archive')
+        os.makedirs(source)
+        old_time = (datetime.now() - timedelta(days=10)).timestamp()
+        entries = [file_cleaner.FileEntry(path, old_time, 0) for path in self._old_files(source, 5)]
+
+        archiver = file_cleaner.Archiver(archive_dir, volume_size=250)
+        config = file_cleaner.CleanerConfig(age=5)
+        result = file_cleaner.Cleaner(config, logger=MagicMock()).execute(entries, archiver=archiver)
+
+        assert result.removed == 5
+        assert len(os.listdir(archive_dir)) == 2
+
+    def test_sharded_workers(self, temp_dir):
+        """Test archiving on parallel shards"""
+        source = os.path.join(temp_dir, 'source')
+        archive_dir = os.path.join(temp_dir, 'archive')
+        os.makedirs(source)
+        files = self._old_files(source, 6)
+
+        archiver = file_cleaner.Archiver(archive_dir, workers=3)
+        result = file_cleaner.remove_files(files, _age=5, logger=MagicMock(), archiver=archiver)
+
+        assert result.removed == 6
+        assert len(os.listdir(archive_dir)) == 3
+
+    def test_failed_volume_keeps_files(self, temp_dir):
+        """Test that files stay in place when their volume cannot be sealed"""
+        source = os.path.join(temp_dir, 'source')
+        os.makedirs(source)
+        files = self._old_files(source, 2)
+
+        archiver = file_cleaner.Archiver(os.path.join(temp_dir, 'archive'))
+        with patch('file_cleaner.os.fsync', side_effect=OSError("disk full")):
+            result = file_cleaner.remove_files(files, _age=5, logger=MagicMock(), archiver=archiver)
+
+        assert result.removed == 0
+        assert result.errors == 2
+        assert all(os.path.exists(f) for f in files)
+
+    def test_concurrent_runs_share_archive_dir(self, temp_dir):
+        """Test that two runs archiving into one directory within the same second get distinct volumes"""
+        archive_dir = os.path.join(temp_dir, 'archive')
+        files = []
+        for run in ('a', 'b'):
+            os.makedirs(os.path.join(temp_dir, run))
+            files.append(self._old_files(os.path.join(temp_dir, run), 2))
+        frozen = datetime(2025, 1, 1, 12, 0, 0)
+        with patch('file_cleaner.datetime') as mock_datetime:
+            mock_datetime.now.return_value = frozen
+            archivers = [file_cleaner.Archiver(archive_dir) for _ in files]
+        results = [file_cleaner.remove_files(run_files, _age=5, logger=MagicMock(), archiver=archiver)
+                   for run_files, archiver in zip(files, archivers)]
+
+        assert [result.removed for result in results] == [2, 2]
+        assert len(os.listdir(archive_dir)) == 2
+
+    def test_zst_requires_zstandard(self, temp_dir):
+        """Test that zst volumes need the optional zstandard package"""
+        with patch.object(file_cleaner, 'zstandard', None):
+            with pytest.raises(ValueError):
+                file_cleaner.Archiver(temp_dir, archive_format='zst')
+
+
+class TestCleaner:
+    """Tests for the Cleaner library API"""
+
+    def test_execute_with_base_dir(self, sample_files, temp_dir):
+        """Test a relative expression resolved against base_dir without chdir"""
+        config = file_cleaner.CleanerConfig('*.txt', age=7, base_dir=temp_dir)
+        cwd = os.getcwd()
+        with patch('os.chdir') as mock_chdir:
+            result = file_cleaner.Cleaner(config, logger=MagicMock()).execute()
+            mock_chdir.assert_not_called()
+
+        assert os.getcwd() == cwd
+        assert result.scanned == 5
+        assert result.matched == 3
+        assert result.removed == 3
+        assert result.errors == 0
+        assert set(result.timings) == {'scan', 'plan', 'delete', 'total'}
+        assert [os.path.exists(f) for f in sample_files] == [True, True, False, False, False]
+
+    def test_plan_does_not_delete(self, sample_files, temp_dir):
+        """Test that plan() only lists expired files"""
+        config = file_cleaner.CleanerConfig(os.path.join(temp_dir, '*'), age=12, order='oldest')
+        planned = [entry.path for entry in file_cleaner.Cleaner(config).plan()]
+        assert planned == [sample_files[4], sample_files[3]]
+        assert all(os.path.exists(f) for f in sample_files)
+
+    def test_concurrent_cleaners(self, temp_dir):
+        """Test several cleaners running in one process at once"""
+        from concurrent.futures import ThreadPoolExecutor
+        old_time = (datetime.now() - timedelta(days=10)).timestamp()
+        configs = []
+        for job in range(4):
+            job_dir = os.path.join(temp_dir, f'job_{job}')
+            os.makedirs(job_dir)
+            for i in range(10):
+                path = os.path.join(job_dir, f'{i}.log')
+                Path(path).touch()
+                os.utime(path, (old_time, old_time))
+            configs.append(file_cleaner.CleanerConfig('**', age=5, base_dir=job_dir))
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda c: file_cleaner.Cleaner(c, logger=MagicMock()).execute(), configs))
+
+        assert [r.removed for r in results] == [10] * 4
+
+    def test_invalid_order(self):
+        """Test that the config rejects an unknown order"""
+        with pytest.raises(ValueError):
+            file_cleaner.CleanerConfig('*', order='newest')
+
+
+class TestRetryQueue:
+    """Tests for transient error retries"""
+
+    @staticmethod
+    def _flaky_remove(failures, error_number=None):
+        """os.remove replacement that fails `failures` times per path before succeeding"""
+        import errno
+        real_remove = os.remove
+        attempts = {}
+
+        def remove(path):
+            attempts[path] = attempts.get(path, 0) + 1
+            if attempts[path] <= failures:
+                raise OSError(error_number or errno.EBUSY, 'Device or resource busy', path)
+            real_remove(path)
+        return remove, attempts
+
+    def test_is_transient(self):
+        """Test errno classification"""
+        import errno
+        assert file_cleaner.is_transient(OSError(errno.EBUSY, 'busy'))
+        assert not file_cleaner.is_transient(OSError(errno.ENOENT, 'missing'))
+        assert not file_cleaner.is_transient(OSError(errno.EACCES, 'denied'))
+
+    def test_transient_failure_is_retried(self, sample_files):
+        """Test that a busy file is removed by a later retry"""
+        remove, attempts = self._flaky_remove(failures=2)
+        config = file_cleaner.CleanerConfig(age=7, retry_delay=0.01)
+        with patch('file_cleaner.os.remove', side_effect=remove):
+            result = file_cleaner.Cleaner(config, logger=MagicMock()).execute(sample_files)
+
+        assert result.removed == 3
+        assert result.retried == 3
+        assert result.errors == 0
+        assert set(attempts.values()) == {3}
+
+    def test_errors_grouped_by_errno(self, sample_files):
+        """Test that exhausted and permanent failures are summarized by errno"""
+        import errno
+        remove, _ = self._flaky_remove(failures=10)
+        config = file_cleaner.CleanerConfig(age=7, retries=2, retry_delay=0.01)
+        mock_logger = MagicMock()
+        with patch('file_cleaner.os.remove', side_effect=remove):
+            result = file_cleaner.Cleaner(config, logger=mock_logger).execute(sample_files)
+
+        assert result.removed == 0
+        assert result.errors_by_errno == {'EBUSY': 3}
+        assert mock_logger.error.call_count == 1
+        assert 'EBUSY x 3' in mock_logger.error.call_args[0][0]
+
+    def test_runtime_budget_abandons_retries(self, sample_files):
+        """Test that pending retries stop when the runtime budget is used"""
+        remove, _ = self._flaky_remove(failures=10)
+        config = file_cleaner.CleanerConfig(age=7, retry_delay=10, max_runtime=0.2)
+        started = time.monotonic()
+        with patch('file_cleaner.os.remove', side_effect=remove):
+            result = file_cleaner.Cleaner(config, logger=MagicMock()).execute(sample_files)
+
+        assert time.monotonic() - started < 5
+        assert result.errors == 3
+
+
+class TestListingSource:
+    """Tests for listing-file scan sources"""
+
+    def test_nul_listing_filters_by_expression(self, temp_dir):
+        """Test NUL-delimited listings matched against the expression"""
+        listing = os.path.join(temp_dir, 'listing.nul')
+        root = os.path.join(temp_dir, 'share')
+        records = [(os.path.join(root, 'a.log'), 10, 100.5),
+                   (os.path.join(root, 'sub', 'b.log'), 20, 200.0),
+                   (os.path.join(root, 'c.txt'), 30, 300.0)]
+        with open(listing, 'wb') as f:
+            for path, size, mtime in records:
+                f.write(f'{path}\0{size}\0{mtime}\0'.encode())
+
+        source = file_cleaner.ListingSource(listing, os.path.join(root, '**', '*.log'))
+        entries = list(source)
+        assert [(e.path, e.size, e.mtime) for e in entries] == [records[0][:1] + (10, 100.5),
+                                                                records[1][:1] + (20, 200.0)]
+
+    def test_nul_listing_across_chunks(self, temp_dir):
+        """Test that records split across read chunks are reassembled"""
+        listing = os.path.join(temp_dir, 'listing.nul')
+        with open(listing, 'wb') as f:
+            for i in range(50):
+                f.write(f'/share/file_{i}.log\0{i}\0{i}.5\0'.encode())
+
+        with patch.object(file_cleaner.ListingSource, 'CHUNK_SIZE', 7):
+            entries = list(file_cleaner.ListingSource(listing, '/share/*'))
+        assert len(entries) == 50
+        assert entries[49].size == 49
+
+    def test_gzip_csv_listing(self, temp_dir):
+        """Test gzip-compressed CSV listings with a header row"""
+        import gzip
+        listing = os.path.join(temp_dir, 'listing.csv.gz')
+        with gzip.open(listing, 'wt', newline='') as f:
+            f.write('path,size,mtime\n/share/a,1,10\n"/share/b,c",2,20\n')
+
+        source = file_cleaner.ListingSource(listing, '/share/*')
+        assert [e.path for e in source] == ['/share/a', '/share/b,c']
+        assert source.invalid_records == 1
+
+    def test_cleaner_uses_listing(self, sample_files, temp_dir):
+        """Test that age filtering and removal run on the listing stream"""
+        listing = os.path.join(temp_dir, 'listing.csv')
+        with open(listing, 'w', newline='') as f:
+            for path in sample_files:
+                f.write(f'{path},0,{os.path.getmtime(path)}\n')
+
+        config = file_cleaner.CleanerConfig(os.path.join(temp_dir, '*.txt'), age=7, source=listing)
+        result = file_cleaner.Cleaner(config, logger=MagicMock()).execute()
+        assert result.scanned == 5
+        assert result.removed == 3
+
+    def test_stale_listing_rechecked_on_disk(self, temp_dir):
+        """Test that files rewritten or resized after the listing was exported are kept"""
+        rewritten = os.path.join(temp_dir, 'a.log')
+        resized = os.path.join(temp_dir, 'b.log')
+        expired = os.path.join(temp_dir, 'c.log')
+        old_time = (datetime.now() - timedelta(days=30)).timestamp()
+        Path(rewritten).write_bytes(b'x' * 8)
+        for path in (resized, expired):
+            Path(path).write_bytes(b'x' * 8)
+            os.utime(path, (old_time, old_time))
+        listing = os.path.join(temp_dir, 'listing.csv')
+        with open(listing, 'w', newline='') as f:
+            f.write(f'{rewritten},8,1000.0\n{resized},4,{old_time}\n{expired},8,{old_time}\n')
+
+        config = file_cleaner.CleanerConfig(os.path.join(temp_dir, '*.log'), age=7, source=listing)
+        with patch('file_cleaner.os.lstat', wraps=os.lstat) as lstat:
+            result = file_cleaner.Cleaner(config, logger=MagicMock()).execute()
+        assert (result.removed, result.stale_listed) == (1, 2)
+        assert os.path.exists(rewritten) and os.path.exists(resized)
+        assert not os.path.exists(expired)
+        assert lstat.call_count == 3
+
+
+class TestCollapseDirs:
+    """Tests for removing fully expired subtrees as a unit"""
+
+    @staticmethod
+    def _tree(root, files):
+        old_time = (datetime.now() - timedelta(days=30)).timestamp()
+        for rel, old in files.items():
+            path = os.path.join(root, *rel.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            Path(path).write_text('x' * 10)
+            if old:
+                os.utime(path, (old_time, old_time))
+
+    def test_expired_subtree_removed_as_one(self, temp_dir):
+        """Test that a fully expired date partition is removed with one log entry"""
+        self._tree(temp_dir, {'2024/01/01/a.log': True, '2024/01/02/b.log': True, '2024/01/c.log': True,
+                              '2024/02/d.log': True, '2024/02/e.log': False})
+        config = file_cleaner.CleanerConfig(os.path.join(temp_dir, '**'), age=7, collapse_dirs=True)
+        mock_logger = MagicMock()
+        result = file_cleaner.Cleaner(config, logger=mock_logger).execute()
+
+        assert result.removed == 4
+        assert result.bytes_freed == 40
+        assert result.collapsed_dirs == 1
+        assert not os.path.exists(os.path.join(temp_dir, '2024', '01'))
+        assert os.listdir(os.path.join(temp_dir, '2024', '02')) == ['e.log']
+        messages = [call[0][0] for call in mock_logger.info.call_args_list]
+        assert any(m.startswith('Removed directory:') and '(3 files' in m for m in messages)
+        assert not any('a.log' in m for m in messages)
+
+    def test_collapsed_subtrees_respect_delete_budget(self, temp_dir):
+        """Test that --max-deletes stops part way through a collapsed directory"""
+        self._tree(temp_dir, {f'{d}/{i}.log': True for d in ('a', 'b') for i in range(50)})
+        for workers in (1, 4):
+            config = file_cleaner.CleanerConfig(os.path.join(temp_dir, '**'), age=7, collapse_dirs=True,
+                                                max_deletes=5, workers=workers)
+            result = file_cleaner.Cleaner(config, logger=MagicMock()).execute()
+            assert result.removed == 5
+            assert result.bytes_freed == 50
+            assert result.collapsed_dirs == 0
+        assert sum(len(files) for _, _, files in os.walk(temp_dir)) == 90
+
+    def test_collapsed_subtree_respects_runtime(self, temp_dir):
+        """Test that an exhausted runtime budget stops removing inside a collapsed directory"""
+        self._tree(temp_dir, {f'a/{i}.log': True for i in range(20)})
+        subtree = next(iter(file_cleaner.ExpressionScanner(os.path.join(temp_dir, '**'), collapse=lambda e: True)))
+        outcome = file_cleaner.remove_tree(subtree, time.time(), deadline=time.monotonic())
+        assert (outcome.removed, outcome.stopped, outcome.errors) == (0, True, [])
+        assert len(os.listdir(os.path.join(temp_dir, 'a'))) == 20
+
+    def test_root_and_unmatched_files_stay(self, temp_dir):
+        """Test that the expression root and non-matching files are never collapsed"""
+        self._tree(temp_dir, {'a.log': True, 'sub/b.log': True, 'keep/c.txt': True, 'keep/d.log': True})
+        config = file_cleaner.CleanerConfig(os.path.join(temp_dir, '**', '*.log'), age=7, collapse_dirs=True)
+        result = file_cleaner.Cleaner(config, logger=MagicMock()).execute()
+
+        assert result.removed == 3
+        assert result.collapsed_dirs == 1
+        assert os.path.isdir(temp_dir)
+        assert os.listdir(os.path.join(temp_dir, 'keep')) == ['c.txt']
+
+    def test_changed_directory_rechecks_files(self, temp_dir):
+        """Test that files written after the scan survive the subtree removal"""
+        self._tree(temp_dir, {'sub/a.log': True, 'sub/b.log': True})
+        cutoff = (datetime.now() - timedelta(days=7)).timestamp()
+        scanner = file_cleaner.ExpressionScanner(os.path.join(temp_dir, '**'),
+                                                 collapse=lambda entry: entry.mtime < cutoff)
+        subtree, = list(scanner)
+        assert isinstance(subtree, file_cleaner.Subtree)
+
+        Path(temp_dir, 'sub', 'new.log').touch()
+        outcome = file_cleaner.remove_tree(subtree, cutoff)
+        assert outcome.removed == 2
+        assert outcome.kept == 1
+        assert outcome.errors == []
+        assert os.listdir(os.path.join(temp_dir, 'sub')) == ['new.log']
+
+    def test_rejects_incompatible_options(self):
+        """Test that collapsing requires scan order and plain deletion"""
+        with pytest.raises(ValueError):
+            file_cleaner.CleanerConfig('**', collapse_dirs=True, order='oldest')
+
+
+class TestDeletionJournal:
+    """Tests for the binary deletion journal"""
+
+    def test_round_trip_and_filters(self, temp_dir):
+        """Test appending records and querying by time range and prefix"""
+        path = os.path.join(temp_dir, 'deletions.jrn')
+        journal = file_cleaner.DeletionJournal(path)
+        with patch('file_cleaner.time.time', side_effect=[100.0, 200.0, 300.0]):
+            journal.append('/data/a.log', 10, 1.5)
+            journal.append('/data/sub', 30, kind='directory', files=3)
+            journal.append('/other/\u00e9.log', 20, 2.5, kind='archived')
+        journal.close()
+
+        records = list(file_cleaner.DeletionJournal.read(path))
+        assert [(r.path, r.size, r.kind, r.files) for r in records] == [
+            ('/data/a.log', 10, 'removed', 1), ('/data/sub', 30, 'directory', 3),
+            ('/other/\u00e9.log', 20, 'archived', 1)]
+        assert [r.path for r in file_cleaner.DeletionJournal.read(path, prefix='/data/')] == ['/data/a.log',
+                                                                                                '/data/sub']
+        assert [r.removed_at for r in file_cleaner.DeletionJournal.read(path, since=150, until=300)] == [200.0]
+
+    def test_appends_across_runs(self, temp_dir):
+        """Test that reopening a journal appends after the existing records"""
+        path = os.path.join(temp_dir, 'deletions.jrn')
+        for name in ['first', 'second']:
+            journal = file_cleaner.DeletionJournal(path)
+            journal.append(name)
+            journal.close()
+        assert [r.path for r in file_cleaner.DeletionJournal.read(path)] == ['first', 'second']
+
+    def test_unsynced_records_are_not_committed(self, temp_dir):
+        """Test that records appended after the last msync are dropped after a crash"""
+        path = os.path.join(temp_dir, 'deletions.jrn')
+        journal = file_cleaner.DeletionJournal(path, sync_interval=3600)
+        journal.append('synced')
+        journal.sync()
+        journal.append('lost')
+        # Simulate a crash: the header still records a single committed entry
+        assert [r.path for r in file_cleaner.DeletionJournal.read(path)] == ['synced']
+        journal.close()
+
+    def test_cleaner_writes_journal_and_query(self, sample_files, temp_dir, capsys):
+        """Test that a cleanup run journals its deletions and the CLI query prints them"""
+        path = os.path.join(temp_dir, 'audit.jrn')
+        config = file_cleaner.CleanerConfig(os.path.join(temp_dir, '*.txt'), age=7, journal=path)
+        mock_logger = MagicMock()
+        file_cleaner.Cleaner(config, logger=mock_logger).execute()
+
+        assert sorted(r.path for r in file_cleaner.DeletionJournal.read(path)) == sorted(sample_files[2:])
+        assert not any('Removed:' in str(call) for call in mock_logger.info.call_args_list)
+
+        count = file_cleaner.query_journal({'<journal>': path, '--since': '2000-01-01', '--until': None,
+                                            '--prefix': sample_files[4]})
+        assert count == 1
+        assert capsys.readouterr().out.rstrip().endswith(sample_files[4])
+
+    def test_bare_journal_command(self, sample_files, temp_dir, capsys):
+        """Test that 'journal <file>' without filters is parsed as a query, not as <expression> <age>"""
+        path = os.path.join(temp_dir, 'audit.jrn')
+        config = file_cleaner.CleanerConfig(os.path.join(temp_dir, '*.txt'), age=7, journal=path)
+        file_cleaner.Cleaner(config, logger=MagicMock()).execute()
+
+        with patch.object(sys, 'argv', ['ACG-FolderClean', 'journal', path]), \
+                patch('file_cleaner.setup_logging') as setup_logging:
+            file_cleaner.main()
+        setup_logging.assert_not_called()
+        printed = capsys.readouterr().out.splitlines()
+        assert len(printed) == 3
+        assert all(any(line.endswith(f) for line in printed) for f in sample_files[2:])
+
+
+class TestCoordination:
+    """Tests for multi-host coordination"""
+
+    def test_lease_elects_single_runner(self, temp_dir):
+        """Test that only one host holds the lease at a time"""
+        first = file_cleaner.LeaseCoordinator(temp_dir, host_id='host-a', logger=MagicMock())
+        second = file_cleaner.LeaseCoordinator(temp_dir, host_id='host-b', logger=MagicMock())
+        assert first.acquire()
+        assert not second.acquire()
+        first.release()
+        assert second.acquire()
+        second.release()
+        assert not os.path.exists(second.path)
+
+    def test_expired_lease_taken_over(self, temp_dir):
+        """Test that a lease whose holder stopped heartbeating can be taken over"""
+        stale = file_cleaner.LeaseCoordinator(temp_dir, host_id='crashed', logger=MagicMock())
+        stale._write_claim(stale.path, {'host': 'crashed', 'token': 'old', 'expires': time.time() - 1})
+
+        coordinator = file_cleaner.LeaseCoordinator(temp_dir, host_id='host-a', logger=MagicMock())
+        assert coordinator.acquire()
+        assert coordinator._read_claim(coordinator.path)['token'] == coordinator.token
+        coordinator.release()
+
+    def test_shards_partition_top_level_entries(self, temp_dir):
+        """Test that every top-level entry has exactly one owner"""
+        hosts = ['host-a', 'host-b', 'host-c']
+        coordinators = [file_cleaner.ShardCoordinator(temp_dir, host_id=h, logger=MagicMock(), settle=0.3)
+                        for h in hosts]
+        threads = [threading.Thread(target=coordinator.acquire) for coordinator in coordinators]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        try:
+            for coordinator in coordinators:
+                assert coordinator.live_members() == hosts
+                assert coordinator.members == hosts
+            names = [f'dir_{i}' for i in range(60)]
+            owners = [[c.owns(name) for c in coordinators].count(True) for name in names]
+            assert owners == [1] * 60
+            assert all(any(c.owns(name) for name in names) for c in coordinators)
+        finally:
+            for coordinator in coordinators:
+                coordinator.release()
+
+    def test_sharded_cleanup_runs_each_file_once(self, temp_dir):
+        """Test that two sharded hosts remove disjoint parts of the tree"""
+        old_time = (datetime.now() - timedelta(days=10)).timestamp()
+        for i in range(12):
+            path = os.path.join(temp_dir, f'dir_{i}', 'old.log')
+            os.makedirs(os.path.dirname(path))
+            Path(path).touch()
+            os.utime(path, (old_time, old_time))
+
+        # host-b is alive but has not run yet
+        peer = file_cleaner.ShardCoordinator(temp_dir, host_id='host-b', logger=MagicMock())
+        os.makedirs(os.path.dirname(peer.path))
+        peer._write_claim(peer.path, peer._claim())
+        config = file_cleaner.CleanerConfig(os.path.join(temp_dir, '**'), age=5, coordinate='shard', host_id='host-a',
+                                            shard_settle=0)
+        result = file_cleaner.Cleaner(config, logger=MagicMock()).execute()
+
+        peer.members = ['host-a', 'host-b']
+        expected = [f'dir_{i}' for i in range(12) if not peer.owns(f'dir_{i}')]
+        assert result.removed == len(expected)
+        remaining = sorted(d for d in os.listdir(temp_dir)
+                           if not d.startswith('.') and os.listdir(os.path.join(temp_dir, d)))
+        assert remaining == sorted(set(f'dir_{i}' for i in range(12)) - set(expected))
+
+    def test_staggered_hosts_split_within_settle(self, temp_dir):
+        """Test that hosts starting a moment apart still split the root instead of both cleaning all of it"""
+        old_time = (datetime.now() - timedelta(days=10)).timestamp()
+        for i in range(12):
+            path = os.path.join(temp_dir, f'dir_{i}', 'old.log')
+            os.makedirs(os.path.dirname(path))
+            Path(path).touch()
+            os.utime(path, (old_time, old_time))
+        results = {}
+
+        def run(host):
+            config = file_cleaner.CleanerConfig(os.path.join(temp_dir, '**'), age=5, coordinate='shard',
+                                                host_id=host, shard_settle=0.5)
+            with patch('file_cleaner.os.remove', wraps=os.remove) as remove:
+                results[host] = (file_cleaner.Cleaner(config, logger=MagicMock()).execute(), remove.call_count)
+
+        first = threading.Thread(target=run, args=('host-a',))
+        first.start()
+        time.sleep(0.2)
+        run('host-b')
+        first.join()
+
+        assert results['host-a'][0].removed > 0 and results['host-b'][0].removed > 0
+        assert results['host-a'][0].removed + results['host-b'][0].removed == 12
+        assert sum(result.vanished for result, _ in results.values()) == 0
+
+    def test_host_after_settled_group_skips(self, temp_dir):
+        """Test that a host arriving after the membership was fixed skips the run rather than overlap"""
+        first = file_cleaner.ShardCoordinator(temp_dir, host_id='host-a', logger=MagicMock(), settle=0)
+        late = file_cleaner.ShardCoordinator(temp_dir, host_id='host-b', logger=MagicMock(), settle=0)
+        assert first.acquire()
+        try:
+            assert first.members == ['host-a']
+            assert not late.acquire()
+            assert not os.path.exists(late.path)
+        finally:
+            first.release()
+        assert late.acquire()
+        assert late.members == ['host-b']
+        late.release()
+
+    def test_lost_lease_stops_removal(self, temp_dir):
+        """Test that a run stops deleting as soon as its lease is taken over"""
+        TestSimulatedRemoteStorage.make_expired(temp_dir)
+        config = file_cleaner.CleanerConfig('**', age=5, base_dir=temp_dir, coordinate='lease', lease_ttl=0.3)
+        lease = os.path.join(temp_dir, file_cleaner.LeaseCoordinator.LEASE_NAME)
+
+        def steal():
+            time.sleep(0.15)
+            file_cleaner.Coordinator._write_claim(lease, {'host': 'other', 'token': 'other',
+                                                          'expires': time.time() + 60})
+
+        thief = threading.Thread(target=steal)
+        thief.start()
+        with SimulatedRemoteFS(temp_dir, latency={'remove': 0.02}):
+            result = file_cleaner.Cleaner(config, logger=MagicMock()).execute()
+        thief.join()
+        assert 0 < result.removed < 40
+        assert result.timings['total'] < 0.6
+
+
+class TestConcurrency:
+    """Tests for self-tuning scan and delete workers"""
+
+    def test_controller_adds_worker_on_gain(self):
+        """Test that rising throughput raises the limit and falling throughput cuts it"""
+        controller = file_cleaner.ConcurrencyController(4, maximum=16)
+        controller.adjust(100.0, 0.01)
+        assert controller.limit == 5
+        controller.adjust(150.0, 0.01)
+        assert controller.limit == 6
+        controller.adjust(50.0, 0.01)
+        assert controller.limit == 5
+        assert controller.best_limit == 5
+
+    def test_controller_backs_off_on_latency(self):
+        """Test that latency far above the best seen cuts the limit"""
+        controller = file_cleaner.ConcurrencyController(8, maximum=16)
+        controller.adjust(100.0, 0.01)
+        controller.adjust(100.0, 0.05)
+        assert controller.limit == 7
+
+    def test_fixed_controller(self):
+        """Test that a non-adaptive controller keeps its limit"""
+        controller = file_cleaner.ConcurrencyController(3, adaptive=False)
+        controller.adjust(100.0, 0.01)
+        controller.adjust(500.0, 0.01)
+        assert controller.limit == 3
+
+    def test_pool_respects_limit(self):
+        """Test that no more tasks run at once than the controller allows"""
+        import threading
+        controller = file_cleaner.ConcurrencyController(2, adaptive=False)
+        pool = file_cleaner.AdaptivePool(controller)
+        lock = threading.Lock()
+        running = [0, 0]
+
+        def task():
+            with lock:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+
+        for _ in range(20):
+            pool.submit(task)
+        pool.close()
+        assert running == [0, 2]
+
+    def test_parallel_scan_matches_serial(self, temp_dir):
+        """Test that a parallel walk yields the same files as the serial one"""
+        for d in range(5):
+            for s in range(3):
+                sub_dir = os.path.join(temp_dir, f'dir_{d}', f'sub_{s}')
+                os.makedirs(sub_dir)
+                for i in range(4):
+                    Path(os.path.join(sub_dir, f'{i}.log')).touch()
+        expression = os.path.join(temp_dir, '**', '*.log')
+        serial = {entry.path for entry in file_cleaner.ExpressionScanner(expression)}
+        controller = file_cleaner.ConcurrencyController(4, adaptive=False)
+        scanner = file_cleaner.ExpressionScanner(expression, controller=controller)
+        parallel = [entry.path for entry in scanner]
+        assert len(serial) == 60
+        assert sorted(parallel) == sorted(serial)
+        assert scanner.dirs_scanned == 21
+
+    def test_adaptive_run_persists_tuning(self, temp_dir):
+        """Test that an adaptive run removes everything and remembers its settings per root"""
+        old_time = (datetime.now() - timedelta(days=10)).timestamp()
+        data_dir = os.path.join(temp_dir, 'data')
+        for d in range(3):
+            os.makedirs(os.path.join(data_dir, f'dir_{d}'))
+            for i in range(10):
+                path = os.path.join(data_dir, f'dir_{d}', f'{i}.log')
+                Path(path).touch()
+                os.utime(path, (old_time, old_time))
+        tuning_file = os.path.join(temp_dir, 'tuning.json')
+        config = file_cleaner.CleanerConfig(os.path.join(data_dir, '**'), age=5, adaptive=True,
+                                            max_workers=8, tuning_file=tuning_file)
+        result = file_cleaner.Cleaner(config, logger=MagicMock()).execute()
+
+        assert result.removed == 30
+        assert set(result.workers) == {'scan', 'delete'}
+        assert file_cleaner.load_tuning(tuning_file, data_dir) == dict(result.workers, updated=ANY)
+
+
+class TestFreshCache:
+    """Tests for the fresh directory cache"""
+
+    @staticmethod
+    def make_tree(root):
+        for d in range(3):
+            sub_dir = os.path.join(root, f'dir_{d}', 'sub')
+            os.makedirs(sub_dir)
+            for i in range(3):
+                Path(os.path.join(root, f'dir_{d}', f'{i}.log')).touch()
+                Path(os.path.join(sub_dir, f'{i}.log')).touch()
+
+    @staticmethod
+    def scan(expression, cache_file, cutoff):
+        cache = file_cleaner.FreshCache(cache_file, expression, cutoff)
+        scanner = file_cleaner.ExpressionScanner(expression, cache=cache)
+        paths = sorted(entry.path for entry in scanner)
+        cache.save()
+        return paths, scanner.dirs_scanned, cache.hits
+
+    def test_unchanged_fresh_dirs_skipped(self, temp_dir):
+        """Test that a second scan lists nothing while every directory is unchanged and fresh"""
+        data_dir = os.path.join(temp_dir, 'data')
+        self.make_tree(data_dir)
+        expression = os.path.join(data_dir, '**', '*.log')
+        cache_file = os.path.join(temp_dir, 'fresh.json')
+        cutoff = time.time() - 86400
+
+        paths, listed, hits = self.scan(expression, cache_file, cutoff)
+        assert (len(paths), listed, hits) == (18, 7, 0)
+        paths, listed, hits = self.scan(expression, cache_file, cutoff)
+        assert (paths, listed, hits) == ([], 0, 7)
+
+    def test_changed_or_expiring_dirs_listed(self, temp_dir):
+        """Test that a modified directory, or one whose files reach the cutoff, is listed again"""
+        data_dir = os.path.join(temp_dir, 'data')
+        self.make_tree(data_dir)
+        expression = os.path.join(data_dir, '**', '*.log')
+        cache_file = os.path.join(temp_dir, 'fresh.json')
+        self.scan(expression, cache_file, time.time() - 86400)
+
+        new_file = os.path.join(data_dir, 'dir_1', 'sub', 'new.log')
+        Path(new_file).touch()
+        old_dir = os.path.join(data_dir, 'dir_1', 'sub')
+        os.utime(old_dir, ns=(0, os.stat(old_dir).st_mtime_ns + 10 ** 9))
+        paths, listed, _ = self.scan(expression, cache_file, time.time() - 86400)
+        assert len(paths) == 4 and new_file in paths
+        assert listed == 1
+
+        paths, listed, _ = self.scan(expression, cache_file, time.time() + 60)
+        assert len(paths) == 19
+        assert listed == 6  # the root holds no files, so it never needs listing
+
+    def test_capacity_and_expression(self, temp_dir):
+        """Test LRU eviction and that a cache for another expression is ignored"""
+        cache_file = os.path.join(temp_dir, 'fresh.json')
+        cache = file_cleaner.FreshCache(cache_file, '/data/**', cutoff=100.0, capacity=2)
+        cache.store('a/', 1, 200.0, ())
+        cache.store('b/', 1, None, ())
+        assert cache.lookup('a/', 1) == ()
+        cache.store('c/', 1, 300.0, ('x',))
+        cache.store('d/', 1, 50.0, ())
+        assert len(cache) == 2
+        assert cache.lookup('b/', 1) is None
+        cache.save()
+
+        assert len(file_cleaner.FreshCache(cache_file, '/data/**', cutoff=100.0)) == 2
+        assert file_cleaner.FreshCache(cache_file, '/data/**', cutoff=100.0).lookup('c/', 1) == ('x',)
+        assert len(file_cleaner.FreshCache(cache_file, '/other/**', cutoff=100.0)) == 0
+
+
+class TestPipeline:
+    """Tests for the threaded scan/filter/delete pipeline"""
+
+    def test_stage_overlaps_consumer(self):
+        """Test that a stage produces while its consumer works"""
+        def slow_source():
+            for i in range(10):
+                time.sleep(0.02)
+                yield i
+
+        start = time.perf_counter()
+        stage = file_cleaner.PipelineStage(slow_source(), depth=4)
+        items = []
+        for item in stage:
+            time.sleep(0.02)
+            items.append(item)
+        stage.close()
+        assert items == list(range(10))
+        assert time.perf_counter() - start < 0.32  # 0.4 when run one after the other
+        assert stage.busy >= 0.19
+
+    def test_stage_backpressure_and_close(self):
+        """Test that a full queue blocks the producer and close() stops it"""
+        produced = []
+
+        def source():
+            for i in range(1000):
+                produced.append(i)
+                yield i
+
+        stage = file_cleaner.PipelineStage(source(), depth=5)
+        iterator = iter(stage)
+        assert next(iterator) == 0
+        time.sleep(0.05)
+        assert len(produced) <= 8
+        stage.close()
+        assert len(produced) < 1000
+
+    def test_stage_error_reaches_consumer(self):
+        """Test that an exception in a stage is raised in the consumer"""
+        def failing():
+            yield 1
+            raise OSError('listing failed')
+
+        stage = file_cleaner.PipelineStage(failing())
+        with pytest.raises(OSError):
+            list(stage)
+        stage.close()
+
+    def test_pipelined_execute(self, temp_dir):
+        """Test that a pipelined run removes the same files and honours a budget"""
+        old_time = (datetime.now() - timedelta(days=10)).timestamp()
+        for d in range(4):
+            os.makedirs(os.path.join(temp_dir, f'dir_{d}'))
+            for i in range(25):
+                path = os.path.join(temp_dir, f'dir_{d}', f'{i}.log')
+                Path(path).touch()
+                os.utime(path, (old_time, old_time))
+        config = file_cleaner.CleanerConfig('**', age=5, base_dir=temp_dir, pipeline_depth=8, max_deletes=30)
+        result = file_cleaner.Cleaner(config, logger=MagicMock()).execute()
+        assert result.removed == 30
+        assert set(result.timings) == {'scan', 'plan', 'delete', 'total'}
+
+        config = file_cleaner.CleanerConfig('**', age=5, base_dir=temp_dir, pipeline_depth=8)
+        result = file_cleaner.Cleaner(config, logger=MagicMock()).execute()
+        assert (result.scanned, result.removed) == (70, 70)
+
+
+class TestSimulatedRemoteStorage:
+    """Tests run against the latency- and fault-injecting filesystem stand-in"""
+
+    @staticmethod
+    def make_expired(root, dirs=4, files=10):
+        old_time = (datetime.now() - timedelta(days=10)).timestamp()
+        for d in range(dirs):
+            os.makedirs(os.path.join(root, f'dir_{d}'))
+            for i in range(files):
+                path = os.path.join(root, f'dir_{d}', f'{i}.log')
+                Path(path).touch()
+                os.utime(path, (old_time, old_time))
+
+    def test_latency_injected_below_root(self, temp_dir):
+        """Test that calls below the root are delayed and counted and others are not"""
+        data_dir = os.path.join(temp_dir, 'data')
+        self.make_expired(data_dir, dirs=1, files=3)
+        with SimulatedRemoteFS(data_dir, latency={'scandir': 0.02}) as fs:
+            start = time.perf_counter()
+            entries = list(file_cleaner.ExpressionScanner(os.path.join(data_dir, '**')))
+            elapsed = time.perf_counter() - start
+            os.listdir(temp_dir)
+            os.stat(temp_dir)
+        assert len(entries) == 3
+        assert fs.calls['scandir'] == 2
+        assert fs.calls['stat'] == 5
+        assert elapsed >= 0.04
+        assert os.scandir is fs._originals['scandir']
+
+    def test_busy_files_retried(self, temp_dir):
+        """Test that files held busy for two attempts are removed by the retry queue"""
+        self.make_expired(temp_dir)
+        config = file_cleaner.CleanerConfig('**', age=5, base_dir=temp_dir, retries=3, retry_delay=0.01)
+        with SimulatedRemoteFS(temp_dir, busy_attempts=2) as fs:
+            result = file_cleaner.Cleaner(config, logger=MagicMock()).execute()
+        assert (result.removed, result.retried, result.errors) == (40, 40, 0)
+        assert fs.failures['EBUSY'] == 80
+
+    def test_retries_count_against_delete_budget(self, temp_dir):
+        """Test that deletes waiting for a retry use up --max-deletes and retries stop at the budget"""
+        self.make_expired(temp_dir, dirs=2)
+        config = file_cleaner.CleanerConfig('**', age=5, base_dir=temp_dir, retries=3, retry_delay=0.01,
+                                            max_deletes=3)
+        with SimulatedRemoteFS(temp_dir, busy_attempts=1):
+            result = file_cleaner.Cleaner(config, logger=MagicMock()).execute()
+        assert (result.removed, result.retried, result.errors) == (3, 3, 0)
+        remaining = sum(len(files) for _, _, files in os.walk(temp_dir))
+        assert remaining == 17
+
+    def test_access_denied_reported(self, temp_dir):
+        """Test that injected EACCES failures are reported, not retried"""
+        self.make_expired(temp_dir)
+        config = file_cleaner.CleanerConfig('**', age=5, base_dir=temp_dir, workers=4)
+        with SimulatedRemoteFS(temp_dir, errors={'remove': {errno.EACCES: 0.25}}, seed=1) as fs:
+            result = file_cleaner.Cleaner(config, logger=MagicMock()).execute()
+        assert result.errors == fs.failures['EACCES'] > 0
+        assert result.removed + result.errors == 40
+        assert result.errors_by_errno == {'EACCES': result.errors}
+
+    def test_workers_hide_latency(self, temp_dir):
+        """Test that parallel workers finish a high-latency cleanup much faster than a serial run"""
+        elapsed = {}
+        for workers in (1, 8):
+            data_dir = os.path.join(temp_dir, f'data_{workers}')
+            self.make_expired(data_dir)
+            config = file_cleaner.CleanerConfig('**', age=5, base_dir=data_dir, workers=workers)
+            with SimulatedRemoteFS(data_dir, latency={'scandir': 0.005, 'stat': 0.002, 'remove': 0.002}):
+                elapsed[workers] = file_cleaner.Cleaner(config, logger=MagicMock()).execute().timings['total']
+        assert elapsed[8] < elapsed[1] / 2
+
+
+class TestPathDates:
+    """Tests for dating files by dates embedded in their path"""
+
+    def test_dates_from_names_and_partitions(self):
+        """Test that the most specific date in a path wins and stands for the end of its period"""
+        dates = file_cleaner.PathDates()
+        end_of = lambda *args: datetime(*args).timestamp() - 1
+        assert dates.date('app-2024-03-31.log') == end_of(2024, 4, 1)
+        assert dates.date('logs/app_20240229.log') == end_of(2024, 3, 1)
+        assert dates.date('2024/03/31/app.log') == end_of(2024, 4, 1)
+        assert dates.date('2024/12/app.log') == end_of(2025, 1, 1)
+        assert dates.date('2023/01/15/app-2024-02-10.log') == end_of(2024, 2, 11)
+        assert dates.date('app-2024-13-01.log') is None
+        assert dates.date('build-123456789.log') is None
+        assert dates.date('2024/12/app.log', require_day=True) is None
+
+    def test_custom_pattern(self):
+        """Test a configured pattern and the check for a year group"""
+        dates = file_cleaner.PathDates([r'(?P<day>\d\d)\.(?P<month>\d\d)\.(?P<year>\d{4})'])
+        assert dates.date('export 31.01.2025.csv') == datetime(2025, 2, 1).timestamp() - 1
+        with pytest.raises(ValueError):
+            file_cleaner.PathDates([r'(?P<month>\d\d)'])
+        with pytest.raises(ValueError):
+            file_cleaner.CleanerConfig('*', path_dates=True, date_patterns=('(?P<year>',))
+
+    def test_rejects_walks_that_ignore_path_dates(self):
+        """Test that path dating is refused where the scan would silently use mtimes instead"""
+        with pytest.raises(ValueError):
+            file_cleaner.CleanerConfig('**', path_dates=True, collapse_dirs=True)
+        with pytest.raises(ValueError):
+            file_cleaner.CleanerConfig('**', path_dates=True, source='listing.nul')
+
+    def test_scan_without_stat(self, temp_dir):
+        """Test that dated files are not stat'ed and fresh dated directories are not listed"""
+        today = datetime.now()
+        fresh_dir = os.path.join(temp_dir, today.strftime('%Y'), today.strftime('%m'))
+        old_dir = os.path.join(temp_dir, '2020', '01')
+        for directory in (fresh_dir, old_dir):
+            os.makedirs(directory)
+            Path(os.path.join(directory, 'data.log')).touch()
+        Path(os.path.join(temp_dir, 'app-2020-01-31.log')).touch()
+        Path(os.path.join(temp_dir, 'undated.log')).touch()
+
+        config = file_cleaner.CleanerConfig('**', age=30, base_dir=temp_dir, path_dates=True, exclude_last_day=True)
+        cleaner = file_cleaner.Cleaner(config, logger=MagicMock())
+        with SimulatedRemoteFS(temp_dir) as fs:
+            result = file_cleaner.CleanupResult()
+            planned = sorted(entry.path for entry in cleaner.plan(cleaner.scan(result), result))
+
+        # -e needs a day, so 2020/01/data.log falls back to its (fresh) mtime
+        assert planned == []
+        assert result.dated_files == 1
+        assert result.pruned_dirs == 1
+        # The root, both year directories, 2020/01, undated.log and 2020/01/data.log
+        assert fs.calls['stat'] == 6
+        assert fs.calls['scandir'] == 4
+
+        config.exclude_last_day = False
+        planned = [entry.path for entry in file_cleaner.Cleaner(config, logger=MagicMock()).plan()]
+        expected = [os.path.join(old_dir, 'data.log'), os.path.join(temp_dir, 'app-2020-01-31.log')]
+        assert sorted(planned) == sorted(expected)
+        assert os.path.exists(os.path.join(temp_dir, 'app-2020-01-31.log'))
+
+    def test_pruned_directories_stay_in_fresh_cache(self, temp_dir):
+        """Test that months pruned as fresh are still visited through the cache once they expire"""
+        for month in ('11', '12'):
+            os.makedirs(os.path.join(temp_dir, '2024', month))
+            Path(os.path.join(temp_dir, '2024', month, 'data.log')).touch()
+        cache = file_cleaner.FreshCache(None, os.path.join(temp_dir, '**'), 0, dating=file_cleaner.PathDates().key)
+
+        # Mid-November 2024: both months are newer than the cutoff and are not listed
+        early = (datetime.now() - datetime(2024, 11, 15)).days
+        config = file_cleaner.CleanerConfig('**', age=early, base_dir=temp_dir, path_dates=True)
+        result = file_cleaner.Cleaner(config, logger=MagicMock(), fresh_cache=cache).execute()
+        assert (result.removed, result.pruned_dirs) == (0, 2)
+
+        # Later, with '2024' itself unchanged and served from the cache, both months have expired
+        config.age = 1
+        result = file_cleaner.Cleaner(config, logger=MagicMock(), fresh_cache=cache).execute()
+        assert result.cached_dirs >= 1
+        assert result.removed == 2
+
+    def test_fresh_cache_keyed_by_dating_mode(self, temp_dir):
+        """Test that a cache built from path dates is not reused by a run that dates files by mtime"""
+        path = os.path.join(temp_dir, 'data', 'd', 'app-2099-01-01.log')
+        os.makedirs(os.path.dirname(path))
+        Path(path).touch()
+        old_time = (datetime.now() - timedelta(days=100)).timestamp()
+        os.utime(path, (old_time, old_time))
+        cache_file = os.path.join(temp_dir, 'fresh.json')
+        config = file_cleaner.CleanerConfig('**', age=30, base_dir=os.path.join(temp_dir, 'data'),
+                                            path_dates=True, fresh_cache=cache_file)
+        assert file_cleaner.Cleaner(config, logger=MagicMock()).execute().removed == 0
+
+        config.path_dates = False
+        result = file_cleaner.Cleaner(config, logger=MagicMock()).execute()
+        assert (result.removed, result.cached_dirs) == (1, 0)
+
+        with pytest.raises(ValueError):
+            cache = file_cleaner.FreshCache(None, os.path.join(temp_dir, 'data', '**'), 0)
+            file_cleaner.Cleaner(file_cleaner.CleanerConfig('**', age=30, path_dates=True),
+                                 fresh_cache=cache).open_source()
+
+
+class TestProgressReporter:
+    """Tests for live progress reporting"""
+
+    def test_rate_and_eta(self):
+        """Test the delete rate over the last interval and the ETA once the scan is done"""
+        result = file_cleaner.CleanupResult(scanned=500, matched=300)
+        reporter = file_cleaner.ProgressReporter(result, interval=0.02)
+        reporter._last = (time.monotonic() - 1.0, 0)
+        result.removed = 100
+        status = reporter.snapshot()
+        assert 90 <= status['rate'] <= 100
+        assert status['eta_seconds'] is None
+
+        reporter.scan_done = True
+        reporter._last = (time.monotonic() - 1.0, 0)
+        status = reporter.snapshot()
+        assert 2 <= status['eta_seconds'] <= 3
+
+    def test_console_and_status_file(self, temp_dir):
+        """Test that reports are written periodically and a final report marks the run finished"""
+        import io
+        import json
+        stream = io.StringIO()
+        status_file = os.path.join(temp_dir, 'status.json')
+        result = file_cleaner.CleanupResult(scanned=10, matched=4, removed=2, bytes_freed=2048)
+        reporter = file_cleaner.ProgressReporter(result, interval=0.01, stream=stream,
+                                                 status_file=status_file).start()
+        time.sleep(0.05)
+        with open(status_file, encoding='utf-8') as handle:
+            assert json.load(handle)['state'] == 'running'
+        reporter.stop()
+
+        lines = stream.getvalue().splitlines()
+        assert len(lines) >= 2
+        assert '10 files scanned, 4 matched, 2 deleted (2.00 KB)' in lines[-1]
+        with open(status_file, encoding='utf-8') as handle:
+            status = json.load(handle)
+        assert (status['state'], status['removed'], status['bytes_freed']) == ('finished', 2, 2048)
+
+    def test_execute_with_status_file(self, sample_files, temp_dir):
+        """Test that a cleanup keeps its status file up to date"""
+        import json
+        status_file = os.path.join(temp_dir, 'status.json')
+        config = file_cleaner.CleanerConfig('*.txt', age=7, base_dir=temp_dir, status_file=status_file)
+        file_cleaner.Cleaner(config, logger=MagicMock()).execute()
+        with open(status_file, encoding='utf-8') as handle:
+            status = json.load(handle)
+        assert status['dirs_scanned'] == 1
+        assert (status['scanned'], status['matched'], status['removed']) == (5, 3, 3)
+        assert status['scan_done']
+
+
+class TestEstimate:
+    """Tests for the sampling estimator"""
+
+    def test_regular_tree_is_exact(self, temp_dir):
+        """Test that a tree with equal branching and sizes is estimated exactly"""
+        old_time = (datetime.now() - timedelta(days=40)).timestamp()
+        for d in range(3):
+            for s in range(2):
+                sub_dir = os.path.join(temp_dir, f'dir_{d}', f'sub_{s}')
+                os.makedirs(sub_dir)
+                for i in range(10):
+                    path = os.path.join(sub_dir, f'{i}.log')
+                    with open(path, 'w') as f:
+                        f.write('x' * 100)
+                    if i < 4:
+                        os.utime(path, (old_time, old_time))
+        cutoff = (datetime.now() - timedelta(days=30)).timestamp()
+        estimate = file_cleaner.estimate_cleanup(os.path.join(temp_dir, '**', '*.log'), cutoff, probes=20, seed=1)
+        assert estimate.probes == 20
+        assert estimate.matched == (60.0, 60.0, 60.0)
+        assert estimate.expired == (24.0, 24.0, 24.0)
+        assert estimate.bytes_expired[0] == 2400.0
+        assert estimate.age_buckets['30-90d'] == 24.0
+        assert estimate.age_buckets['<1d'] == 36.0
+
+    def test_irregular_tree_within_interval(self, temp_dir):
+        """Test that sampling an irregular tree brackets the true counts without deleting anything"""
+        import random
+        rng = random.Random(7)
+        old_time = (datetime.now() - timedelta(days=40)).timestamp()
+        expired = 0
+        for d in range(20):
+            for s in range(rng.randint(1, 5)):
+                sub_dir = os.path.join(temp_dir, f'dir_{d}', f'sub_{s}')
+                os.makedirs(sub_dir)
+                for i in range(rng.randint(0, 30)):
+                    path = os.path.join(sub_dir, f'{i}.log')
+                    Path(path).touch()
+                    if rng.random() < 0.3:
+                        os.utime(path, (old_time, old_time))
+                        expired += 1
+        config = file_cleaner.CleanerConfig('**', age=30, base_dir=temp_dir, estimate_probes=400)
+        estimate = file_cleaner.Cleaner(config, logger=MagicMock()).estimate(seed=2)
+        value, low, high = estimate.expired
+        assert low <= expired <= high
+        assert abs(value - expired) < expired * 0.25
+        assert sum(len(files) for _, _, files in os.walk(temp_dir)) > expired
+        assert 'Files to delete' in file_cleaner.format_estimate(estimate)[3]
+
+
+class TestCapacityReport:
+    """Tests for the capacity report"""
+
+    def test_buckets_and_subtrees(self):
+        """Test age, size and subtree aggregation"""
+        now = datetime(2025, 6, 1).timestamp()
+        day = 86400
+        report = file_cleaner.CapacityReport(os.sep + 'data', cutoff=now - 30 * day, now=now, top=2)
+        entries = [
+            file_cleaner.FileEntry(os.path.join(os.sep, 'data', 'a', 'x.log'), now - 0.5 * day, 100),
+            file_cleaner.FileEntry(os.path.join(os.sep, 'data', 'a', 'sub', 'y.log'), now - 10 * day, 5000),
+            file_cleaner.FileEntry(os.path.join(os.sep, 'data', 'b', 'z.log'), now - 100 * day, 2 << 20),
+            file_cleaner.FileEntry(os.path.join(os.sep, 'data', 'c', 'w.log'), now - 1000 * day, 10),
+            file_cleaner.FileEntry(os.path.join(os.sep, 'data', 'top.log'), now - 40 * day, 1),
+        ]
+        assert list(report.observe(entries)) == entries
+
+        data = report.to_dict()
+        assert (data['files'], data['bytes']) == (5, 100 + 5000 + (2 << 20) + 10 + 1)
+        assert (data['expired_files'], data['expired_bytes']) == (3, (2 << 20) + 11)
+        assert data['age_days'][0] == {'bucket': '0d', 'files': 1, 'bytes': 100}
+        assert data['age_days'][10]['files'] == 1
+        assert data['age_days'][-1] == {'bucket': '>=31d', 'files': 3, 'bytes': (2 << 20) + 11}
+        assert [row['files'] for row in data['age_weeks']][:2] == [1, 1]
+        assert data['age_months'][-1]['files'] == 1
+        assert [row['files'] for row in data['sizes']] == [3, 1, 0, 1, 0, 0, 0]
+        assert [row['bucket'] for row in data['top_subtrees']] == ['b', 'a']
+
+    def test_subtree_memory_is_bounded(self):
+        """Test that many subtrees keep at most the counter capacity and the heaviest survive"""
+        report = file_cleaner.CapacityReport('', top=5)
+        for i in range(1000):
+            report.add(file_cleaner.FileEntry(os.path.join(f'dir_{i}', 'f.log'), time.time(), 1))
+        report.add(file_cleaner.FileEntry(os.path.join('big', 'f.log'), time.time(), 10 ** 6))
+        assert len(report._subtrees) == 100
+        assert report.to_dict()['top_subtrees'][0]['bucket'] == 'big'
+
+    def test_report_alongside_cleanup(self, sample_files, temp_dir):
+        """Test a JSON report written by a real run and a CSV report without deleting"""
+        import csv
+        import json
+        report_file = os.path.join(temp_dir, 'capacity.json')
+        config = file_cleaner.CleanerConfig(os.path.join(temp_dir, '*.txt'), age=12, report=report_file)
+        result = file_cleaner.Cleaner(config, logger=MagicMock()).execute()
+        with open(report_file, encoding='utf-8') as handle:
+            data = json.load(handle)
+        assert result.removed == 2
+        assert (data['files'], data['expired_files']) == (5, 2)
+
+        csv_file = os.path.join(temp_dir, 'capacity.csv')
+        config = file_cleaner.CleanerConfig(os.path.join(temp_dir, '*.txt'), age=2, report=csv_file,
+                                            report_only=True)
+        file_cleaner.Cleaner(config, logger=MagicMock()).report()
+        with open(csv_file, encoding='utf-8', newline='') as handle:
+            rows = list(csv.reader(handle))
+        assert rows[1] == ['total', 'all', '3', '0']
+        assert rows[2] == ['total', 'expired', '2', '0']
+        assert all(os.path.exists(f) for f in sample_files[:3])
+
+    def test_report_ignores_fresh_cache(self, temp_dir):
+        """Test that a repeated report run lists directories the fresh cache would skip"""
+        os.makedirs(os.path.join(temp_dir, 'logs'))
+        for i in range(10):
+            with open(os.path.join(temp_dir, 'logs', f'{i}.log'), 'w') as handle:
+                handle.write('x')
+        report_file = os.path.join(temp_dir, 'capacity.json')
+        config = file_cleaner.CleanerConfig(os.path.join(temp_dir, '**', '*.log'), age=30, report=report_file,
+                                            report_only=True, fresh_cache=os.path.join(temp_dir, 'fresh.json'))
+        for _ in range(2):
+            file_cleaner.Cleaner(config, logger=MagicMock()).report()
+            with open(report_file, encoding='utf-8') as handle:
+                assert json.load(handle)['files'] == 10
+
+    def test_rejects_partial_scans(self, temp_dir):
+        """Test that --report cannot be combined with walks that skip stat'ing files"""
+        report_file = os.path.join(temp_dir, 'capacity.json')
+        for option in ('collapse_dirs', 'path_dates'):
+            with pytest.raises(ValueError):
+                file_cleaner.CleanerConfig(os.path.join(temp_dir, '*.log'), report=report_file, **{option: True})
+
+    def test_subtree_counts_as_expired(self):
+        """Test that a collapsed subtree adds its files to the expired totals"""
+        now = time.time()
+        report = file_cleaner.CapacityReport(os.sep + 'data', cutoff=now - 86400, now=now)
+        report.add(file_cleaner.Subtree(os.path.join(os.sep, 'data', 'old'), 4, 400, {}))
+        data = report.to_dict()
+        assert (data['files'], data['bytes']) == (4, 400)
+        assert (data['expired_files'], data['expired_bytes']) == (4, 400)
+
+
+class TestJobServer:
+    """Tests for the resident job server"""
+
+    @staticmethod
+    def make_files(directory, count=3, days=10):
+        os.makedirs(directory, exist_ok=True)
+        old_time = (datetime.now() - timedelta(days=days)).timestamp()
+        for i in range(count):
+            path = os.path.join(directory, f'{i}.log')
+            Path(path).touch()
+            os.utime(path, (old_time, old_time))
+
+    def test_jobs_and_cached_state(self, temp_dir):
+        """Test that jobs run with the server logger and reuse the fresh cache between runs"""
+        logger = MagicMock()
+        server = file_cleaner.JobServer(logger=logger, workers=2)
+        try:
+            self.make_files(os.path.join(temp_dir, 'old'))
+            self.make_files(os.path.join(temp_dir, 'new'), days=0)
+            job = {'expression': os.path.join(temp_dir, '**'), 'age': 5}
+            first = server.submit(job)
+            second = server.submit(job)
+            assert first['ok'] and first['result']['removed'] == 3
+            assert second['ok'] and second['result']['removed'] == 0
+            assert second['result']['cached_dirs'] >= 1
+            assert server.status()['jobs_run'] == 2
+            logger.info.assert_any_call('Deleted 3 files; freed 0 B.')
+
+            dated = server.submit({**job, 'path_dates': True})
+            assert dated['ok'] and dated['result']['cached_dirs'] == 0
+            assert server.status()['cached_roots'] == 2
+
+            assert 'Unknown job fields' in server.submit({'expression': '*', 'age': 1, 'tuning_file': 'x'})['error']
+            assert not server.submit({'expression': '*'})['ok']
+        finally:
+            server.close()
+
+    def test_same_root_serialized(self, temp_dir):
+        """Test that jobs on one root never overlap while other roots run alongside"""
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        server = file_cleaner.JobServer(logger=MagicMock(), workers=4)
+        running = {}
+        overlaps = []
+        concurrent = []
+        lock = threading.Lock()
+
+        def slow_execute(cleaner, *args, **kwargs):
+            root = cleaner.config.expression.split(os.sep)[-2]
+            with lock:
+                if running.get(root):
+                    overlaps.append(root)
+                running[root] = running.get(root, 0) + 1
+                concurrent.append(sum(running.values()))
+            time.sleep(0.05)
+            with lock:
+                running[root] -= 1
+            return file_cleaner.CleanupResult()
+
+        jobs = [{'expression': os.path.join(temp_dir, root, '*'), 'age': 1} for root in ('a', 'a', 'a', 'b')]
+        try:
+            with patch.object(file_cleaner.Cleaner, 'execute', slow_execute):
+                with ThreadPoolExecutor(max_workers=4) as pool:
+                    responses = list(pool.map(server.submit, jobs))
+        finally:
+            server.close()
+        assert all(response['ok'] for response in responses)
+        assert overlaps == []
+        assert max(concurrent) == 2
+
+    def test_http_and_unix_transports(self, temp_dir):
+        """Test submitting jobs over HTTP and a Unix socket"""
+        import threading
+        data_dir = os.path.join(temp_dir, 'data')
+        job = {'expression': os.path.join(data_dir, '*'), 'age': 5}
+
+        server = file_cleaner.JobServer(logger=MagicMock(), token='secret')
+        thread = threading.Thread(target=server.serve_http, args=(0,))
+        thread.start()
+        while server.transport is None:
+            time.sleep(0.01)
+        self.make_files(data_dir)
+        response = file_cleaner.submit_job(job, port=server.transport.server_address[1], timeout=10, token='secret')
+        server.shutdown()
+        thread.join()
+        assert response['ok'] and response['result']['removed'] == 3
+
+        if not hasattr(socket, 'AF_UNIX'):
+            return
+        socket_path = os.path.join(temp_dir, 'jobs.sock')
+        server = file_cleaner.JobServer(logger=MagicMock())
+        thread = threading.Thread(target=server.serve_unix, args=(socket_path,))
+        thread.start()
+        while server.transport is None:
+            time.sleep(0.01)
+        self.make_files(data_dir, count=2)
+        response = file_cleaner.submit_job(job, socket_path=socket_path, timeout=10)
+        server.shutdown()
+        thread.join()
+        assert response['ok'] and response['result']['removed'] == 2
+
+    def test_http_refuses_unauthenticated_and_browser_requests(self, temp_dir):
+        """Test that HTTP jobs need the token, JSON content and no Origin, and cannot name other files"""
+        import threading
+        from http.client import HTTPConnection
+        data_dir = os.path.join(temp_dir, 'data')
+        self.make_files(data_dir)
+        body = json.dumps({'expression': os.path.join(data_dir, '*'), 'age': 0})
+
+        with pytest.raises(ValueError):
+            file_cleaner.JobServer(logger=MagicMock()).serve_http(0)
+        server = file_cleaner.JobServer(logger=MagicMock(), token='secret')
+        thread = threading.Thread(target=server.serve_http, args=(0,))
+        thread.start()
+        while server.transport is None:
+            time.sleep(0.01)
+        port = server.transport.server_address[1]
+
+        def post(headers, payload=body):
+            connection = HTTPConnection('127.0.0.1', port, timeout=10)
+            try:
+                connection.request('POST', '/', body=payload, headers=headers)
+                return connection.getresponse().status
+            finally:
+                connection.close()
+
+        authorized = {'Authorization': 'Bearer secret'}
+        try:
+            assert post({'Content-Type': 'application/json'}) == 401
+            assert post({'Content-Type': 'application/json', 'Authorization': 'Bearer wrong'}) == 401
+            assert post({**authorized, 'Content-Type': 'text/plain'}) == 415
+            assert post({**authorized, 'Content-Type': 'application/json', 'Origin': 'http://evil.example'}) == 403
+            assert len(os.listdir(data_dir)) == 3
+            for field in ('journal', 'archive_dir', 'report', 'source', 'fresh_cache'):
+                job = json.dumps({'expression': os.path.join(data_dir, '*'), 'age': 0,
+                                  field: os.path.join(temp_dir, 'out')})
+                assert post({**authorized, 'Content-Type': 'application/json'}, job) == 400
+            assert not os.path.exists(os.path.join(temp_dir, 'out'))
+            assert post({**authorized, 'Content-Type': 'application/json; charset=utf-8'}) == 200
+            assert os.listdir(data_dir) == []
+        finally:
+            server.shutdown()
+            thread.join()
+
+    def test_token_file_created_owner_only(self, temp_dir):
+        """Test that a missing token file is created with a random owner-only token and then reused"""
+        path = os.path.join(temp_dir, 'server.token')
+        token = file_cleaner.load_token(path)
+        assert len(token) >= 32
+        assert file_cleaner.load_token(path) == token
+        if os.name == 'posix':
+            assert os.stat(path).st_mode & 0o777 == 0o600
+
+
+class TestAppBuild:
+    """Tests for the incremental executable build in app_build.py"""
+
+    @pytest.fixture
+    def app_build(self, temp_dir, monkeypatch):
+        """Point app_build at a scratch source tree and replace PyInstaller with a recorder"""
+        import app_build
+        root = os.path.join(temp_dir, 'src')
+        os.makedirs(os.path.join(root, 'imgs'))
+        for name, content in ((app_build.SCRIPT_NAME, 'print("v1")'), (app_build.YEAR_FILE, '2025'),
+                              (os.path.join('imgs', 'ACG.ico'), 'icon')):
+            with open(os.path.join(root, name), 'w', encoding='utf-8') as handle:
+                handle.write(content)
+        monkeypatch.setattr(app_build, 'ROOT_DIR', root)
+        monkeypatch.setattr(app_build, 'ICON_PATH', os.path.join(root, 'imgs', 'ACG.ico'))
+        monkeypatch.setattr(app_build, 'DIST_PATH', os.path.join(temp_dir, 'dist'))
+        monkeypatch.setattr(app_build, 'WORK_PATH', os.path.join(temp_dir, 'build'))
+        monkeypatch.setattr(app_build, 'builds', [], raising=False)
+
+        def build_variants(variants, jobs, clean):
+            os.makedirs(app_build.DIST_PATH, exist_ok=True)
+            for variant in variants:
+                open(app_build.executable_path(variant), 'w').close()
+            app_build.builds.append((list(variants), clean))
+            return {variant: None for variant in variants}
+
+        monkeypatch.setattr(app_build, 'build_variants', build_variants)
+        return app_build
+
+    @staticmethod
+    def run(app_build, *args):
+        with patch.object(sys, 'argv', ['app_build.py', *args]):
+            assert app_build.main() == 0
+
+    @staticmethod
+    def build_number(app_build):
+        with open(os.path.join(app_build.ROOT_DIR, app_build.BUILD_FILE), encoding='utf-8') as handle:
+            return int(handle.read())
+
+    def test_unchanged_inputs_skip_build(self, app_build):
+        """Test that a second run with the same inputs builds nothing and keeps the build number"""
+        self.run(app_build)
+        assert app_build.builds == [(['release'], False)]
+        assert self.build_number(app_build) == 1
+
+        self.run(app_build)
+        assert len(app_build.builds) == 1
+        assert self.build_number(app_build) == 1
+
+    def test_changed_source_rebuilds(self, app_build):
+        """Test that editing a source file rebuilds and bumps the build number"""
+        self.run(app_build)
+        with open(os.path.join(app_build.ROOT_DIR, app_build.SCRIPT_NAME), 'w', encoding='utf-8') as handle:
+            handle.write('print("v2")')
+        self.run(app_build)
+        assert app_build.builds == [(['release'], False), (['release'], False)]
+        assert self.build_number(app_build) == 2
+
+    def test_other_variant_rebuilds_only_that_variant(self, app_build):
+        """Test that a variant not built before is built while an up-to-date one is skipped"""
+        self.run(app_build)
+        self.run(app_build, '--variant=release', '--variant=debug')
+        assert app_build.builds[-1] == (['debug'], False)
+        assert self.build_number(app_build) == 2
+
+    def test_missing_executable_rebuilds(self, app_build):
+        """Test that a deleted executable is rebuilt even though the inputs are unchanged"""
+        self.run(app_build)
+        os.remove(app_build.executable_path('release'))
+        self.run(app_build)
+        assert len(app_build.builds) == 2
+
+    def test_force_rebuilds_clean(self, app_build):
+        """Test that --force rebuilds unchanged inputs and asks PyInstaller for a clean build"""
+        self.run(app_build)
+        self.run(app_build, '--force')
+        assert app_build.builds[-1] == (['release'], True)
+
+        app_build.write_spec_file('release')
+        for clean in (False, True):
+            with patch('subprocess.run') as run:
+                app_build.build_executable('release', clean=clean)
+            command = run.call_args[0][0]
+            assert command[:2] == ['pyinstaller', app_build.spec_path('release')]
+            assert ('--clean' in command) is clean
+
+
 class TestIntegration:
     """Integration tests"""
 